@@ -0,0 +1,37 @@
+"""Benchmark EPG indexing on synthetic XMLTV guides.
+
+Run with: python python/benchmarks/bench_epg_index.py
+The time per programme should stay flat as the guide grows (linear scaling).
+"""
+import time
+import xml.etree.ElementTree as ET
+
+from synthetic import make_xmltv, synthetic_channel_ids
+from epg import index_epg_tree
+
+CHANNEL_COUNT = 100
+PROGRAMME_COUNTS = [12_500, 25_000, 50_000, 100_000]
+
+
+def bench(programme_count):
+    xml_content = make_xmltv(programme_count, CHANNEL_COUNT)
+    root = ET.fromstring(xml_content)
+    wanted_ids = synthetic_channel_ids(CHANNEL_COUNT)
+
+    started = time.perf_counter()
+    epg_data_map = index_epg_tree(root, wanted_ids)
+    elapsed = time.perf_counter() - started
+
+    kept = sum(len(programs) for programs in epg_data_map.values())
+    return elapsed, kept
+
+
+def main():
+    print(f"{'programmes':>10} {'kept':>8} {'seconds':>9} {'us/programme':>13}")
+    for programme_count in PROGRAMME_COUNTS:
+        elapsed, kept = bench(programme_count)
+        print(f"{programme_count:>10} {kept:>8} {elapsed:>9.3f} {elapsed / programme_count * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
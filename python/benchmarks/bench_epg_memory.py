@@ -0,0 +1,73 @@
+"""Compare peak memory of the in-memory and streaming EPG ingestion paths.
+
+Run with: python python/benchmarks/bench_epg_memory.py
+Each measurement runs in a fresh process (exec'd, not forked) and reports
+that process's VmHWM: ru_maxrss would include the parent's peak on Linux.
+The streaming path should stay flat while the guide grows; the legacy path
+(read everything, gunzip everything, ET.fromstring) grows with it. Both
+index with the cyclic GC paused (see epg.gc_paused); "gc" repeats the
+streaming case with the collector left running, for comparison.
+"""
+import contextlib
+import gzip
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+from synthetic import peak_rss_mb, write_xmltv_gz, synthetic_channel_ids
+import epg
+from epg import index_epg_stream, index_epg_tree
+
+PROGRAMMES_PER_CHANNEL = 100
+WANTED_CHANNELS = 10  # Our channels inside a much bigger multi-provider feed
+PROGRAMME_COUNTS = [25_000, 100_000, 400_000]
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_file_chunks(path):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def run_case(mode, path, programme_count):
+    wanted_ids = synthetic_channel_ids(WANTED_CHANNELS)
+    if mode == 'gc':
+        epg.gc_paused = contextlib.nullcontext  # The collector keeps running while indexing
+    started = time.perf_counter()
+    if mode in ('stream', 'gc'):
+        epg_data_map = index_epg_stream(iter_file_chunks(path), wanted_ids)
+    else:
+        with open(path, 'rb') as f:
+            compressed = f.read()
+        with gzip.GzipFile(fileobj=io.BytesIO(compressed)) as f:
+            xml_content = f.read()
+        epg_data_map = index_epg_tree(ET.fromstring(xml_content), wanted_ids)
+    elapsed = time.perf_counter() - started
+    kept = sum(len(programs) for programs in epg_data_map.values())
+    print(f"{mode:>7} {programme_count:>10} {kept:>6} {elapsed:>9.3f} {peak_rss_mb():>11.1f}")
+
+
+def main():
+    if len(sys.argv) == 4:
+        run_case(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+        return
+
+    print(f"{'mode':>7} {'programmes':>10} {'kept':>6} {'seconds':>9} {'peak RSS MB':>11}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for programme_count in PROGRAMME_COUNTS:
+            path = os.path.join(tmp_dir, f"guide-{programme_count}.xml.gz")
+            write_xmltv_gz(path, programme_count, channel_count=programme_count // PROGRAMMES_PER_CHANNEL)
+            for mode in ('legacy', 'stream', 'gc'):
+                subprocess.run([sys.executable, os.path.abspath(__file__), mode, path, str(programme_count)], check=True)
+
+
+if __name__ == "__main__":
+    main()
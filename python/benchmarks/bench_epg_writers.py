@@ -0,0 +1,148 @@
+"""Compare the in-memory and streaming EPG writers.
+
+Run with: python python/benchmarks/bench_epg_writers.py
+For each guide size the programme index is built first. Then both output
+paths write rakuten_epg.xml and rakuten_epg.json into a temporary directory.
+The legacy path is ElementTree plus json.dump(indent=4) of a full copy, the
+way the scraper wrote them before the streaming writers; its functions are
+kept here as the reference. Time and tracemalloc peak are measured for the
+output step only, and the two paths must produce identical bytes.
+"""
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from synthetic import make_xmltv, synthetic_channel_ids
+from epg import index_epg_stream, iter_epg_json, iter_epg_xml
+from output import OutputWriter, iter_gzip
+
+CHANNEL_COUNT = 100
+PROGRAMME_COUNTS = [10_000, 40_000, 160_000]
+
+
+# methods
+def create_epg_xml(channels_data, epg_data_map):
+    root = ET.Element("tv")
+
+    for channel_info in channels_data:
+        station = channel_info
+        channel = ET.SubElement(root, "channel", id=str(station.get("tvg_id")))
+        display_name = ET.SubElement(channel, "display-name")
+        display_name.text = station.get("name", "Unknown Title")
+
+        icon = ET.SubElement(channel, "icon", src=station.get("logo_url"))
+
+        channel_epg_id = station.get("tvg_id")
+        if channel_epg_id in epg_data_map:
+            for program in epg_data_map[channel_epg_id]:
+                programme = ET.SubElement(root, "programme", channel=str(station.get("tvg_id")))
+
+                start_time = program.get("start_time", "")
+                stop_time = program.get("stop_time", "")
+
+                programme.set("start", start_time)
+                programme.set("stop", stop_time)
+
+                title = ET.SubElement(programme, "title")
+                title.text = program.get("title", "")
+
+                if program.get("description"):
+                    desc = ET.SubElement(programme, "desc")
+                    desc.text = program.get("description", "")
+
+                program_icon_src = program.get("icon")  # Get program icon src from epg_data_map
+                if program_icon_src:  # Add icon only if src exists
+                    icon_element = ET.SubElement(programme, "icon", src=program_icon_src)
+
+
+    tree = ET.ElementTree(root)
+    return tree
+
+
+def create_epg_json_data(channels_data, epg_data_map):
+    epg_json = {"channels": []}  # Estructura JSON principal
+
+    for channel_info in channels_data:
+        channel_epg_data = {
+            "tvg_id": channel_info.get("tvg_id"),
+            "name": channel_info.get("name"),
+            "logo_url": channel_info.get("logo_url"),
+            "programs": []
+        }
+
+        channel_epg_id = channel_info.get("tvg_id")
+        if channel_epg_id in epg_data_map:
+            for program in epg_data_map[channel_epg_id]:
+                program_data = {
+                    "start_time": program.get("start_time"),
+                    "stop_time": program.get("stop_time"),
+                    "title": program.get("title"),
+                    "description": program.get("description"),
+                    "icon": program.get("icon")
+                }
+                channel_epg_data["programs"].append(program_data)
+        epg_json["channels"].append(channel_epg_data)
+
+    return epg_json
+
+
+def legacy_write(channels_data, epg_data_map, directory):
+    tree = create_epg_xml(channels_data, epg_data_map)
+    buffer = io.BytesIO()
+    tree.write(buffer, encoding='utf-8', xml_declaration=True)
+    with open(os.path.join(directory, "rakuten_epg.xml"), 'wb') as f:
+        f.write(buffer.getvalue())
+    epg_json_data = create_epg_json_data(channels_data, epg_data_map)
+    with open(os.path.join(directory, "rakuten_epg.json"), 'w', encoding='utf-8') as f:
+        f.write(json.dumps(epg_json_data, indent=4, ensure_ascii=False))
+
+
+def stream_write(channels_data, epg_data_map, directory, gzip_variants=False):
+    writer = OutputWriter(directory)
+    writer.write_stream("rakuten_epg.xml", iter_epg_xml(channels_data, epg_data_map))
+    writer.write_stream("rakuten_epg.json", iter_epg_json(channels_data, epg_data_map))
+    if gzip_variants:
+        writer.write_stream("rakuten_epg.xml.gz", iter_gzip(iter_epg_xml(channels_data, epg_data_map)))
+        writer.write_stream("rakuten_epg.json.gz", iter_gzip(iter_epg_json(channels_data, epg_data_map, compact=True)))
+
+
+def measure(write, *args):
+    started = time.perf_counter()
+    write(*args)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    write(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def read(directory, filename):
+    with open(os.path.join(directory, filename), 'rb') as f:
+        return f.read()
+
+
+def main():
+    channels_data = [{"tvg_id": channel_id, "name": channel_id, "logo_url": ""} for channel_id in synthetic_channel_ids(CHANNEL_COUNT)]
+    print(f"{'programmes':>10} {'path':>12} {'seconds':>8} {'peak MB':>8} {'xml MB':>7}")
+    for programme_count in PROGRAMME_COUNTS:
+        epg_data_map = index_epg_stream([make_xmltv(programme_count, CHANNEL_COUNT)], synthetic_channel_ids(CHANNEL_COUNT))
+        with tempfile.TemporaryDirectory() as legacy_dir, tempfile.TemporaryDirectory() as stream_dir:
+            rows = [
+                ("legacy", measure(legacy_write, channels_data, epg_data_map, legacy_dir)),
+                ("stream", measure(stream_write, channels_data, epg_data_map, stream_dir)),
+                ("stream+gzip", measure(stream_write, channels_data, epg_data_map, stream_dir, True)),
+            ]
+            for filename in ("rakuten_epg.xml", "rakuten_epg.json"):
+                assert read(legacy_dir, filename) == read(stream_dir, filename), f"{filename} differs"
+            xml_size = os.path.getsize(os.path.join(stream_dir, "rakuten_epg.xml"))
+        for name, (elapsed, peak) in rows:
+            print(f"{programme_count:>10} {name:>12} {elapsed:>8.3f} {peak / 1e6:>8.1f} {xml_size / 1e6:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
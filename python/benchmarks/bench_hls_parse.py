@@ -0,0 +1,97 @@
+"""Parsing throughput of the HLS master-playlist parser over the stored corpus.
+
+Run with: python python/benchmarks/bench_hls_parse.py
+Parses every master/*/master.m3u8 in the repository ROUNDS times with the
+legacy comma-splitting parser and with hls.parse_master_playlist, and checks
+that serializing and re-parsing gives the same playlist back, also when the
+playlist comes back from the HTTP cache's parsed JSON copy.
+"""
+import glob
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urljoin
+
+from synthetic import PYTHON_DIRECTORY, load_scraper
+from stub_server import StubHTTPServer
+from hls import parse_master_playlist, serialize_master_playlist
+from http_cache import HTTPCache
+from http_client import create_session
+
+ROUNDS = 50
+BASE_URL = "https://example.invalid/live/master.m3u8"
+# Attributes hls.py has no rule for keep the quoting the source used
+UNKNOWN_ATTRIBUTES_MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=1280000,RESOLUTION=1280x720,X-HDCP-PROFILE=TYPE-0,X-LABEL="720p, main",CODECS="avc1.4d401f,mp4a.40.2"
+https://example.invalid/live/720p.m3u8
+"""
+
+
+def legacy_parse(m3u8_content, base_url):
+    """The comma-splitting parser fetch_m3u8_qualities used before hls.py."""
+    qualities = []
+    lines = m3u8_content.splitlines()
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith('#EXT-X-STREAM-INF') and i + 1 < len(lines):
+            attributes = {}
+            for attribute in line[len('#EXT-X-STREAM-INF:'):].split(','):
+                if '=' in attribute:
+                    key, value = attribute.split('=', 1)
+                    attributes[key] = value.strip('"')
+            qualities.append({"url": urljoin(base_url, lines[i + 1]), "attributes": attributes})
+            i += 1
+        i += 1
+    return qualities
+
+
+def time_parser(parse, corpus):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for content in corpus:
+            parse(content, BASE_URL)
+    return time.perf_counter() - started
+
+
+def check_cached_round_trip():
+    """Serialize a master fetched fresh and then reused from the HTTP cache; both must match the source."""
+    scraper = load_scraper()
+    session = create_session()
+    with StubHTTPServer({"/master.m3u8": UNKNOWN_ATTRIBUTES_MASTER}) as stub, tempfile.TemporaryDirectory() as cache_directory:
+        for attempt in ("fresh", "cached"):
+            cache = HTTPCache(cache_directory)  # A new instance reads the parsed copy back from disk
+            master = scraper.fetch_master_playlist(stub.url("/master.m3u8"), session, cache)
+            cache.save()
+            assert serialize_master_playlist(master) == UNKNOWN_ATTRIBUTES_MASTER, f"{attempt} master re-quoted: {serialize_master_playlist(master)!r}"
+        assert cache.stats["not_modified"] == 1, cache.stats
+
+
+def main():
+    check_cached_round_trip()
+    paths = sorted(glob.glob(os.path.join(os.path.dirname(PYTHON_DIRECTORY), "master", "*", "master.m3u8")))
+    corpus = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            corpus.append(f.read())
+    if not corpus:
+        sys.exit("No master playlists found under master/")
+    corpus_bytes = sum(len(content.encode('utf-8')) for content in corpus)
+    variant_count = sum(len(parse_master_playlist(content, BASE_URL).variants) for content in corpus)
+
+    for content in corpus:
+        parsed = parse_master_playlist(content, BASE_URL)
+        assert parse_master_playlist(serialize_master_playlist(parsed), BASE_URL) == parsed, "round trip changed the playlist"
+
+    print(f"corpus: {len(corpus)} playlists, {variant_count} variants, {corpus_bytes / 1024:.1f} KiB, {ROUNDS} rounds")
+    for name, parse in (("legacy", legacy_parse), ("hls", parse_master_playlist)):
+        elapsed = time_parser(parse, corpus)
+        playlists_per_second = len(corpus) * ROUNDS / elapsed
+        megabytes_per_second = corpus_bytes * ROUNDS / elapsed / 1e6
+        print(f"{name:>7} {elapsed:7.3f}s {playlists_per_second:10.0f} playlists/s {megabytes_per_second:7.1f} MB/s")
+    print("round trip ok (also through the HTTP cache)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Benchmark a cold run against an unchanged warm run through the HTTP cache.
+
+Run with: python python/benchmarks/bench_http_cache.py
+A stub server with ETag support serves the W3U playlist, a gzipped guide and
+CHANNEL_COUNT master playlists. The warm run should transfer no bodies and
+reuse every parsed result from the first run.
+"""
+import gzip
+import json
+import tempfile
+import time
+
+from synthetic import load_scraper, make_master_playlist, make_xmltv, synthetic_channel_ids
+from stub_server import StubHTTPServer
+from http_cache import HTTPCache
+from http_client import create_session
+
+CHANNEL_COUNT = 100
+PROGRAMME_COUNT = 20_000
+
+
+def make_w3u(master_url_for):
+    stations = [{"name": channel_id, "epgId": channel_id, "url": master_url_for(channel_id)}
+                for channel_id in synthetic_channel_ids(CHANNEL_COUNT)]
+    return json.dumps({"groups": [{"name": "Synthetic", "stations": stations}]})
+
+
+def run(scraper, stub, cache_directory):
+    session = create_session()
+    cache = HTTPCache(cache_directory)
+    bytes_before = stub.bytes_sent
+    started = time.process_time()
+
+    channels_data = scraper.fetch_w3u_playlist(stub.url("/playlist.w3u"), session, cache)
+    master_urls = [channel_info['stream_url'] for channel_info in channels_data]
+    scraper.fetch_all_master_playlists(master_urls, session, cache)
+    epg_data_map = scraper.fetch_epg_xml_data(stub.url("/guide.xml.gz"), channels_data, session, cache)
+
+    cpu = time.process_time() - started
+    cache.save()
+    print(f"cpu={cpu:6.3f}s bytes={stub.bytes_sent - bytes_before:>9} programmes={sum(map(len, epg_data_map.values())):>6}  {cache.report()}")
+
+
+def main():
+    scraper = load_scraper()
+    routes = {f"/{channel_id}/master.m3u8": make_master_playlist() for channel_id in synthetic_channel_ids(CHANNEL_COUNT)}
+    routes["/guide.xml.gz"] = gzip.compress(make_xmltv(PROGRAMME_COUNT, CHANNEL_COUNT))
+
+    with StubHTTPServer(routes) as stub, tempfile.TemporaryDirectory() as cache_directory:
+        routes["/playlist.w3u"] = make_w3u(lambda channel_id: stub.url(f"/{channel_id}/master.m3u8"))
+        stub.routes = routes
+        print("cold:", end=" ")
+        run(scraper, stub, cache_directory)
+        print("warm:", end=" ")
+        run(scraper, stub, cache_directory)
+
+
+if __name__ == "__main__":
+    main()
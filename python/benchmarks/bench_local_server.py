@@ -0,0 +1,125 @@
+"""Load-test the local playlist server.
+
+Run with: python python/benchmarks/bench_local_server.py
+A PlaylistServer is started on 127.0.0.1 with a 1,000-channel playlist and
+a synthetic EPG. Keep-alive clients on several threads then request
+different resources: a full playlist, a 304 revalidation, a gzipped EPG and
+an on-demand master. For the master, the upstream fetch takes 50 ms and the
+server reuses the result for its TTL. A client that sends a truncated body
+must just be disconnected. Latency percentiles are per request, measured on
+the client side. The clients share the server's process (and GIL), so the
+multi-client rows overstate server-side latency.
+"""
+import asyncio
+import gc
+import http.client
+import socket
+import statistics
+import threading
+import time
+
+from synthetic import make_channels_data, make_master_playlist, make_xmltv, synthetic_channel_ids
+from epg import index_epg_stream, iter_epg_xml
+from m3u import M3UPlaylist
+from server import PlaylistServer, Resource, content_type_for
+
+CLIENT_COUNTS = [1, 8]
+REQUESTS_PER_CLIENT = 500
+CHANNEL_COUNT = 1_000
+UPSTREAM_DELAY = 0.05
+
+
+def start_server(server):
+    loop = asyncio.new_event_loop()
+    address = loop.run_until_complete(server.start("127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    return loop, address
+
+
+def slow_master(tvg_id):
+    time.sleep(UPSTREAM_DELAY)  # Upstream round trip
+    return make_master_playlist(4)
+
+
+def client(port, path, headers, latencies):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    for _ in range(REQUESTS_PER_CLIENT):
+        started = time.perf_counter()
+        connection.request("GET", path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        assert response.status in (200, 304), response.status
+    connection.close()
+
+
+def load_test(port, path, headers, clients):
+    latencies = []
+    threads = [threading.Thread(target=client, args=(port, path, headers, latencies)) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return len(latencies) / elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99)]
+
+
+async def other_tasks():
+    return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+
+def main():
+    channels_data = make_channels_data(CHANNEL_COUNT)
+    playlist = M3UPlaylist(channels_data, "http://127.0.0.1/rakuten_epg.xml").render()
+    epg_data_map = index_epg_stream([make_xmltv(20_000, 100)], synthetic_channel_ids(100))
+    epg_xml = "".join(iter_epg_xml([{"tvg_id": tvg_id, "name": tvg_id, "logo_url": ""} for tvg_id in epg_data_map], epg_data_map))
+
+    server = PlaylistServer(slow_master, master_ttl=5)
+    playlist_resource = Resource(playlist, content_type_for(".m3u"))
+    server.publish({"/rakuten_playlist.m3u": playlist_resource,
+                    "/rakuten_epg.xml": Resource(epg_xml, content_type_for(".xml"))})
+    loop, (_, port) = start_server(server)
+
+    cases = [
+        ("playlist 200", "/rakuten_playlist.m3u", {}),
+        ("playlist 304", "/rakuten_playlist.m3u", {"If-None-Match": playlist_resource.etag}),
+        ("EPG gzip", "/rakuten_epg.xml", {"Accept-Encoding": "gzip"}),
+        ("master (TTL)", "/master/channel-0001/master.m3u8", {}),
+    ]
+    print(f"playlist {len(playlist_resource.body) / 2**20:.1f} MiB, {REQUESTS_PER_CLIENT} requests per keep-alive client")
+    print(f"{'case':<14} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for clients in CLIENT_COUNTS:
+        for name, path, headers in cases:
+            requests_per_second, p50, p99 = load_test(port, path, headers, clients)
+            print(f"{name:<14} {clients:>7} {requests_per_second:>8.0f} {p50 * 1e3:>8.3f} {p99 * 1e3:>8.3f}")
+    print(f"master upstream fetches: {server.stats['master_fetches']} for {server.stats['requests']} requests in total")
+
+    # A truncated request body ends the connection, not the handler task with an unretrieved exception
+    errors = []
+    loop.set_exception_handler(lambda loop, context: errors.append(context["message"]))
+    with socket.create_connection(("127.0.0.1", port)) as truncated:
+        truncated.sendall(b"POST /rakuten_playlist.m3u HTTP/1.1\r\nContent-Length: 100\r\n\r\npartial")
+        truncated.shutdown(socket.SHUT_WR)
+        assert truncated.recv(1024) == b"", "truncated request was answered"
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0.05), loop).result(timeout=5)
+    gc.collect()
+    assert not errors, errors
+
+    # Shutdown must not wait for keep-alive clients that sit idle between requests
+    idle = http.client.HTTPConnection("127.0.0.1", port)
+    idle.request("GET", "/rakuten_playlist.m3u", headers={"If-None-Match": playlist_resource.etag})
+    assert idle.getresponse().read() == b""
+    started = time.perf_counter()
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result(timeout=5)
+    pending = asyncio.run_coroutine_threadsafe(other_tasks(), loop).result(timeout=5)
+    assert not pending, f"Connection handlers left running after close(): {pending}"
+    print(f"close() with an idle keep-alive client: {(time.perf_counter() - started) * 1e3:.1f} ms")
+    idle.close()
+    loop.call_soon_threadsafe(loop.stop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark the M3U playlist builder.
+
+Run with: python python/benchmarks/bench_m3u_playlist.py
+The legacy builder (repeated `playlist += ...`) is compared with M3UPlaylist
+at growing channel counts up to 10k; both must produce identical text. Then
+several tailored playlists are rendered from the same prepared channel list.
+Finally the stitched channels of the real W3U, which share one master
+playlist URL up to their ads.* parameters, must all keep their own entry
+and channel-selecting parameters in every tailored playlist.
+"""
+import os
+import time
+
+from synthetic import PYTHON_DIRECTORY, load_scraper, make_channels_data
+from m3u import M3UPlaylist, strip_ad_parameters
+
+CHANNEL_COUNTS = [1_000, 5_000, 10_000]
+EPG_URL = "https://example.invalid/rakuten_epg.xml"
+STITCHED_W3U = os.path.join(PYTHON_DIRECTORY, "benchmarks", "fixtures", "stitched.w3u")
+CHANNEL_PARAMETERS = ("ads.caid=", "ads.rakuten_rtv_content_id=", "ads.xumo_channelId=")
+TAILORED = {
+    "no ads": {"strip_ads": True},
+    "spa only": {"language": "spa"},
+    "Series, 720p cap": {"group": "Series", "max_height": 720},
+    "no ads, 360p cap": {"strip_ads": True, "max_height": 360},
+}
+
+
+def legacy_playlist(channels_data):
+    playlist = f"#EXTM3U url-tvg=\"{EPG_URL}\"\n"
+    seen_urls = set()
+    for channel_info in channels_data:
+        channel_name = channel_info['name']
+        stream_url = channel_info['stream_url']
+        backup_master_url = channel_info['backup_master_url']
+        tvg_id = channel_info['tvg_id']
+        logo_url = channel_info['logo_url']
+        group_title = channel_info['group_title']
+        if stream_url and stream_url not in seen_urls and stream_url != "# no_url":
+            playlist += f'#EXTINF:-1 tvg-id="{tvg_id}" tvg-logo="{logo_url}" group-title="{group_title}",{channel_name} (Original)\n{stream_url}\n'
+            seen_urls.add(stream_url)
+        if backup_master_url and backup_master_url not in seen_urls and backup_master_url != "# no_url":
+            playlist += f'#EXTINF:-1 tvg-id="{tvg_id}" tvg-logo="{logo_url}" group-title="{group_title}",{channel_name} (Backup)\n{backup_master_url}\n'
+            seen_urls.add(backup_master_url)
+    return playlist
+
+
+def check_stitched_channels():
+    """Channels told apart only by query parameters keep one entry each, and their selecting parameters."""
+    channels_data = load_scraper().fetch_w3u_playlist(STITCHED_W3U)
+    playlist = M3UPlaylist(channels_data, EPG_URL)
+    for name, options in TAILORED.items():
+        if options.get("language") or options.get("group"):
+            continue  # Subsets by design
+        urls = [line for line in playlist.render(**options).splitlines() if line.startswith("http")]
+        assert len(urls) == len(channels_data), f"{name}: {len(urls)} of {len(channels_data)} stitched channels kept"
+        for url, channel_info in zip(urls, channels_data):
+            assert url == (strip_ad_parameters(channel_info["stream_url"]) if options.get("strip_ads") else channel_info["stream_url"])
+            query = channel_info["stream_url"].partition("?")[2].split("&")
+            assert all(pair in url.partition("?")[2].split("&") for pair in query if pair.startswith(CHANNEL_PARAMETERS)), url
+        print(f"  {name:<18} {len(urls)} stitched channels, {sum(map(len, urls)) / len(urls):.0f} bytes per URL")
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def main():
+    print(f"{'channels':>9} {'legacy s':>9} {'prepare s':>10} {'render s':>9} {'channels/s':>11} {'MiB':>6}")
+    for channel_count in CHANNEL_COUNTS:
+        channels_data = make_channels_data(channel_count)
+        legacy_seconds, legacy_text = timed(lambda: legacy_playlist(channels_data))
+        prepare_seconds, playlist = timed(lambda: M3UPlaylist(channels_data, EPG_URL))
+        render_seconds, text = timed(playlist.render)
+        assert text == legacy_text
+        print(f"{channel_count:>9} {legacy_seconds:>9.3f} {prepare_seconds:>10.3f} {render_seconds:>9.3f} "
+              f"{channel_count / (prepare_seconds + render_seconds):>11.0f} {len(text.encode('utf-8')) / 2**20:>6.1f}")
+
+    print(f"\nTailored playlists from the same {channel_count} prepared channels:")
+    for name, options in TAILORED.items():
+        seconds, text = timed(lambda: playlist.render(**options))
+        print(f"  {name:<18} {seconds:.3f}s  {len(text.encode('utf-8')) / 2**20:.2f} MiB  {text.count('#EXTINF')} entries")
+
+    print("\nStitched channels of the real W3U (one master URL, told apart by ads.* parameters):")
+    check_stitched_channels()
+
+
+if __name__ == "__main__":
+    main()
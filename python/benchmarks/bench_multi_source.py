@@ -0,0 +1,150 @@
+"""Multi-source ingestion: fixture merge check and parallel wall time.
+
+Run with: python python/benchmarks/bench_multi_source.py
+First the two fixture markets in fixtures/providers/ are loaded and merged,
+and a run with a third, unreachable source must keep that source's files.
+Daemon EPG refreshes must prune the guide and the shards of past days, also
+while the guides cannot be fetched.
+Channels listed by an earlier source are dropped by tvg_id and by stream,
+while channels that only share a stitched endpoint's path all survive, and
+the guides are merged by source priority. Then SOURCE_COUNT stub providers, each answering after
+LATENCY seconds, are ingested both one after the other and through the
+pipeline. The pipeline's wall time should be close to the slowest source,
+not to the sum of all of them.
+"""
+import os
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+
+from synthetic import PYTHON_DIRECTORY, load_scraper, make_xmltv, synthetic_channel_ids
+from stub_server import StubHTTPServer
+from http_cache import HTTPCache
+from http_client import create_session
+from output import OutputWriter
+from providers import Source, load_sources
+
+FIXTURE_SOURCES = os.path.join(PYTHON_DIRECTORY, "benchmarks", "fixtures", "providers", "sources.json")
+FIXTURE_NOW = datetime(2025, 1, 1, tzinfo=timezone.utc)
+SOURCE_COUNT = 4
+CHANNELS_PER_SOURCE = 50
+LATENCY = 0.5  # Seconds per response
+
+
+def check_fixtures(scraper):
+    scraper.SOURCES = load_sources(environ={"RAKUTEN_SOURCES": FIXTURE_SOURCES})
+    state = scraper.ScrapeState(create_session(), None)
+    scraper.load_channels(state)
+    scraper.load_epg(state, FIXTURE_NOW)
+
+    print("fixture channels:")
+    for channel_info in state.channels_data:
+        print(f"  {channel_info['tvg_id']:<12} from {channel_info['source']}")
+    print("cine-uno guide:")
+    for program in state.epg_data_map["cine-uno"]:
+        print(f"  {program['start_time']} - {program['stop_time']}  {program['title']}")
+
+    # stitched-* share one endpoint path and differ in their ads.* parameters; stitched-retro-it is
+    # stitched-retro in another session, notizie is noticias-24 in another session
+    assert [channel_info['tvg_id'] for channel_info in state.channels_data] == [
+        "cine-uno", "noticias-24", "stitched-hits", "stitched-retro", "cucina", "stitched-jazz"]
+    assert [program['title'] for program in state.epg_data_map["cine-uno"]] == [
+        "Película de medianoche", "Film della notte (fills the ES gap)", "Película del alba"]
+
+
+def check_unreachable_source(scraper):
+    """A source that is down must neither stop the others nor get its per-channel files pruned."""
+    fixture_directory = os.path.dirname(FIXTURE_SOURCES)
+    scraper.SOURCES = load_sources(environ={"RAKUTEN_SOURCES": FIXTURE_SOURCES}) + [
+        Source("fixture-down", os.path.join(fixture_directory, "missing.w3u"))]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scraper.output_writer = OutputWriter(tmp_dir)
+        scraper.METRICS_DIRECTORY = tmp_dir
+        kept_file = os.path.join(tmp_dir, "json", "down-channel-down-channel.json")  # From a run when the source was up
+        os.makedirs(os.path.dirname(kept_file))
+        with open(kept_file, "w", encoding="utf-8") as f:
+            f.write("{}")
+
+        state = scraper.ScrapeState(create_session(retries=0), HTTPCache(os.path.join(tmp_dir, ".cache")))
+        assert scraper.load_channels(state)
+        assert state.failed_sources == ["fixture-down"]
+        scraper.rebuild_all(state, FIXTURE_NOW)
+        assert os.path.exists(kept_file), "per-channel file of the unavailable source was pruned"
+        assert os.path.exists(os.path.join(tmp_dir, "json", "cineuno-cine-uno.json"))
+    print("unreachable source: other sources written, its per-channel files kept")
+
+
+def check_daemon_epg_refresh(scraper):
+    """Later EPG refreshes prune finished programmes and past days' shards, even with the guides unavailable."""
+    fixture_sources = load_sources(environ={"RAKUTEN_SOURCES": FIXTURE_SOURCES})
+    scraper.SOURCES = fixture_sources
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scraper.output_writer = OutputWriter(tmp_dir)
+        scraper.METRICS_DIRECTORY = tmp_dir
+        day_shard = os.path.join(tmp_dir, "epg_shards", "cine-uno", "2025-01-01.json")
+        state = scraper.ScrapeState(create_session(retries=0), HTTPCache(os.path.join(tmp_dir, ".cache")))
+        assert scraper.load_channels(state)
+        scraper.rebuild_all(state, FIXTURE_NOW)
+        assert os.path.exists(day_shard)
+
+        # Guides down: the programmes we have are kept, minus those that have finished
+        scraper.SOURCES = [Source(source.name, source.w3u_url, os.path.join(tmp_dir, "missing.xml")) for source in fixture_sources]
+        assert scraper.refresh_epg_outputs(state, FIXTURE_NOW + timedelta(hours=5))
+        assert [program['title'] for program in state.epg_data_map["cine-uno"]] == ["Película del alba"]
+        assert os.path.exists(day_shard)
+
+        # Next day: the whole guide is over and so is its day shard
+        assert scraper.refresh_epg_outputs(state, FIXTURE_NOW + timedelta(days=1))
+        assert not any(state.epg_data_map.values())
+        assert not os.path.exists(day_shard), "shard of a past day was kept"
+        assert os.path.exists(os.path.join(tmp_dir, "epg_shards", "cine-uno", "now.json"))
+    print("daemon EPG refresh: finished programmes and past days' shards pruned")
+
+
+def make_w3u(source_index):
+    stations = ",".join(
+        f'{{"name": "{tvg_id}", "epgId": "{tvg_id}", "image": "", '
+        f'"url": "https://cdn.example.invalid/{source_index}/{tvg_id}/master.m3u8"}}'
+        for tvg_id in synthetic_channel_ids(CHANNELS_PER_SOURCE))
+    return f'{{"groups": [{{"name": "Source {source_index}", "stations": [{stations}]}}]}}'
+
+
+def main():
+    scraper = load_scraper()
+    check_fixtures(scraper)
+    check_unreachable_source(scraper)
+    check_daemon_epg_refresh(scraper)
+
+    with ExitStack() as stack:
+        sources = []
+        for index in range(SOURCE_COUNT):
+            stub = stack.enter_context(StubHTTPServer(
+                {"/playlist.w3u": make_w3u(index), "/guide.xml": make_xmltv(5_000, CHANNELS_PER_SOURCE)},
+                latency=LATENCY))
+            sources.append(Source(f"stub-{index}", stub.url("/playlist.w3u"), stub.url("/guide.xml")))
+        now = datetime.now(timezone.utc)
+
+        started = time.perf_counter()
+        session = create_session()
+        for source in sources:
+            channels_data = scraper.fetch_w3u_playlist(source.w3u_url, session)
+            scraper.fetch_epg_xml_data(source.epg_url, channels_data, session, now=now)
+        sequential_elapsed = time.perf_counter() - started
+
+        scraper.SOURCES = sources
+        state = scraper.ScrapeState(create_session(), None)
+        started = time.perf_counter()
+        scraper.load_channels(state)
+        scraper.load_epg(state, now)
+        parallel_elapsed = time.perf_counter() - started
+
+    print(f"\nsources={SOURCE_COUNT} latency={LATENCY}s per request (W3U + EPG per source)")
+    print(f"one after another  {sequential_elapsed:6.2f}s")
+    print(f"parallel           {parallel_elapsed:6.2f}s  (slowest single source ~{2 * LATENCY:.2f}s)")
+    print(f"merged: {len(state.channels_data)} channels, "
+          f"{sum(len(programs) for programs in state.epg_data_map.values())} programmes")
+
+
+if __name__ == "__main__":
+    main()
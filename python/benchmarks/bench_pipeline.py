@@ -0,0 +1,182 @@
+"""Benchmark the whole scraper offline, stage by stage, at growing scale.
+
+Run with: python python/benchmarks/bench_pipeline.py [--scales 1,10,100]
+For every scale a synthetic corpus is written (1x is SCALE_CHANNELS channels,
+about today's lineup) and replayed from a local stub server; see replay.py.
+With --corpus a recorded corpus is replayed instead. The pipeline runs the
+stages of a normal run in a fresh process: the W3U, masters and EPG fetches,
+every writer, then the stale-file pruning and report. For each stage it
+reports the wall time, the process's peak RSS so far and the bytes written.
+--report saves the results as JSON; --baseline compares them with a saved
+report and exits with status 1 when a stage got slower than --tolerance
+times its baseline. Before that, a corpus holding channels that share a
+stitched endpoint's path must replay each channel's own master playlist.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from replay import Corpus, rewrite_url, synthesize
+from synthetic import load_scraper, peak_rss_mb
+from http_cache import HTTPCache
+from http_client import create_session
+from output import OutputWriter
+
+SCALE_CHANNELS = 100  # Channels at 1x (the real playlist has ~95)
+DEFAULT_SCALES = "1,10,100"
+MIN_COMPARED_SECONDS = 0.05  # Faster stages are too noisy to flag
+
+
+# methods
+def run_pipeline(corpus_directory, base_url, output_directory):
+    """Run every stage of one scrape against the stub at `base_url`; returns the per-stage measurements."""
+    corpus = Corpus.load(corpus_directory)
+    os.environ["RAKUTEN_SOURCES"] = json.dumps(corpus.replay_sources(base_url))
+    os.environ["RAKUTEN_CACHE_DIR"] = os.path.join(output_directory, ".cache")
+    os.environ["RAKUTEN_SNAPSHOT"] = "1"  # Opt-in output, but part of what is measured
+    scraper = load_scraper()
+    writer = scraper.output_writer = OutputWriter(output_directory)
+    state = scraper.ScrapeState(create_session(), HTTPCache(scraper.CACHE_DIRECTORY))
+    now = corpus.recorded_at  # Guide times are only "current" as of the capture
+    stages = [
+        ("w3u", lambda: scraper.load_channels(state)),
+        ("masters", lambda: scraper.load_masters(state)),
+        ("write.masters", lambda: scraper.save_master_outputs(state)),
+        ("epg", lambda: scraper.load_epg(state, now)),
+        ("write.epg", lambda: scraper.save_epg_outputs(state)),
+        ("write.channels", lambda: scraper.save_channel_outputs(state)),
+        ("write.snapshot", lambda: scraper.save_snapshot(state.channels_data, state.epg_data_map, scraper.OUTPUT_FILENAME_SNAPSHOT)),
+        ("finish", lambda: scraper.finish_refresh(state, prune_stale=True)),
+    ]
+    results = []
+    for name, stage in stages:
+        bytes_written = writer.stats["bytes_written"]
+        started = time.perf_counter()
+        stage()
+        results.append({
+            "stage": name,
+            "seconds": round(time.perf_counter() - started, 4),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "bytes_written": writer.stats["bytes_written"] - bytes_written,
+        })
+    return {
+        "channels": len(state.channels_data),
+        "programmes": sum(len(programs) for programs in state.epg_data_map.values()),
+        "stages": results,
+    }
+
+
+def check_stitched_replay():
+    """Recordings keyed on path alone served one master for every channel of a stitched endpoint."""
+    stitched_url = "https://stitched.example.invalid/v1/master/prod-stitched/master.m3u8"
+    with tempfile.TemporaryDirectory() as corpus_directory:
+        corpus = Corpus(corpus_directory)
+        for caid in ("Hits", "Retro"):
+            corpus.add(f"{stitched_url}?ads.caid={caid}&ads.rakuten_streaming_id=recorded-{caid}", f"#EXTM3U\n# {caid}\n")
+        with corpus.serve() as stub:
+            for caid in ("Hits", "Retro"):  # A new session on replay: other streaming ids
+                url = rewrite_url(f"{stitched_url}?ads.caid={caid}&ads.rakuten_streaming_id=replayed", stub.base_url)
+                assert requests.get(url, timeout=5).text == f"#EXTM3U\n# {caid}\n", f"{caid}: wrong master replayed"
+    print("stitched channels replay their own master playlists")
+
+
+def replay(corpus_directory, latency, failure_rate):
+    """Serve the corpus and run the pipeline against it in a fresh process."""
+    corpus = Corpus.load(corpus_directory)
+    output_directory = tempfile.mkdtemp(prefix="bench-pipeline-")
+    try:
+        with corpus.serve(latency, failure_rate) as stub:
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", corpus_directory,
+                                        stub.base_url, output_directory], check=True, stdout=subprocess.PIPE, text=True)
+        result = json.loads(completed.stdout.splitlines()[-1])
+        result.update(requests=stub.request_count, failures=stub.failure_count, bytes_served=stub.bytes_sent)
+        return result
+    finally:
+        shutil.rmtree(output_directory, ignore_errors=True)
+
+
+def print_run(label, result):
+    print(f"\n{label}: {result['channels']} channels, {result['programmes']} programmes, "
+          f"{result['requests']} requests ({result['failures']} failed), {result['bytes_served'] / 1024:.0f} KiB served")
+    print(f"  {'stage':<15} {'seconds':>9} {'peak RSS MB':>11} {'KiB written':>11}")
+    for stage in result["stages"]:
+        print(f"  {stage['stage']:<15} {stage['seconds']:>9.3f} {stage['peak_rss_mb']:>11.1f} {stage['bytes_written'] / 1024:>11.0f}")
+    print(f"  {'total':<15} {sum(stage['seconds'] for stage in result['stages']):>9.3f} "
+          f"{max(stage['peak_rss_mb'] for stage in result['stages']):>11.1f} "
+          f"{sum(stage['bytes_written'] for stage in result['stages']) / 1024:>11.0f}")
+
+
+def print_scaling(results):
+    """Seconds per stage side by side; each step multiplies the input by the scale ratio, so should the time."""
+    labels = list(results)
+    print("\nseconds per stage:")
+    print(f"  {'stage':<15}" + "".join(f" {label:>9}" for label in labels))
+    for index, stage in enumerate(results[labels[0]]["stages"]):
+        print(f"  {stage['stage']:<15}" + "".join(f" {results[label]['stages'][index]['seconds']:>9.3f}" for label in labels))
+
+
+def compare(results, baseline, tolerance):
+    """Return the (run, stage, seconds, baseline seconds) that got slower than `tolerance` times the baseline."""
+    regressions = []
+    for label, result in results.items():
+        baseline_stages = {stage["stage"]: stage["seconds"] for stage in baseline.get(label, {}).get("stages", [])}
+        for stage in result["stages"]:
+            before = baseline_stages.get(stage["stage"])
+            if before is None or max(before, stage["seconds"]) < MIN_COMPARED_SECONDS:
+                continue
+            if stage["seconds"] > before * tolerance:
+                regressions.append((label, stage["stage"], stage["seconds"], before))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the scraper pipeline.")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help=f"comma-separated multiples of {SCALE_CHANNELS} channels")
+    parser.add_argument("--corpus", help="replay this corpus (see replay.py) instead of synthetic ones")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the stub adds to every response")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of stub responses that are 503s")
+    parser.add_argument("--report", help="save the results as JSON")
+    parser.add_argument("--baseline", help="compare with a JSON report saved earlier")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="slowdown factor reported as a regression")
+    parser.add_argument("--child", nargs=3, metavar=("CORPUS", "BASE_URL", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_pipeline(*args.child)))
+        return
+
+    check_stitched_replay()
+    results = {}
+    if args.corpus:
+        results["corpus"] = replay(args.corpus, args.latency, args.failure_rate)
+        print_run(f"corpus {args.corpus}", results["corpus"])
+    else:
+        for scale in (int(scale) for scale in args.scales.split(",")):
+            with tempfile.TemporaryDirectory() as corpus_directory:
+                synthesize(corpus_directory, SCALE_CHANNELS * scale)
+                results[f"{scale}x"] = replay(corpus_directory, args.latency, args.failure_rate)
+            print_run(f"{scale}x", results[f"{scale}x"])
+        print_scaling(results)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for label, stage, seconds, before in regressions:
+            print(f"REGRESSION {label} {stage}: {seconds:.3f}s vs {before:.3f}s baseline")
+        if regressions:
+            sys.exit(1)
+        print(f"\nNo stage slower than {args.tolerance}x the baseline.")
+
+
+if __name__ == "__main__":
+    main()
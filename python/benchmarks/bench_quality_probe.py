@@ -0,0 +1,51 @@
+"""Benchmark the master-playlist quality probe against a local stub server.
+
+Run with: python python/benchmarks/bench_quality_probe.py
+HOST_COUNT stub servers stand in for the upstream CDN hosts and answer every
+master playlist after LATENCY seconds. The sequential loop costs about
+CHANNEL_COUNT * LATENCY; the pooled concurrent fetch is bounded by the worker
+and per-host limits instead.
+"""
+import time
+from contextlib import ExitStack
+
+from synthetic import load_scraper, make_master_playlist
+from stub_server import StubHTTPServer
+from http_client import create_session
+
+CHANNEL_COUNT = 100
+HOST_COUNT = 4
+LATENCY = 0.1  # Seconds per response
+
+
+def main():
+    scraper = load_scraper()
+    routes = {f"/channel-{index}/master.m3u8": make_master_playlist() for index in range(CHANNEL_COUNT)}
+
+    with ExitStack() as stack:
+        stubs = [stack.enter_context(StubHTTPServer(routes, latency=LATENCY)) for _ in range(HOST_COUNT)]
+        master_urls = [stubs[index % HOST_COUNT].url(path) for index, path in enumerate(routes)]
+
+        started = time.perf_counter()
+        sequential = [scraper.fetch_master_playlist(master_url) for master_url in master_urls]
+        sequential_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        concurrent = scraper.fetch_all_master_playlists(master_urls, create_session())
+        concurrent_elapsed = time.perf_counter() - started
+
+    assert concurrent == sequential, "concurrent probe must return the same playlists in the same order"
+    print(f"channels={CHANNEL_COUNT} hosts={HOST_COUNT} latency={LATENCY}s")
+    print(f"sequential  {sequential_elapsed:7.2f}s")
+    print(f"concurrent  {concurrent_elapsed:7.2f}s  ({sequential_elapsed / concurrent_elapsed:.1f}x faster)")
+
+    # Transient 503s are retried with backoff and still come back in order
+    with StubHTTPServer(routes, fail_first=1) as stub:
+        master_urls = [stub.url(path) for path in routes]
+        retried = scraper.fetch_all_master_playlists(master_urls, create_session(backoff_factor=0.01))
+    assert all(master.variants for master in retried), "every channel should succeed after one retry"
+    print(f"retry check ok ({CHANNEL_COUNT} channels recovered from one 503 each)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Compare the binary snapshot with the JSON outputs it stands in for.
+
+Run with: python python/benchmarks/bench_snapshot.py
+For growing channel counts the same model is written as rakuten_channels.json
++ rakuten_epg.json (indent=4, as the pipeline does) and as a snapshot. Each
+reader then opens the model and looks up a channel and the programme on air
+at some time, 1000 times over; open and lookup time and the peak Python heap
+are reported. Both readers must agree on every answer.
+"""
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from synthetic import iter_xmltv, make_channels_data
+from epg import index_epg_elements, iter_epg_json, iter_xmltv_elements
+from snapshot import Snapshot, build_snapshot
+from xmltv_time import to_epoch, xmltv_to_epoch
+
+CHANNEL_COUNTS = [250, 1_000, 4_000]
+PROGRAMMES_PER_CHANNEL = 48  # One day of 30-minute slots
+LOOKUPS = 1_000
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def build_model(directory, channel_count):
+    channels_data = make_channels_data(channel_count)
+    xmltv = "".join(iter_xmltv(channel_count * PROGRAMMES_PER_CHANNEL, channel_count, start=START)).encode("utf-8")
+    epg_data_map = index_epg_elements(iter_xmltv_elements([xmltv]), [channel_info["tvg_id"] for channel_info in channels_data], START)
+
+    paths = {"channels": os.path.join(directory, "rakuten_channels.json"),
+             "epg": os.path.join(directory, "rakuten_epg.json"),
+             "snapshot": os.path.join(directory, "rakuten_snapshot.bin")}
+    with open(paths["channels"], "w", encoding="utf-8") as f:
+        json.dump({"channels": channels_data, "epg_url": "https://example.invalid/rakuten_epg.json"}, f, indent=4, ensure_ascii=False)
+    with open(paths["epg"], "w", encoding="utf-8") as f:
+        f.writelines(iter_epg_json(channels_data, epg_data_map))
+    started = time.perf_counter()
+    content = build_snapshot(channels_data, epg_data_map)
+    build_seconds = time.perf_counter() - started
+    with open(paths["snapshot"], "wb") as f:
+        f.write(content)
+    return paths, build_seconds
+
+
+def queries(channel_count):
+    """The same pseudo-random (tvg_id, moment) pairs for both readers."""
+    start = to_epoch(START)
+    for index in range(LOOKUPS):
+        number = index * 7919 % channel_count
+        moment = start + (index * 104_729) % int(timedelta(hours=PROGRAMMES_PER_CHANNEL // 2).total_seconds())
+        yield f"channel-{number:04d}", moment
+
+
+def open_json(paths):
+    with open(paths["channels"], "r", encoding="utf-8") as f:
+        channels = {channel_info["tvg_id"]: channel_info for channel_info in json.load(f)["channels"]}
+    with open(paths["epg"], "r", encoding="utf-8") as f:
+        guide = {channel["tvg_id"]: channel["programs"] for channel in json.load(f)["channels"]}
+    return channels, guide
+
+
+def lookup_json(model, tvg_id, moment):
+    channels, guide = model
+    on_air = next((program for program in guide.get(tvg_id, [])
+                   if xmltv_to_epoch(program["start_time"]) <= moment < xmltv_to_epoch(program["stop_time"])), None)
+    return channels[tvg_id]["stream_url"], on_air and on_air["title"]
+
+
+def lookup_snapshot(snapshot, tvg_id, moment):
+    on_air = snapshot.programme_at(tvg_id, moment)
+    return snapshot.channel(tvg_id)["stream_url"], on_air and on_air["title"]
+
+
+READERS = {
+    "json": (open_json, lookup_json, lambda model: None),
+    "snapshot": (lambda paths: Snapshot(paths["snapshot"]), lookup_snapshot, lambda snapshot: snapshot.close()),
+}
+
+
+def run_reader(mode, paths, channel_count):
+    open_model, lookup, close_model = READERS[mode]
+    started = time.perf_counter()
+    model = open_model(paths)
+    opened = time.perf_counter()
+    answers = [lookup(model, tvg_id, moment) for tvg_id, moment in queries(channel_count)]
+    finished = time.perf_counter()
+    close_model(model)
+    del model
+
+    # Again under tracemalloc (slower, so untimed): peak Python heap of open + lookups.
+    # Snapshot pages are file-backed and shared, so they are not counted.
+    tracemalloc.start()
+    model = open_model(paths)
+    for tvg_id, moment in queries(channel_count):
+        lookup(model, tvg_id, moment)
+    peak = tracemalloc.get_traced_memory()[1]
+    close_model(model)
+    del model
+    tracemalloc.stop()
+    print(f"{mode:>9} {channel_count:>8} {opened - started:>9.4f} {finished - opened:>10.4f} {peak / 2 ** 20:>12.2f}")
+    return answers
+
+
+def main():
+    print(f"{'channels':>8} {'programmes':>10} {'JSON KiB':>9} {'snapshot KiB':>12} {'build s':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        models = {}
+        for channel_count in CHANNEL_COUNTS:
+            directory = os.path.join(tmp_dir, str(channel_count))
+            os.makedirs(directory)
+            paths, build_seconds = models[channel_count] = build_model(directory, channel_count)
+            json_kib = (os.path.getsize(paths["channels"]) + os.path.getsize(paths["epg"])) / 1024
+            print(f"{channel_count:>8} {channel_count * PROGRAMMES_PER_CHANNEL:>10} {json_kib:>9.0f} "
+                  f"{os.path.getsize(paths['snapshot']) / 1024:>12.0f} {build_seconds:>8.3f}")
+
+        print(f"\nOpen the model, then {LOOKUPS} channel + programme-at-T lookups:")
+        print(f"{'reader':>9} {'channels':>8} {'open s':>9} {'lookups s':>10} {'peak heap MB':>12}")
+        for channel_count, (paths, _) in models.items():
+            expected = run_reader("json", paths, channel_count)
+            assert run_reader("snapshot", paths, channel_count) == expected, f"Readers disagree at {channel_count} channels"
+
+
+if __name__ == "__main__":
+    main()
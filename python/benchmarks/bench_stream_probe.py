@@ -0,0 +1,72 @@
+"""Exercise the stream health probe against a local stub server.
+
+Run with: python python/benchmarks/bench_stream_probe.py
+CHANNEL_COUNT channels with VARIANT_COUNT variants each are served locally.
+One channel's media playlists are missing (dead), one answers slowly (slow)
+and one has a broken first variant that must move last, the others keeping
+their upstream order. The probe must keep reusing its keep-alive
+connections, ranged segment requests included.
+"""
+import time
+
+from synthetic import make_master_playlist, make_media_playlist
+from stub_server import StubHTTPServer
+from hls import parse_master_playlist
+from http_client import MAX_PER_HOST, create_session
+from probe import STATUS_DEAD, STATUS_OK, STATUS_SLOW, order_variants_by_health, probe_masters
+
+CHANNEL_COUNT = 50
+VARIANT_COUNT = 4
+LATENCY = 0.05
+SLOW_LATENCY = 0.5
+SLOW_TTFB = 0.3
+
+
+def main():
+    routes = {}
+    latencies = {}
+    for channel in range(CHANNEL_COUNT):
+        routes[f"/channel-{channel}/master.m3u8"] = make_master_playlist(VARIANT_COUNT)
+        for variant in range(VARIANT_COUNT):
+            if channel == 0 or (channel == 2 and variant == 0):
+                continue  # Channel 0 is dead, channel 2 loses its first variant
+            path = f"/channel-{channel}/variant_{variant}/index.m3u8"
+            routes[path] = make_media_playlist()
+            routes[f"/channel-{channel}/variant_{variant}/segment_105.ts"] = b"\x47" * 188
+            if channel == 1:
+                latencies[path] = SLOW_LATENCY
+
+    with StubHTTPServer(routes, latency=LATENCY, latencies=latencies) as stub:
+        master_urls = [stub.url(f"/channel-{channel}/master.m3u8") for channel in range(CHANNEL_COUNT)]
+        session = create_session(retries=0)
+        masters = [parse_master_playlist(session.get(url).text, url) for url in master_urls]
+
+        connections_before = stub.connection_count
+        started = time.perf_counter()
+        health = probe_masters(masters, session, slow_ttfb=SLOW_TTFB)
+        elapsed = time.perf_counter() - started
+        connections = stub.connection_count - connections_before
+
+    statuses = [channel_health["status"] for channel_health in health]
+    assert statuses[0] == STATUS_DEAD, statuses[0]
+    assert statuses[1] == STATUS_SLOW, statuses[1]
+    assert statuses[2:] == [STATUS_OK] * (CHANNEL_COUNT - 2)
+    reordered = [variant.uri for variant in order_variants_by_health(masters[2], health[2]).variants]
+    upstream = [variant.uri for variant in masters[2].variants]
+    assert reordered == upstream[1:] + upstream[:1], "unreachable variant last, the others in upstream order"
+    for channel in range(3, CHANNEL_COUNT):  # Response times must not reorder anything
+        assert order_variants_by_health(masters[channel], health[channel]).variants == masters[channel].variants
+
+    # Ranged segment reads are drained, so the probe keeps reusing its keep-alive connections
+    assert connections <= MAX_PER_HOST * 2, f"{connections} connections opened: segment probes discard them"
+
+    probes = CHANNEL_COUNT * VARIANT_COUNT
+    print(f"probed {probes} variants ({probes * 2} requests, {connections} connections) in {elapsed:.2f}s; "
+          f"sequential would take at least {probes * 2 * LATENCY:.2f}s, "
+          f"{MAX_PER_HOST} at a time against one host {probes * 2 * LATENCY / MAX_PER_HOST:.2f}s")
+    print(f"dead={statuses.count(STATUS_DEAD)} slow={statuses.count(STATUS_SLOW)} ok={statuses.count(STATUS_OK)}")
+    print(f"example: {health[3]['variants'][0]}")
+
+
+if __name__ == "__main__":
+    main()
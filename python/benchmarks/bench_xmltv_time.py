@@ -0,0 +1,104 @@
+"""Benchmark XMLTV timestamp handling: strptime vs the cached epoch codec.
+
+Run with: python python/benchmarks/bench_xmltv_time.py
+Parsing should be at least 10x faster than datetime.strptime, and pruning
+or finding the programme on air should be a binary search per channel.
+Malformed timestamps must be rejected even once a valid one of the same
+hour and offset is cached.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+
+import synthetic  # noqa: F401 (puts the scraper modules on sys.path)
+from epg import ChannelSchedule, prune_past_programmes
+from xmltv_time import to_epoch, xmltv_to_epoch
+
+XMLTV_TIME_FORMAT = "%Y%m%d%H%M%S %z"
+CHANNEL_COUNT = 100
+PROGRAMMES_PER_CHANNEL = 2_000
+SLOT_MINUTES = 30
+OFFSETS = [timezone.utc, timezone(timedelta(hours=1)), timezone(timedelta(hours=-5))]
+MALFORMED = ["2025010100300", "202501010030", "2025010100300 +0000", "2025010100 300 +0000", "20250101006000 +0000"]
+
+
+def make_programs():
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    epg_data_map = {}
+    for channel_index in range(CHANNEL_COUNT):
+        offset = OFFSETS[channel_index % len(OFFSETS)]
+        programs = []
+        for slot in range(PROGRAMMES_PER_CHANNEL):
+            programme_start = (start + timedelta(minutes=SLOT_MINUTES * slot)).astimezone(offset)
+            programme_stop = programme_start + timedelta(minutes=SLOT_MINUTES)
+            programs.append({
+                "start_time": f"{programme_start:%Y%m%d%H%M%S %z}",
+                "stop_time": f"{programme_stop:%Y%m%d%H%M%S %z}",
+                "title": f"Programme {slot}",
+            })
+        epg_data_map[f"channel-{channel_index}"] = programs
+    return start, epg_data_map
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return time.perf_counter() - started, result
+
+
+def legacy_prune(epg_data_map, now):
+    return {tvg_id: [program for program in programs
+                     if datetime.strptime(program["stop_time"], XMLTV_TIME_FORMAT) > now]
+            for tvg_id, programs in epg_data_map.items()}
+
+
+def legacy_current(programs, now):
+    for program in programs:
+        if (datetime.strptime(program["start_time"], XMLTV_TIME_FORMAT) <= now
+                < datetime.strptime(program["stop_time"], XMLTV_TIME_FORMAT)):
+            return program
+    return None
+
+
+def main():
+    start, epg_data_map = make_programs()
+    stamps = [program["stop_time"] for programs in epg_data_map.values() for program in programs]
+    now = start + timedelta(days=PROGRAMMES_PER_CHANNEL * SLOT_MINUTES / 60 / 24 / 2, minutes=7)
+    now_epoch = to_epoch(now)
+
+    legacy_seconds, legacy_values = timed(lambda: [int(datetime.strptime(stamp, XMLTV_TIME_FORMAT).timestamp()) for stamp in stamps])
+    codec_seconds, codec_values = timed(lambda: [xmltv_to_epoch(stamp) for stamp in stamps])
+    assert legacy_values == codec_values
+    print(f"parse {len(stamps)} timestamps: strptime {legacy_seconds:.3f}s, codec {codec_seconds:.3f}s "
+          f"({legacy_seconds / codec_seconds:.1f}x)")
+    for value in ("20250101003000", "20250101003000 +0000"):
+        xmltv_to_epoch(value)  # Caches the hours the malformed values below share
+    for value in MALFORMED:
+        try:
+            xmltv_to_epoch(value)
+        except ValueError:
+            continue
+        raise AssertionError(f"malformed XMLTV time accepted: {value!r}")
+
+    legacy_seconds, legacy_pruned = timed(lambda: legacy_prune(epg_data_map, now))
+    codec_seconds, pruned = timed(lambda: prune_past_programmes(epg_data_map, now))
+    assert legacy_pruned == pruned
+    print(f"prune {len(stamps)} programmes: strptime {legacy_seconds:.3f}s, schedule {codec_seconds:.3f}s "
+          f"({legacy_seconds / codec_seconds:.1f}x)")
+
+    schedules = {tvg_id: ChannelSchedule(programs) for tvg_id, programs in epg_data_map.items()}
+    legacy_seconds, legacy_on_air = timed(lambda: [legacy_current(programs, now) for programs in epg_data_map.values()])
+
+    def lookup():
+        on_air = []
+        for schedule in schedules.values():
+            index = schedule.current_index(now_epoch)
+            on_air.append(None if index is None else schedule[index])
+        return on_air
+    lookup_seconds, on_air = timed(lookup)
+    assert legacy_on_air == on_air
+    print(f"current programme x{CHANNEL_COUNT}: linear strptime {legacy_seconds * 1e3:.1f}ms, "
+          f"bisect {lookup_seconds * 1e3:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
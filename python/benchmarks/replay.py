@@ -0,0 +1,244 @@
+"""Record upstream responses into a fixture corpus and replay them offline.
+
+    python python/benchmarks/replay.py record CORPUS_DIR
+        Run the scraper once against the live upstreams (outputs go to a
+        temporary directory) and keep every response it received.
+    python python/benchmarks/replay.py synthesize CORPUS_DIR --channels 100
+        Write a synthetic corpus of the same shape: one W3U, one master
+        playlist per channel and a gzipped XMLTV guide.
+    python python/benchmarks/replay.py serve CORPUS_DIR [--latency S] [--failure-rate R]
+        Serve a corpus from a local stub server and print the RAKUTEN_SOURCES
+        value that points the scraper at it.
+
+A corpus is a directory with index.json (sources, capture time and one entry
+per URL) and the response bodies under bodies/. Responses are keyed on host,
+path and query minus the per-session parameters (streaming ids, correlators),
+since stitched endpoints serve many channels from one path. On replay every
+upstream URL https://host/path becomes http://127.0.0.1:PORT/host/path;
+absolute URLs inside W3U and playlist bodies are rewritten the same way, so
+the scraper follows the stub instead of the network.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+from requests.adapters import BaseAdapter
+
+from synthetic import AD_QUERY, GROUPS, LANGUAGES, iter_xmltv, load_scraper, make_master_playlist, synthetic_channel_ids
+from stub_server import StubHTTPServer
+from output import OutputWriter
+from m3u import strip_session_parameters
+
+CORPUS_VERSION = 1
+GZIP_MAGIC = b"\x1f\x8b"
+PROGRAMMES_PER_CHANNEL = 48  # One day of 30-minute slots
+SYNTHETIC_W3U_URL = "https://w3u.example.invalid/tv/w3u/RakutenTV_tv.w3u"
+SYNTHETIC_EPG_URL = "https://epg.example.invalid/epg/RakutenTV.xml.gz"
+
+
+class Corpus:
+    """Recorded upstream responses: {url: (content type, body file)}, plus the sources that were scraped."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.sources = []
+        self.recorded_at = None
+        self.responses = {}  # "host/path?query" -> {"url", "content_type", "body"}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, directory):
+        corpus = cls(directory)
+        with open(os.path.join(directory, "index.json"), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != CORPUS_VERSION:
+            raise ValueError(f"Unsupported corpus version {index.get('version')!r} in {directory}")
+        corpus.sources = index["sources"]
+        corpus.recorded_at = datetime.fromisoformat(index["recorded_at"])
+        corpus.responses = {route_key(entry["url"]): entry for entry in index["responses"]}
+        return corpus
+
+    def add(self, url, body, content_type=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        key = route_key(url)
+        extension = os.path.splitext(urlsplit(url).path)[1] or ".bin"
+        filename = f"bodies/{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}{extension}"
+        os.makedirs(os.path.join(self.directory, "bodies"), exist_ok=True)
+        with open(os.path.join(self.directory, filename), "wb") as f:
+            f.write(body)
+        with self._lock:
+            self.responses[key] = {"url": url, "content_type": content_type or "application/octet-stream", "body": filename}
+
+    def save(self):
+        index = {
+            "version": CORPUS_VERSION,
+            "recorded_at": self.recorded_at.isoformat(),
+            "sources": self.sources,
+            "responses": sorted(self.responses.values(), key=lambda entry: entry["url"]),
+        }
+        with open(os.path.join(self.directory, "index.json"), "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+
+    def body_bytes(self):
+        return sum(os.path.getsize(os.path.join(self.directory, entry["body"])) for entry in self.responses.values())
+
+    def origins(self):
+        return sorted({"{0.scheme}://{0.netloc}".format(urlsplit(entry["url"])) for entry in self.responses.values()})
+
+    def routes(self, base_url):
+        """{stub path: body} with upstream URLs inside text bodies pointed at `base_url`."""
+        replacements = [(origin.encode("utf-8"), f"{base_url}/{urlsplit(origin).netloc}".encode("utf-8"))
+                        for origin in self.origins()]
+        routes = {}
+        for key, entry in self.responses.items():
+            with open(os.path.join(self.directory, entry["body"]), "rb") as f:
+                body = f.read()
+            if not body.startswith(GZIP_MAGIC):
+                for origin, replacement in replacements:
+                    body = body.replace(origin, replacement)
+            routes[f"/{key}"] = body
+        return routes
+
+    def content_types(self):
+        return {f"/{key}": entry["content_type"] for key, entry in self.responses.items()}
+
+    def replay_sources(self, base_url):
+        """The recorded sources as RAKUTEN_SOURCES entries pointing at a stub serving this corpus."""
+        return [{"name": source["name"], "w3u": rewrite_url(source["w3u"], base_url),
+                 "epg": rewrite_url(source["epg"], base_url) if source.get("epg") else None}
+                for source in self.sources]
+
+    def serve(self, latency=0.0, failure_rate=0.0, seed=0):
+        """A StubHTTPServer (not started yet) answering for every recorded URL."""
+        stub = StubHTTPServer(latency=latency, failure_rate=failure_rate, seed=seed,
+                              content_types=self.content_types(), normalize_target=strip_session_parameters)
+        stub.routes = self.routes(stub.base_url)
+        return stub
+
+
+# methods
+def route_key(url):
+    parts = urlsplit(url)
+    return strip_session_parameters(f"{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else ""))
+
+
+def rewrite_url(url, base_url):
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        return url  # Local fixture files need no server
+    return f"{base_url}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+
+
+class RecordingAdapter(BaseAdapter):
+    """Transport adapter that stores every 200 response passing through `adapter` in a corpus."""
+
+    def __init__(self, adapter, corpus):
+        super().__init__()
+        self.adapter = adapter
+        self.corpus = corpus
+
+    def send(self, request, **kwargs):
+        response = self.adapter.send(request, **kwargs)
+        if response.status_code == 200:
+            # Reading .content here is fine for streaming callers: requests replays it from memory
+            self.corpus.add(request.url, response.content, response.headers.get("Content-Type"))
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+def record(directory):
+    """Scrape the live upstreams once and store what they answered in `directory`."""
+    corpus = Corpus(directory)
+    corpus.recorded_at = datetime.now(timezone.utc)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ["RAKUTEN_CACHE_DIR"] = os.path.join(tmp_dir, "cache")  # Empty cache: full bodies, never a 304
+        scraper = load_scraper()
+        scraper.output_writer = OutputWriter(os.path.join(tmp_dir, "output"))
+        create_session = scraper.create_session
+
+        def create_recording_session(*args, **kwargs):
+            session = create_session(*args, **kwargs)
+            for prefix in ("http://", "https://"):
+                session.mount(prefix, RecordingAdapter(session.get_adapter(prefix), corpus))
+            return session
+        scraper.create_session = create_recording_session
+        scraper.main()
+        corpus.sources = [source.to_dict() for source in scraper.SOURCES]
+    corpus.save()
+    return corpus
+
+
+def synthesize(directory, channel_count, programmes_per_channel=PROGRAMMES_PER_CHANNEL, recorded_at=None):
+    """Write a synthetic corpus shaped like a recording of the real upstreams."""
+    recorded_at = recorded_at or datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    corpus = Corpus(directory)
+    corpus.recorded_at = recorded_at
+    corpus.sources = [{"name": "synthetic", "w3u": SYNTHETIC_W3U_URL, "epg": SYNTHETIC_EPG_URL}]
+
+    stations = {group: [] for group in GROUPS}
+    master = make_master_playlist(3)
+    for index, tvg_id in enumerate(synthetic_channel_ids(channel_count)):
+        master_url = f"https://cdn{index % 4}.example.invalid/v1/master/{index}/{tvg_id}/master.m3u8"
+        corpus.add(master_url, master, "application/vnd.apple.mpegurl")
+        stations[GROUPS[index % len(GROUPS)]].append({
+            "name": f"Channel {index}",
+            "epgId": tvg_id,
+            "image": f"https://images.example.invalid/logos/{index}.jpeg",
+            "url": f"{master_url}?{AD_QUERY}&ads.rtv_language={LANGUAGES[index % len(LANGUAGES)]}",
+        })
+    w3u = {"name": "Synthetic", "groups": [{"name": group, "stations": group_stations}
+                                           for group, group_stations in stations.items()]}
+    corpus.add(SYNTHETIC_W3U_URL, json.dumps(w3u, ensure_ascii=False, indent=1), "text/plain; charset=utf-8")
+
+    start = recorded_at - timedelta(hours=2)  # A couple of programmes are already over, like a real guide
+    guide = "".join(iter_xmltv(channel_count * programmes_per_channel, channel_count, start=start))
+    corpus.add(SYNTHETIC_EPG_URL, gzip.compress(guide.encode("utf-8"), mtime=0), "application/gzip")
+    corpus.save()
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("record", help="record the live upstreams").add_argument("corpus")
+    synthesize_parser = commands.add_parser("synthesize", help="write a synthetic corpus")
+    synthesize_parser.add_argument("corpus")
+    synthesize_parser.add_argument("--channels", type=int, default=100)
+    serve_parser = commands.add_parser("serve", help="serve a corpus until interrupted")
+    serve_parser.add_argument("corpus")
+    serve_parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    serve_parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with 503")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        corpus = record(args.corpus)
+    elif args.command == "synthesize":
+        corpus = synthesize(args.corpus, args.channels)
+    else:
+        corpus = Corpus.load(args.corpus)
+        with corpus.serve(args.latency, args.failure_rate) as stub:
+            print(f"Serving {len(corpus.responses)} responses at {stub.base_url}")
+            print(f"RAKUTEN_SOURCES='{json.dumps(corpus.replay_sources(stub.base_url))}'")
+            print(f"Guide times are as of {corpus.recorded_at.isoformat()}; Ctrl-C to stop.")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+        return
+    print(f"{args.corpus}: {len(corpus.responses)} responses, {corpus.body_bytes() / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
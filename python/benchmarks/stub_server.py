@@ -0,0 +1,137 @@
+import hashlib
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)$")
+
+
+class _TolerantHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return  # Clients may drop a connection at any point, like real CDNs see
+        super().handle_error(request, client_address)
+
+
+class StubHTTPServer:
+    """Local HTTP server serving canned responses with injected latency.
+
+    `routes` maps a path to the body (bytes or str) served for it; unknown
+    paths answer 404. With `normalize_target`, a route may also be keyed on
+    path and query: the request target goes through that function and is
+    looked up before the bare path. `latencies` can slow down individual
+    paths. `fail_first` makes each path answer 503 that many times
+    before succeeding, to exercise retries, and `failure_rate` makes any
+    request fail with that probability (seeded, so runs are repeatable).
+    Every 200 carries an ETag and a matching If-None-Match is answered with 304.
+    A single `Range: bytes=a-b` is answered with a 206.
+    """
+
+    def __init__(self, routes=None, latency=0.0, fail_first=0, content_type="application/vnd.apple.mpegurl",
+                 latencies=None, failure_rate=0.0, content_types=None, seed=0, normalize_target=None):
+        self.routes = dict(routes or {})
+        self.normalize_target = normalize_target
+        self.latency = latency
+        self.latencies = dict(latencies or {})  # Per-path latency overriding `latency`
+        self.fail_first = fail_first
+        self.failure_rate = failure_rate
+        self.content_type = content_type
+        self.content_types = dict(content_types or {})  # Per-path Content-Type overriding `content_type`
+        self.failure_count = 0
+        self._random = random.Random(seed)
+        self.request_count = 0
+        self.connection_count = 0
+        self.bytes_sent = 0
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._server = _TolerantHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real CDNs
+            disable_nagle_algorithm = True  # Headers and body are written separately; don't stall on delayed ACKs
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connection_count += 1
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.request_count += 1
+                    failures = stub._failures.get(self.path, 0)
+                    should_fail = failures < stub.fail_first
+                    if should_fail:
+                        stub._failures[self.path] = failures + 1
+                    elif stub.failure_rate and stub._random.random() < stub.failure_rate:
+                        should_fail = True
+                    stub.failure_count += should_fail
+                path = self.path.split('?', 1)[0]
+                latency = stub.latencies.get(path, stub.latency)
+                if latency:
+                    time.sleep(latency)
+
+                route = stub.normalize_target(self.path) if stub.normalize_target else path
+                if route not in stub.routes:
+                    route = path
+                body = stub.routes.get(route)
+                if should_fail or body is None:
+                    self.send_response(503 if should_fail else 404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                byte_range = RANGE_RE.match(self.headers.get("Range", ""))
+                if byte_range and int(byte_range.group(1)) < len(body):
+                    first = int(byte_range.group(1))
+                    last = min(int(byte_range.group(2) or len(body) - 1), len(body) - 1)
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {first}-{last}/{len(body)}")
+                    body = body[first:last + 1]
+                else:
+                    self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", stub.content_types.get(route, stub.content_type))
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with stub._lock:
+                    stub.bytes_sent += len(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output readable
+
+        return Handler
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,119 @@
+import gzip
+import importlib.util
+import os
+import resource
+import sys
+from datetime import datetime, timedelta, timezone
+from xml.sax.saxutils import quoteattr, escape
+
+# Benchmarks import the scraper modules living one directory up
+PYTHON_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PYTHON_DIRECTORY)
+
+
+def load_scraper():
+    """Import python/scrape-tubi.py (not importable by name because of the dash)."""
+    spec = importlib.util.spec_from_file_location("scrape_tubi", os.path.join(PYTHON_DIRECTORY, "scrape-tubi.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    """High-water RSS of this process. VmHWM starts over at exec, unlike ru_maxrss which Linux carries over from the parent."""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_channel_ids(channel_count):
+    return [f"channel-{index:04d}" for index in range(channel_count)]
+
+
+def iter_xmltv(programme_count, channel_count=100, start=None, slot_minutes=30):
+    """Yield a synthetic XMLTV document in pieces, with `programme_count`
+    programmes spread round-robin over `channel_count` channels."""
+    if start is None:
+        start = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) - timedelta(hours=2)
+    channel_ids = synthetic_channel_ids(channel_count)
+    yield '<?xml version="1.0" encoding="utf-8"?>\n<tv>\n'
+    for channel_id in channel_ids:
+        yield f'<channel id={quoteattr(channel_id)}><display-name>{escape(channel_id)}</display-name></channel>\n'
+    slot = timedelta(minutes=slot_minutes)
+    for index in range(programme_count):
+        channel_id = channel_ids[index % channel_count]
+        programme_start = start + slot * (index // channel_count)
+        programme_stop = programme_start + slot
+        yield (
+            f'<programme start="{programme_start:%Y%m%d%H%M%S %z}" stop="{programme_stop:%Y%m%d%H%M%S %z}" channel={quoteattr(channel_id)}>'
+            f'<title>Programme {index}</title><desc>Synthetic programme {index} on {escape(channel_id)}</desc>'
+            f'<icon src="https://example.invalid/icons/{index % 500}.jpg"/></programme>\n'
+        )
+    yield '</tv>\n'
+
+
+def make_master_playlist(variant_count=4):
+    """Return a synthetic HLS master playlist with `variant_count` variants."""
+    lines = ["#EXTM3U"]
+    for index in range(variant_count):
+        bandwidth = 800_000 * (index + 1)
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},AVERAGE-BANDWIDTH={bandwidth - 50_000},'
+                     f'CODECS="avc1.640029,mp4a.40.2",RESOLUTION={640 * (index + 1)}x{360 * (index + 1)},FRAME-RATE=25.000')
+        lines.append(f"variant_{index}/index.m3u8")
+    return "\n".join(lines) + "\n"
+
+
+def make_xmltv(programme_count, channel_count=100, start=None, slot_minutes=30):
+    """Return a synthetic XMLTV document as bytes."""
+    return ''.join(iter_xmltv(programme_count, channel_count, start, slot_minutes)).encode('utf-8')
+
+
+def write_xmltv_gz(path, programme_count, channel_count=100, start=None, slot_minutes=30):
+    """Write a synthetic gzipped XMLTV guide to `path` without holding it in memory."""
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for piece in iter_xmltv(programme_count, channel_count, start, slot_minutes):
+            f.write(piece)
+    return path
+
+
+def make_media_playlist(segment_count=6, target_duration=6, prefix="segment"):
+    """Return a synthetic live HLS media playlist."""
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{target_duration}", "#EXT-X-MEDIA-SEQUENCE:100"]
+    for index in range(segment_count):
+        lines.append(f"#EXTINF:{target_duration}.000,")
+        lines.append(f"{prefix}_{100 + index}.ts")
+    return "\n".join(lines) + "\n"
+
+
+AD_TRACKING_KEYS = ["_fw_content_", "tivo_", "device_", "app_", "player_", "amzn"]
+# ~1.5 KB, like the real URLs: mostly ad tracking parameters, plus the ones that pick the channel
+AD_QUERY = "&".join([f"ads.{AD_TRACKING_KEYS[index % len(AD_TRACKING_KEYS)]}{index}=value_{index}" for index in range(56)]
+                    + ["ads.caid=SyntheticChannel", "ads.csid=synthetic_ssai", "ads.market=es", "ads.env=prod"])
+GROUPS = ["Películas", "Series", "Noticias", "Deportes", "Infantil"]
+LANGUAGES = ["spa", "eng", "ita", "fra"]
+
+
+def make_channels_data(channel_count):
+    """Return scraper-shaped channel dicts with ad-laden stream URLs and four qualities each."""
+    channels_data = []
+    for index, tvg_id in enumerate(synthetic_channel_ids(channel_count)):
+        language = LANGUAGES[index % len(LANGUAGES)]
+        stream_url = (f"https://stream.example.invalid/v1/master/{index}/master.m3u8?{AD_QUERY}"
+                      f"&ads.rtv_language={language}&channel_id={index}")
+        channels_data.append({
+            "name": f"Channel {index}",
+            "tvg_id": tvg_id,
+            "logo_url": f"https://images.example.invalid/logos/{index}.jpeg",
+            "group_title": GROUPS[index % len(GROUPS)],
+            "stream_url": stream_url,
+            "qualities": [{"url": f"https://stream.example.invalid/v1/manifest/{index}/{height}.m3u8",
+                           "attributes": {"BANDWIDTH": str(height * 2000), "RESOLUTION": f"{height * 16 // 9}x{height}"}}
+                          for height in (252, 360, 720, 1080)],
+            "backup_master_url": f"https://raw.example.invalid/master/{tvg_id}/master.m3u8",
+        })
+    return channels_data
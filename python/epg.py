@@ -0,0 +1,426 @@
+import gc
+import json
+import logging
+import threading
+import xml.etree.ElementTree as ET
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from xmltv_time import to_epoch, xmltv_to_epoch
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+OUTPUT_CHUNK_SIZE = 64 * 1024  # Characters per chunk handed to the writers
+SHARD_NOW = "now"
+NEXT_WINDOW_HOURS = 6
+DAY_SECONDS = 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+_gc_pause_lock = threading.Lock()
+_gc_pauses = 0  # Index builds in progress (sources are indexed concurrently)
+_gc_resume = False  # Whether the collector was enabled when the first of them started
+
+
+# methods
+def parse_programme_element(program_element):
+    title_element = program_element.find('title')
+    title_text = title_element.text if title_element is not None else "No Title"
+
+    desc_element = program_element.find('desc')
+    desc_text = desc_element.text if desc_element is not None else "No Description"
+
+    icon_element = program_element.find('icon')
+    icon_src = icon_element.get('src') if icon_element is not None else None
+
+    return {
+        "start_time": program_element.get('start'),
+        "stop_time": program_element.get('stop'),
+        "title": title_text,
+        "description": desc_text,
+        "icon": icon_src
+    }
+
+
+class ChannelSchedule(list):
+    """One channel's programmes sorted by start, with parallel epoch arrays.
+
+    The schedule is the programme list itself, so writers iterate and
+    JSON-encode it like any list. `starts`/`stops` keep the times parsed at
+    indexing: pruning, shards, merging and the snapshot binary-search them
+    instead of re-parsing every timestamp.
+    """
+    __slots__ = ("starts", "stops", "_stops_sorted")
+
+    def __init__(self, programs=()):
+        timed = []
+        for program in programs:
+            try:
+                timed.append((xmltv_to_epoch(program["start_time"]), xmltv_to_epoch(program["stop_time"]), program))
+            except (KeyError, TypeError, ValueError):
+                continue  # Unparseable times were already reported while indexing
+        timed.sort(key=lambda item: item[0])  # Stable: equal starts keep guide order
+        self._fill(timed)
+
+    @classmethod
+    def from_timed(cls, timed):
+        """Build from (start epoch, stop epoch, programme) triples already sorted by start."""
+        schedule = cls.__new__(cls)
+        schedule._fill(timed)
+        return schedule
+
+    def _fill(self, timed):
+        list.__init__(self, [program for _, _, program in timed])
+        self.starts = array('q', [start for start, _, _ in timed])
+        self.stops = array('q', [stop for _, stop, _ in timed])
+        self._stops_sorted = all(a <= b for a, b in zip(self.stops, self.stops[1:]))
+
+    def to_dict(self):
+        return {"programs": list(self), "starts": self.starts.tolist(), "stops": self.stops.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls.from_timed(list(zip(data["starts"], data["stops"], data["programs"])))
+
+    def timed(self):
+        return zip(self.starts, self.stops, self)
+
+    def first_live_index(self, now_epoch):
+        """Index of the first programme that has not finished at `now_epoch`."""
+        if self._stops_sorted:
+            return bisect_right(self.stops, now_epoch)
+        for index, stop in enumerate(self.stops):  # Overlapping schedule: rare, fall back to a scan
+            if stop > now_epoch:
+                return index
+        return len(self.stops)
+
+    def live(self, now_epoch):
+        """The schedule without the programmes that finished by `now_epoch`."""
+        first_live = self.first_live_index(now_epoch)
+        if self._stops_sorted:
+            return ChannelSchedule.from_timed(list(zip(self.starts[first_live:], self.stops[first_live:], self[first_live:])))
+        return ChannelSchedule.from_timed([item for item in list(self.timed())[first_live:] if item[1] > now_epoch])
+
+    def with_programs(self, timed):
+        """A new schedule with (start, stop, programme) triples added, still sorted by start."""
+        merged = list(self.timed()) + list(timed)
+        merged.sort(key=lambda item: item[0])  # Stable: on equal starts, programmes already here come first
+        return ChannelSchedule.from_timed(merged)
+
+    def current_index(self, now_epoch):
+        """Index of the programme on air at `now_epoch`, or None."""
+        index = bisect_right(self.starts, now_epoch) - 1
+        if index >= 0 and self.stops[index] > now_epoch:
+            return index
+        return None
+
+    def window(self, start_epoch, stop_epoch):
+        """Programmes overlapping [start_epoch, stop_epoch)."""
+        first = self.first_live_index(start_epoch)
+        last = bisect_left(self.starts, stop_epoch)
+        return [program for program, stop in zip(self[first:last], self.stops[first:last]) if stop > start_epoch]
+
+
+def as_schedule(programs):
+    """`programs` as a ChannelSchedule, parsing their times only when it is a plain list."""
+    return programs if isinstance(programs, ChannelSchedule) else ChannelSchedule(programs)
+
+
+def epg_map_to_dict(epg_data_map):
+    """JSON-serializable form of an EPG map that keeps the parsed times (for the parse cache)."""
+    return {tvg_id: as_schedule(programs).to_dict() for tvg_id, programs in epg_data_map.items()}
+
+
+def epg_map_from_dict(data):
+    return {tvg_id: ChannelSchedule.from_dict(schedule) for tvg_id, schedule in data.items()}
+
+
+@contextmanager
+def gc_paused():
+    """Suspend the cyclic garbage collector for the duration of the block.
+
+    Indexing allocates a few dicts per programme and keeps most of them.
+    None of them form cycles, but every collection would walk all the
+    programmes kept so far, which made large builds superlinear. The pause
+    is process-wide (server and daemon threads included), so keep the block
+    to the parse/index work and never around a download.
+    """
+    global _gc_pauses, _gc_resume
+    with _gc_pause_lock:
+        if _gc_pauses == 0:
+            _gc_resume = gc.isenabled()
+            gc.disable()
+        _gc_pauses += 1
+    try:
+        yield
+    finally:
+        with _gc_pause_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0 and _gc_resume:
+                gc.enable()
+
+
+def index_epg_elements(elements, wanted_ids, now=None):
+    """Build the EPG data map from XMLTV elements in a single pass.
+
+    `elements` is any iterable of top-level <channel>/<programme> elements in
+    document order. Only programmes whose channel id is in `wanted_ids` are
+    kept, and a channel only gets programmes when the XML also declares it
+    with a <channel> element (same rule as the old nested lookup). Each
+    channel gets a ChannelSchedule, sorted by start time.
+    """
+    with gc_paused():  # The pipeline indexes the downloaded body from the HTTP cache, not the socket
+        return _index_epg_elements(elements, wanted_ids, now)
+
+
+def _index_epg_elements(elements, wanted_ids, now):
+    now_epoch = to_epoch(datetime.now(timezone.utc) if now is None else now)  # Computed once for the whole guide
+
+    programmes_by_channel = {tvg_id.strip(): [] for tvg_id in wanted_ids}  # Keeps channels_data order
+    declared_channels = set()
+
+    for element in elements:
+        if element.tag == 'channel':
+            xml_channel_id = (element.get('id') or '').strip()
+            if xml_channel_id in programmes_by_channel:
+                declared_channels.add(xml_channel_id)
+        elif element.tag == 'programme':
+            xml_channel_id = (element.get('channel') or '').strip()
+            channel_programmes = programmes_by_channel.get(xml_channel_id)
+            if channel_programmes is None:
+                continue  # Not one of our channels
+
+            program = parse_programme_element(element)
+            try:
+                start_epoch = xmltv_to_epoch(program["start_time"])
+                stop_epoch = xmltv_to_epoch(program["stop_time"])
+            except (TypeError, ValueError) as e:
+                logger.debug("Error parsing time for program %r, channel %s: %s. Skipping program.", program['title'], xml_channel_id, e)
+                continue
+
+            if stop_epoch > now_epoch:  # Filter out past programs
+                channel_programmes.append((start_epoch, stop_epoch, program))
+
+    epg_data_map = {}
+    for tvg_id, channel_programmes in programmes_by_channel.items():
+        if tvg_id in declared_channels:
+            channel_programmes.sort(key=lambda item: item[0])
+            epg_data_map[tvg_id] = ChannelSchedule.from_timed(channel_programmes)
+        else:
+            logger.debug("No channel found in XML for tvg_id: %s", tvg_id)
+            epg_data_map[tvg_id] = ChannelSchedule()
+    return epg_data_map
+
+
+def prune_past_programmes(epg_data_map, now):
+    """Drop programmes that finished before `now` (e.g. from an index cached on an earlier run)."""
+    now_epoch = to_epoch(now)
+    return {tvg_id: as_schedule(programs).live(now_epoch) for tvg_id, programs in epg_data_map.items()}
+
+
+def build_epg_shards(programs, now, next_hours=NEXT_WINDOW_HOURS):
+    """Split one channel's programmes into time-window shards.
+
+    Returns {"now": [current, next], "next-6h": [...], "YYYY-MM-DD": [...], ...}
+    where each day shard holds the programmes overlapping that UTC day.
+    """
+    now_epoch = to_epoch(now)
+    schedule = as_schedule(programs)
+    live = schedule.live(now_epoch)
+
+    shards = {SHARD_NOW: live[:2]}  # Now playing (or next up), then the one after
+    shards[f"next-{next_hours}h"] = schedule.window(now_epoch, now_epoch + next_hours * 3600)
+    if live:
+        day_start = now_epoch - now_epoch % DAY_SECONDS  # UTC midnight
+        last_stop = max(live.stops)
+        while day_start < last_stop:
+            day_programs = schedule.window(max(day_start, now_epoch), day_start + DAY_SECONDS)
+            if day_programs:
+                shards[datetime.fromtimestamp(day_start, timezone.utc).date().isoformat()] = day_programs
+            day_start += DAY_SECONDS
+    return shards
+
+
+def index_epg_tree(root, wanted_ids, now=None):
+    return index_epg_elements(iter(root), wanted_ids, now=now)
+
+
+def iter_gunzip(chunks):
+    """Decompress a gzip byte stream chunk by chunk.
+
+    Concatenated gzip members are supported. If the stream is not gzipped at
+    all (e.g. the server already removed a Content-Encoding) the chunks are
+    passed through untouched.
+    """
+    chunks = iter(chunks)
+    decompressor = None
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if decompressor is None:
+            if not chunk.startswith(GZIP_MAGIC[:len(chunk)]):
+                yield chunk
+                yield from chunks  # Plain XML, nothing to decompress
+                return
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = decompressor.unused_data  # Start of the next gzip member, if any
+            if chunk:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if decompressor is not None:
+        data = decompressor.flush()
+        if data:
+            yield data
+        if not decompressor.eof:
+            raise zlib.error("Truncated gzip stream")
+
+
+def iter_xmltv_elements(chunks):
+    """Parse an XMLTV byte stream incrementally.
+
+    Yields each complete top-level element (<channel>, <programme>, ...) and
+    drops it from the tree once the caller is done with it, so memory use
+    does not grow with the size of the guide.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    root = None
+    depth = 0
+    for chunk in chunks:
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                yield element
+                root.clear()  # Release the element (and everything before it)
+    parser.close()
+
+
+def index_epg_stream(chunks, wanted_ids, now=None):
+    """Index a (optionally gzipped) XMLTV byte stream without building the full tree."""
+    return index_epg_elements(iter_xmltv_elements(iter_gunzip(chunks)), wanted_ids, now=now)
+
+
+def _escape_cdata(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _escape_attrib(text):
+    # Same escaping as ElementTree, so streamed files match the old tree.write() output
+    return (_escape_cdata(text).replace('"', "&quot;")
+            .replace("\r", "&#13;").replace("\n", "&#10;").replace("\t", "&#09;"))
+
+
+def _text_element(tag, text):
+    if not text:
+        return f"<{tag} />"
+    return f"<{tag}>{_escape_cdata(text)}</{tag}>"
+
+
+def _coalesce(pieces, chunk_size=OUTPUT_CHUNK_SIZE):
+    """Join small text pieces into chunks of roughly `chunk_size` characters."""
+    buffered = []
+    buffered_size = 0
+    for piece in pieces:
+        buffered.append(piece)
+        buffered_size += len(piece)
+        if buffered_size >= chunk_size:
+            yield "".join(buffered)
+            buffered = []
+            buffered_size = 0
+    if buffered:
+        yield "".join(buffered)
+
+
+def _iter_epg_xml_pieces(channels_data, epg_data_map):
+    yield "<?xml version='1.0' encoding='utf-8'?>\n<tv>"
+    for channel_info in channels_data:
+        tvg_id = str(channel_info.get("tvg_id"))
+        yield f'<channel id="{_escape_attrib(tvg_id)}">'
+        yield _text_element("display-name", channel_info.get("name", "Unknown Title"))
+        yield f'<icon src="{_escape_attrib(channel_info.get("logo_url") or "")}" /></channel>'
+        for program in epg_data_map.get(channel_info.get("tvg_id"), []):
+            yield (f'<programme channel="{_escape_attrib(tvg_id)}" start="{_escape_attrib(program.get("start_time") or "")}" '
+                   f'stop="{_escape_attrib(program.get("stop_time") or "")}">')
+            yield _text_element("title", program.get("title", ""))
+            if program.get("description"):
+                yield _text_element("desc", program["description"])
+            if program.get("icon"):
+                yield f'<icon src="{_escape_attrib(program["icon"])}" />'
+            yield "</programme>"
+    yield "</tv>"
+
+
+def iter_epg_xml(channels_data, epg_data_map):
+    """Yield the XMLTV guide as text chunks, programme by programme."""
+    return _coalesce(_iter_epg_xml_pieces(channels_data, epg_data_map))
+
+
+def _program_json(program):
+    return {
+        "start_time": program.get("start_time"),
+        "stop_time": program.get("stop_time"),
+        "title": program.get("title"),
+        "description": program.get("description"),
+        "icon": program.get("icon")
+    }
+
+
+def _iter_epg_json_pieces(channels_data, epg_data_map, compact):
+    if compact:
+        def encode(value, indent_prefix):
+            return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        separator, opening, closing, empty = ",", '{"channels":[', "]}", '{"channels":[]}'
+    else:
+        def encode(value, indent_prefix):
+            return indent_prefix + json.dumps(value, indent=4, ensure_ascii=False).replace("\n", "\n" + indent_prefix)
+        separator, opening, closing, empty = ",\n", '{\n    "channels": [\n', "\n    ]\n}", '{\n    "channels": []\n}'
+    if not channels_data:
+        yield empty
+        return
+
+    yield opening
+    for index, channel_info in enumerate(channels_data):
+        if index:
+            yield separator
+        programs = epg_data_map.get(channel_info.get("tvg_id"), [])
+        channel_head = {
+            "tvg_id": channel_info.get("tvg_id"),
+            "name": channel_info.get("name"),
+            "logo_url": channel_info.get("logo_url"),
+            "programs": []
+        }
+        encoded_head = encode(channel_head, " " * 8)
+        if not programs:
+            yield encoded_head
+            continue
+        # Open the (empty) programs list and stream its items one by one
+        list_closing = "]}" if compact else "]\n        }"
+        yield encoded_head[:-len(list_closing)]
+        for program_index, program in enumerate(programs):
+            if program_index:
+                yield separator
+            elif not compact:
+                yield "\n"
+            yield encode(_program_json(program), " " * 16)
+        yield "]}" if compact else "\n            ]\n        }"
+    yield closing
+
+
+def iter_epg_json(channels_data, epg_data_map, compact=False):
+    """Yield the JSON guide as text chunks, programme by programme.
+
+    The indented form is byte-identical to json.dump(..., indent=4) of the
+    whole {"channels": [...]} document; `compact` drops all whitespace.
+    """
+    return _coalesce(_iter_epg_json_pieces(channels_data, epg_data_map, compact))
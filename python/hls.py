@@ -0,0 +1,248 @@
+import re
+from urllib.parse import urljoin
+
+
+# One pass over an RFC 8216 attribute list: NAME=value pairs, where a value is
+# either a quoted string (which may contain commas) or an unquoted token.
+ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"\r\n]*"|[^",\s]*)')
+
+INTEGER_ATTRIBUTES = frozenset(["BANDWIDTH", "AVERAGE-BANDWIDTH", "PROGRAM-ID"])
+FLOAT_ATTRIBUTES = frozenset(["FRAME-RATE", "SCORE"])
+# Enumerated strings and resolutions are never quoted, whatever the source did
+UNQUOTED_ATTRIBUTES = frozenset(["RESOLUTION", "TYPE", "DEFAULT", "AUTOSELECT", "FORCED",
+                                 "HDCP-LEVEL", "VIDEO-RANGE", "METHOD", "IV"])
+QUOTED_ATTRIBUTES = frozenset([
+    "CODECS", "SUPPLEMENTAL-CODECS", "AUDIO", "VIDEO", "SUBTITLES", "CLOSED-CAPTIONS", "URI",
+    "GROUP-ID", "LANGUAGE", "ASSOC-LANGUAGE", "NAME", "STABLE-VARIANT-ID", "STABLE-RENDITION-ID",
+    "INSTREAM-ID", "CHARACTERISTICS", "CHANNELS", "PATHWAY-ID", "ALLOWED-CPC", "DATA-ID", "VALUE",
+    "KEYFORMAT", "KEYFORMATVERSIONS",
+])
+URI_ATTRIBUTE = "URI"
+
+STREAM_INF = "#EXT-X-STREAM-INF:"
+I_FRAME_STREAM_INF = "#EXT-X-I-FRAME-STREAM-INF:"
+MEDIA = "#EXT-X-MEDIA:"
+
+
+class QuotedString(str):
+    """A string attribute value that was quoted in the source playlist."""
+    __slots__ = ()
+
+
+def _typed_value(name, raw_value):
+    quoted = raw_value.startswith('"')
+    value = raw_value[1:-1] if quoted else raw_value
+    try:
+        if name in INTEGER_ATTRIBUTES:
+            return int(value)
+        if name in FLOAT_ATTRIBUTES:
+            return float(value)
+    except ValueError:
+        pass  # Keep malformed numbers as they came
+    if quoted and name not in UNQUOTED_ATTRIBUTES:
+        return QuotedString(value)
+    return value
+
+
+def parse_attribute_list(attributes_str):
+    """Parse `NAME=value,...` into a tuple of (name, typed value) pairs, in order."""
+    return tuple((name, _typed_value(name, raw_value)) for name, raw_value in ATTRIBUTE_RE.findall(attributes_str))
+
+
+def format_attribute_value(name, value):
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return f"{value:.3f}" if name == "FRAME-RATE" else repr(value)
+    if name in UNQUOTED_ATTRIBUTES or (name == "CLOSED-CAPTIONS" and value == "NONE"):
+        return value
+    if name in QUOTED_ATTRIBUTES or isinstance(value, QuotedString):
+        return f'"{value}"'
+    return value  # Unknown attribute that was unquoted in the source
+
+
+def format_attribute_list(attributes):
+    return ','.join(f"{name}={format_attribute_value(name, value)}" for name, value in attributes)
+
+
+class _Tagged:
+    __slots__ = ("attributes",)
+
+    def get(self, name, default=None):
+        for attribute_name, value in self.attributes:
+            if attribute_name == name:
+                return value
+        return default
+
+
+class Variant(_Tagged):
+    """One #EXT-X-STREAM-INF (or #EXT-X-I-FRAME-STREAM-INF) entry of a master playlist."""
+    __slots__ = ("uri", "bandwidth", "height", "iframe")
+
+    def __init__(self, uri, attributes, iframe=False):
+        self.uri = uri
+        self.attributes = attributes
+        self.iframe = iframe
+        self.bandwidth = self.get("BANDWIDTH", 0)
+        resolution = self.get("RESOLUTION")
+        try:
+            self.height = int(resolution.split('x', 1)[1]) if resolution else 0
+        except (IndexError, ValueError):
+            self.height = 0
+
+    def to_dict(self):
+        return {"url": self.uri, "attributes": dict(self.attributes)}
+
+    def __eq__(self, other):
+        return (isinstance(other, Variant) and self.uri == other.uri
+                and self.attributes == other.attributes and self.iframe == other.iframe)
+
+    def __repr__(self):
+        return f"Variant({self.uri!r}, bandwidth={self.bandwidth}, height={self.height})"
+
+
+class Rendition(_Tagged):
+    """One #EXT-X-MEDIA rendition (alternative audio, subtitles, ...)."""
+    __slots__ = ()
+
+    def __init__(self, attributes):
+        self.attributes = attributes
+
+    def to_dict(self):
+        return {"attributes": dict(self.attributes)}
+
+    def __eq__(self, other):
+        return isinstance(other, Rendition) and self.attributes == other.attributes
+
+    def __repr__(self):
+        return f"Rendition({self.get('TYPE')!r}, group={self.get('GROUP-ID')!r}, name={self.get('NAME')!r})"
+
+
+class MasterPlaylist:
+    __slots__ = ("tags", "renditions", "variants", "iframe_variants")
+
+    def __init__(self, tags=(), renditions=(), variants=(), iframe_variants=()):
+        self.tags = list(tags)  # Other playlist-level tag lines, kept verbatim
+        self.renditions = list(renditions)
+        self.variants = list(variants)
+        self.iframe_variants = list(iframe_variants)
+
+    def qualities(self):
+        """Variants in the {"url", "attributes"} shape used by the channel JSON files."""
+        return [variant.to_dict() for variant in self.variants]
+
+    def to_dict(self):
+        """JSON-serializable form. JSON strings cannot tell quoted from unquoted, so each entry
+        also lists the quoted attributes that format_attribute_value() would not quote by name."""
+        def with_quoted(entry):
+            return dict(entry.to_dict(), quoted=[name for name, value in entry.attributes
+                                                 if isinstance(value, QuotedString) and name not in QUOTED_ATTRIBUTES])
+        return {
+            "tags": self.tags,
+            "renditions": [with_quoted(rendition) for rendition in self.renditions],
+            "variants": [with_quoted(variant) for variant in self.variants],
+            "iframe_variants": [with_quoted(variant) for variant in self.iframe_variants],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a playlist from to_dict() output (e.g. a cached JSON copy)."""
+        def attributes_from(item):
+            quoted = frozenset(item.get("quoted", ()))
+            return tuple((name, QuotedString(value) if name in quoted or (name in QUOTED_ATTRIBUTES and isinstance(value, str)) else value)
+                         for name, value in item["attributes"].items())
+        return cls(
+            tags=data.get("tags", []),
+            renditions=[Rendition(attributes_from(item)) for item in data.get("renditions", [])],
+            variants=[Variant(item["url"], attributes_from(item)) for item in data.get("variants", [])],
+            iframe_variants=[Variant(item["url"], attributes_from(item), iframe=True)
+                             for item in data.get("iframe_variants", [])],
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, MasterPlaylist) and self.to_dict() == other.to_dict()
+
+
+# methods
+def resolve_uri(base_url, uri):
+    if uri.startswith(("https://", "http://")):
+        return uri  # Already absolute (the usual case); urljoin is the parser's main cost
+    return urljoin(base_url, uri)
+
+
+def _absolute_uri(attributes, base_url):
+    return tuple((name, QuotedString(resolve_uri(base_url, value)) if name == URI_ATTRIBUTE else value)
+                 for name, value in attributes)
+
+
+def parse_master_playlist(m3u8_content, base_url=""):
+    """Parse an HLS master playlist, resolving every URI against `base_url`.
+
+    Duplicate variant URLs are dropped, keeping the first occurrence.
+    """
+    playlist = MasterPlaylist()
+    seen_urls = set()
+    pending_attributes = None  # Attributes of a #EXT-X-STREAM-INF waiting for its URI line
+
+    for line in m3u8_content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if pending_attributes is not None and not line.startswith('#'):
+            absolute_url = resolve_uri(base_url, line)  # Resolve relative URLs
+            if absolute_url not in seen_urls:
+                playlist.variants.append(Variant(absolute_url, pending_attributes))
+                seen_urls.add(absolute_url)
+            pending_attributes = None
+        elif line.startswith(STREAM_INF):
+            pending_attributes = parse_attribute_list(line[len(STREAM_INF):])
+        elif line.startswith(MEDIA):
+            playlist.renditions.append(Rendition(_absolute_uri(parse_attribute_list(line[len(MEDIA):]), base_url)))
+        elif line.startswith(I_FRAME_STREAM_INF):
+            attributes = _absolute_uri(parse_attribute_list(line[len(I_FRAME_STREAM_INF):]), base_url)
+            variant = Variant(dict(attributes).get(URI_ATTRIBUTE, ""), attributes, iframe=True)
+            playlist.iframe_variants.append(variant)
+        elif line == "#EXTM3U" or not line.startswith("#EXT"):
+            continue  # Header and plain comments
+        else:
+            playlist.tags.append(line)  # EXT-X-VERSION, EXT-X-INDEPENDENT-SEGMENTS, EXT-X-SESSION-DATA, ...
+    return playlist
+
+
+def serialize_master_playlist(playlist):
+    lines = ["#EXTM3U"]
+    lines.extend(playlist.tags)
+    for rendition in playlist.renditions:
+        lines.append(f"{MEDIA}{format_attribute_list(rendition.attributes)}")
+    for variant in playlist.variants:
+        lines.append(f"{STREAM_INF}{format_attribute_list(variant.attributes)}")
+        lines.append(variant.uri)
+    for variant in playlist.iframe_variants:
+        lines.append(f"{I_FRAME_STREAM_INF}{format_attribute_list(variant.attributes)}")
+    return "\n".join(lines) + "\n"
+
+
+def summarize_media_playlist(m3u8_content, base_url=""):
+    """Return (target_duration, segment_count, last_segment_url) of a media playlist."""
+    target_duration = None
+    segment_count = 0
+    last_segment_url = None
+    expecting_segment = False
+    for line in m3u8_content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            try:
+                target_duration = int(line.split(':', 1)[1])
+            except ValueError:
+                pass
+        elif line.startswith("#EXTINF:"):
+            expecting_segment = True
+        elif expecting_segment and not line.startswith('#'):
+            segment_count += 1
+            last_segment_url = line
+            expecting_segment = False
+    if last_segment_url is not None:
+        last_segment_url = resolve_uri(base_url, last_segment_url)
+    return target_duration, segment_count, last_segment_url
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+
+from output import write_atomic
+
+
+CACHE_MAX_AGE = 7 * 24 * 3600  # Seconds an entry may go unused before it expires
+CACHE_MAX_BYTES = 256 * 1024 * 1024  # Total size of cached bodies and parsed results
+CHUNK_SIZE = 64 * 1024
+
+
+# methods
+def iter_file_chunks(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def decode_chunks(chunks):
+    return b''.join(chunks).decode('utf-8', errors='replace')
+
+
+def write_json_atomic(data, path):
+    write_atomic(path, lambda f: json.dump(data, f, ensure_ascii=False), text=True)
+
+
+class HTTPCache:
+    """Persistent on-disk cache for upstream downloads.
+
+    For every URL it remembers the ETag/Last-Modified validators, the SHA-256
+    of the body, the body itself and the parsed result. Each fetch is sent as
+    a conditional request; on 304, or on 200 with an identical body, the
+    parsed result from the previous run is reused instead of parsing again.
+    Entries unused for `max_age` seconds expire, and the least recently used
+    entries are evicted once the cache grows beyond `max_bytes`.
+    """
+
+    def __init__(self, directory, max_age=CACHE_MAX_AGE, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.reset_stats()
+        self._index_path = os.path.join(directory, "index.json")
+        os.makedirs(directory, exist_ok=True)
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}  # Missing or corrupt index: start cold
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {"not_modified": 0, "unchanged": 0, "misses": 0, "errors": 0, "bytes_downloaded": 0}
+
+    @property
+    def hits(self):
+        return self.stats["not_modified"] + self.stats["unchanged"]
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{key}.body"), os.path.join(self.directory, f"{key}.json")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _usable_entry(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is None or time.time() - entry["last_used"] > self.max_age:
+            return None
+        body_path, _ = self._paths(url)
+        return entry if os.path.exists(body_path) else None
+
+    def _reuse(self, url, entry, parse, parse_key):
+        body_path, parsed_path = self._paths(url)
+        if entry.get("parse_key") == parse_key:
+            try:
+                with open(parsed_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError):
+                pass  # Parsed copy lost: fall back to the cached body
+        return self._parse_and_store(url, entry, parse, parse_key, body_path, parsed_path)
+
+    def _parse_and_store(self, url, entry, parse, parse_key, body_path, parsed_path):
+        result = parse(iter_file_chunks(body_path))
+        if result is None:
+            entry.pop("parse_key", None)  # Nothing worth keeping
+        else:
+            write_json_atomic(result, parsed_path)
+            entry["parse_key"] = parse_key
+            entry["parsed_size"] = os.path.getsize(parsed_path)
+        return result
+
+    def fetch(self, session, url, parse, parse_key="", timeout=10):
+        """Return `parse(chunks)` for the body at `url`, reusing earlier work when unchanged.
+
+        `parse` receives an iterable of bytes chunks and must return a
+        JSON-serializable result. `parse_key` identifies any extra input the
+        parse depends on; a cached result is only reused for the same key.
+        """
+        entry = self._usable_entry(url)
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        body_path, parsed_path = self._paths(url)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            try:
+                with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                    if response.status_code == 304 and entry is not None:
+                        os.close(fd)
+                        fd = None
+                        self._count("not_modified")
+                        entry["last_used"] = time.time()
+                        return self._reuse(url, entry, parse, parse_key)
+                    response.raise_for_status()
+
+                    digest = hashlib.sha256()
+                    size = 0
+                    with os.fdopen(fd, 'wb') as f:
+                        fd = None
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            digest.update(chunk)
+                            size += len(chunk)
+                            f.write(chunk)
+                    validators = {
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified"),
+                    }
+            except requests.exceptions.RequestException:
+                self._count("errors")
+                raise
+            self._count("bytes_downloaded", size)
+
+            sha256 = digest.hexdigest()
+            if entry is not None and entry["sha256"] == sha256:
+                self._count("unchanged")
+                entry.update(validators, last_used=time.time())
+                return self._reuse(url, entry, parse, parse_key)
+
+            self._count("misses")
+            os.replace(tmp_path, body_path)
+            tmp_path = None
+            entry = dict(validators, sha256=sha256, size=size, last_used=time.time())
+            result = self._parse_and_store(url, entry, parse, parse_key, body_path, parsed_path)
+            with self._lock:
+                self._entries[url] = entry
+            return result
+        finally:
+            if fd is not None:
+                os.close(fd)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def save(self):
+        """Expire and evict entries, then persist the index."""
+        now = time.time()
+        with self._lock:
+            entries = sorted(self._entries.items(), key=lambda item: item[1]["last_used"], reverse=True)
+            kept = {}
+            total_bytes = 0
+            for url, entry in entries:  # Most recently used first
+                entry_bytes = entry["size"] + entry.get("parsed_size", 0)
+                if now - entry["last_used"] > self.max_age or total_bytes + entry_bytes > self.max_bytes:
+                    for path in self._paths(url):
+                        if os.path.exists(path):
+                            os.unlink(path)
+                    continue
+                kept[url] = entry
+                total_bytes += entry_bytes
+            self._entries = kept
+            write_json_atomic(kept, self._index_path)
+
+    def report(self):
+        requests_made = self.hits + self.stats["misses"]
+        return (f"HTTP cache: {self.hits}/{requests_made} hits "
+                f"({self.stats['not_modified']} not modified, {self.stats['unchanged']} unchanged body), "
+                f"{self.stats['misses']} misses, {self.stats['errors']} errors, "
+                f"{self.stats['bytes_downloaded'] / 1024:.1f} KiB downloaded")
+
+
+def local_path(url):
+    """Filesystem path for a file:// URL or a plain path, None for remote URLs."""
+    if url.startswith("file://"):
+        return url[len("file://"):]
+    return None if "://" in url else url
+
+
+def fetch_cached(cache, session, url, parse, parse_key="", timeout=10):
+    """Fetch `url` and parse it, through `cache` when one is configured.
+
+    Local paths and file:// URLs (e.g. fixtures) are read directly, never cached.
+    """
+    path = local_path(url)
+    if path is not None:
+        try:
+            return parse(iter_file_chunks(path))
+        except OSError as e:
+            raise requests.exceptions.RequestException(f"Cannot read {path}: {e}") from e
+    if cache is not None:
+        return cache.fetch(session, url, parse, parse_key=parse_key, timeout=timeout)
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        return parse(response.iter_content(chunk_size=CHUNK_SIZE))
@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+MAX_WORKERS = 16  # Requests in flight across all hosts
+MAX_PER_HOST = 4  # Requests in flight against a single host
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5  # Seconds, doubled on every retry
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+# methods
+def create_session(max_workers=MAX_WORKERS, retries=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF):
+    """Return a requests.Session with keep-alive pools sized for the worker pool
+    and automatic retries with exponential backoff on transient failures."""
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,  # Let raise_for_status() report the final status
+    )
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class HostLimiter:
+    """Caps the number of concurrent requests made against each host."""
+
+    def __init__(self, max_per_host=MAX_PER_HOST):
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            semaphore = self._semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+        return semaphore
+
+
+def fetch_concurrently(urls, fetch, max_workers=MAX_WORKERS, max_per_host=MAX_PER_HOST):
+    """Call `fetch(url)` for every url on a bounded worker pool.
+
+    Results come back in the same order as `urls`, whatever order the
+    requests finish in.
+    """
+    limiter = HostLimiter(max_per_host)
+
+    def limited_fetch(url):
+        with limiter.for_url(url):
+            return fetch(url)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(limited_fetch, urls))
@@ -0,0 +1,168 @@
+from urllib.parse import unquote_plus
+
+from probe import rank_channels_by_health
+
+
+NO_URL = "# no_url"
+AD_PARAMETER_PREFIX = "ads."  # MediaTailor ad-decision parameters (~1.5 KB per stream URL)
+# ads.* parameters that only target or track ads. The others stay: on stitched
+# endpoints ads.caid, ads.rakuten_rtv_content_id, ads.xumo_channelId... pick the channel.
+AD_TRACKING_PARAMETERS = tuple(AD_PARAMETER_PREFIX + name for name in (
+    "_fw_", "amzn", "app_", "appName", "brand_name", "content_classification", "content_url", "device_", "did=",
+    "gam_", "gdpr", "google_", "ifa_type", "os_language", "platform", "player_", "pod_type", "ppid", "streaming_id",
+    "user_type", "rakuten_content_type", "rakuten_device_", "rakuten_pod_type", "rakuten_streaming_id",
+    "rakuten_user_type", "tivo_", "xumo_ifa"))
+# Change on every session without selecting anything ("ads.rakuten_streaming_id", "ads_streaming_id", ...)
+SESSION_PARAMETER_SUFFIXES = ("streaming_id", "request_id", "correlator", "nonce")
+LANGUAGE_PARAMETERS = ("ads.rtv_content_language", "ads.rtv_language")
+PLAYLIST_OPTIONS = ("group", "language", "max_height", "strip_ads")
+
+
+# methods
+def strip_ad_parameters(url):
+    """Drop the ad targeting and tracking parameters from a stream URL, keeping everything else as is."""
+    base, has_query, rest = url.partition("?")
+    if not has_query or AD_PARAMETER_PREFIX not in rest:
+        return url
+    query, has_fragment, fragment = rest.partition("#")
+    query = "&".join(pair for pair in query.split("&") if not pair.startswith(AD_TRACKING_PARAMETERS))
+    return base + ("?" + query if query else "") + (has_fragment + fragment)
+
+
+def strip_session_parameters(url):
+    """Drop the per-session query parameters from a stream URL; what is left identifies the stream."""
+    base, has_query, rest = url.partition("?")
+    if not has_query:
+        return url
+    query, has_fragment, fragment = rest.partition("#")
+    query = "&".join(pair for pair in query.split("&") if not pair.partition("=")[0].endswith(SESSION_PARAMETER_SUFFIXES))
+    return base + ("?" + query if query else "") + (has_fragment + fragment)
+
+
+def channel_language(channel_info):
+    """Language code of a channel ("spa", "eng", ...), from its data or its stream URL."""
+    language = channel_info.get("language")
+    if language:
+        return language.lower()
+    query = (channel_info.get("stream_url") or "").partition("?")[2].partition("#")[0]
+    for name in LANGUAGE_PARAMETERS:
+        value = _query_parameter(query, name)
+        if value:
+            return value.lower()
+    return ""
+
+
+def _query_parameter(query, name):
+    # str.find instead of parse_qsl, which would unquote all ~60 ad parameters of every channel
+    prefix = f"{name}="
+    if query.startswith(prefix):
+        start = len(prefix)
+    else:
+        start = query.find(f"&{prefix}")
+        if start == -1:
+            return None
+        start += len(prefix) + 1
+    end = query.find("&", start)
+    return unquote_plus(query[start:] if end == -1 else query[start:end])
+
+
+def best_variant_url(qualities, max_height):
+    """URL of the highest variant no taller than `max_height`, or None."""
+    best = None
+    for quality in qualities:
+        try:
+            height = int(quality["attributes"]["RESOLUTION"].split("x", 1)[1])
+            bandwidth = int(quality["attributes"].get("BANDWIDTH", 0))
+        except (KeyError, IndexError, ValueError):
+            continue
+        if height <= max_height and (best is None or (height, bandwidth) > best[0]):
+            best = ((height, bandwidth), quality["url"])
+    return best[1] if best else None
+
+
+class _Entry:
+    __slots__ = ("extinf", "group", "language", "stream_url", "backup_url", "qualities")
+
+    def __init__(self, channel_info):
+        # The attribute part is shared by the (Original) and (Backup) lines and by every playlist variant
+        self.extinf = (f'#EXTINF:-1 tvg-id="{channel_info["tvg_id"]}" tvg-logo="{channel_info["logo_url"]}" '
+                       f'group-title="{channel_info["group_title"]}",{channel_info["name"]}')
+        self.group = channel_info["group_title"]
+        self.language = channel_language(channel_info)
+        self.stream_url = channel_info["stream_url"]
+        self.backup_url = channel_info.get("backup_master_url")
+        self.qualities = channel_info.get("qualities") or []
+
+
+class M3UPlaylist:
+    """Channel list prepared once and rendered into any number of M3U playlists.
+
+    Channels are ranked by health and their #EXTINF attributes formatted up
+    front; rendering is then a single linear pass that yields one chunk per
+    entry, so tailored playlists (one group, one language, a resolution cap,
+    ad-free URLs) cost no more than the main one.
+    """
+
+    def __init__(self, channels_data, epg_url):
+        self.header = f"#EXTM3U url-tvg=\"{epg_url}\"\n"
+        self._entries = [_Entry(channel_info) for channel_info in rank_channels_by_health(channels_data)]  # Dead channels dropped, slow ones last
+
+    def iter_chunks(self, group=None, language=None, max_height=None, strip_ads=False):
+        """Yield the playlist text entry by entry.
+
+        `group` and `language` keep only matching channels (case-insensitive
+        for the language). `max_height` points the original entry at the best
+        variant up to that height instead of the master playlist. `strip_ads`
+        removes the ad targeting and tracking parameters from stream URLs.
+        Duplicates are found on the channels' own URLs, never on rewritten ones.
+        """
+        language = language.lower() if language else None
+        seen_urls = set()
+        yield self.header
+        for entry in self._entries:
+            if (group is not None and entry.group != group) or (language is not None and entry.language != language):
+                continue
+            stream_url = entry.stream_url
+            lines = []
+            if stream_url and stream_url not in seen_urls and stream_url != NO_URL:
+                seen_urls.add(stream_url)
+                if max_height is not None:
+                    stream_url = best_variant_url(entry.qualities, max_height) or stream_url
+                if strip_ads:
+                    stream_url = strip_ad_parameters(stream_url)
+                lines.append(f"{entry.extinf} (Original)\n{stream_url}\n")
+            backup_url = entry.backup_url
+            if backup_url and backup_url not in seen_urls and backup_url != NO_URL:
+                lines.append(f"{entry.extinf} (Backup)\n{backup_url}\n")
+                seen_urls.add(backup_url)
+            if lines:
+                yield "".join(lines)
+
+    def render(self, **options):
+        return "".join(self.iter_chunks(**options))
+
+
+def parse_playlist_specs(spec):
+    """Parse "file.m3u:option=value,option;other.m3u:..." into [(filename, options)].
+
+    Options are group=<name>, language=<code>, max_height=<pixels> and the
+    flag strip_ads. Malformed parts raise ValueError.
+    """
+    playlists = []
+    for part in filter(None, (part.strip() for part in spec.split(";"))):
+        filename, _, option_text = part.partition(":")
+        options = {}
+        for option in filter(None, (option.strip() for option in option_text.split(","))):
+            name, has_value, value = option.partition("=")
+            if name not in PLAYLIST_OPTIONS:
+                raise ValueError(f"Unknown playlist option {name!r} in {part!r}")
+            if name == "strip_ads":
+                options[name] = not has_value or value.lower() in ("1", "true", "yes")
+            elif name == "max_height":
+                options[name] = int(value)
+            else:
+                options[name] = value
+        if not filename.strip().endswith(".m3u"):
+            raise ValueError(f"Playlist file name must end in .m3u: {filename!r}")
+        playlists.append((filename.strip(), options))
+    return playlists
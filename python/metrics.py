@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from output import write_atomic
+
+
+LOG_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+HISTORY_LIMIT = 1000  # Run reports kept in run-history.jsonl
+PROMETHEUS_PREFIX = "rakuten"
+
+logger = logging.getLogger(__name__)
+
+
+# methods
+def configure_logging(level=None):
+    """Log to stderr at `level` (a name such as "DEBUG"; defaults to $RAKUTEN_LOG_LEVEL or INFO)."""
+    level = (level or os.environ.get("RAKUTEN_LOG_LEVEL") or "INFO").upper()
+    logging.basicConfig(level=getattr(logging, level, logging.INFO), format=LOG_FORMAT)
+
+
+def _metric_name(name):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+
+class _TimedIterable:
+    """Adds the time spent producing each item of `iterable` to a span when exhausted.
+
+    With `inner` (another _TimedIterable feeding this one) only the time
+    spent in this stage itself is recorded, so the stages of a streaming
+    pipeline (read -> decompress -> parse) can be told apart.
+    """
+
+    def __init__(self, metrics, name, iterable, inner=None):
+        self.metrics = metrics
+        self.name = name
+        self.iterable = iterable
+        self.inner = inner
+        self.elapsed = 0.0
+
+    def __iter__(self):
+        iterator = iter(self.iterable)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.elapsed += time.perf_counter() - started
+                yield item
+        finally:
+            self.metrics.add_time(self.name, self.elapsed - (self.inner.elapsed if self.inner else 0.0))
+
+
+class Metrics:
+    """Timing spans and counters for one run (or one daemon refresh)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self._started = time.perf_counter()
+            self.spans = {}  # name -> seconds (summed when a stage runs several times)
+            self.counters = {}
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def update(self, counters, prefix=""):
+        for name, value in counters.items():
+            self.incr(f"{prefix}{name}", value)
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.add_time(name, seconds)
+            logger.debug("%s took %.3fs", name, seconds)
+
+    def timed(self, name, iterable, inner=None):
+        return _TimedIterable(self, name, iterable, inner)
+
+    def report(self):
+        with self._lock:
+            return {
+                "started_at": round(self.started_at, 3),
+                "duration_seconds": round(time.perf_counter() - self._started, 6),
+                "stages": {name: round(seconds, 6) for name, seconds in sorted(self.spans.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def to_prometheus(self, report=None):
+        """Render a report in the Prometheus text exposition format (for a textfile collector)."""
+        report = report or self.report()
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_run_timestamp_seconds Unix time the run started.",
+            f"# TYPE {PROMETHEUS_PREFIX}_run_timestamp_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_run_timestamp_seconds {report['started_at']}",
+            f"# HELP {PROMETHEUS_PREFIX}_run_duration_seconds Wall time of the run.",
+            f"# TYPE {PROMETHEUS_PREFIX}_run_duration_seconds gauge",
+            f"{PROMETHEUS_PREFIX}_run_duration_seconds {report['duration_seconds']}",
+            f"# HELP {PROMETHEUS_PREFIX}_stage_duration_seconds Wall time spent in each pipeline stage.",
+            f"# TYPE {PROMETHEUS_PREFIX}_stage_duration_seconds gauge",
+        ]
+        lines.extend(f'{PROMETHEUS_PREFIX}_stage_duration_seconds{{stage="{name}"}} {seconds}'
+                     for name, seconds in report["stages"].items())
+        for name, value in report["counters"].items():
+            metric = f"{PROMETHEUS_PREFIX}_{_metric_name(name)}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, directory):
+        """Write run-report.json and metrics.prom, and append the report to run-history.jsonl."""
+        report = self.report()
+        write_atomic(os.path.join(directory, "run-report.json"), lambda f: f.write(json.dumps(report, indent=2) + "\n"), text=True)
+        write_atomic(os.path.join(directory, "metrics.prom"), lambda f: f.write(self.to_prometheus(report)), text=True)
+        history_path = os.path.join(directory, "run-history.jsonl")
+        try:
+            with open(history_path, 'r', encoding='utf-8') as f:
+                history = f.readlines()[-(HISTORY_LIMIT - 1):]
+        except OSError:
+            history = []
+        history.append(json.dumps(report, separators=(",", ":")) + "\n")
+        write_atomic(history_path, lambda f: f.writelines(history), text=True)
+        return report
+
+
+metrics = Metrics()  # Shared by the pipeline stages of this process
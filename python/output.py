@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+
+
+# methods
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_atomic(path, write, text=False, mode=None):
+    """Write `path` through `write(f)` on a temporary file that is then renamed over it.
+
+    Readers never see a half-written file. When `write` returns False the
+    existing file is kept. The temporary file is removed whenever the file
+    is not replaced, errors included. Returns True when `path` was replaced.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w' if text else 'wb', encoding='utf-8' if text else None) as f:
+            replace = write(f) is not False
+        if replace:
+            if mode is not None:
+                os.chmod(tmp_path, mode)  # mkstemp creates 0600 files
+            os.replace(tmp_path, path)
+            return True
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    os.unlink(tmp_path)
+    return False
+
+
+def iter_gzip(chunks, level=9):
+    """Gzip a stream of str/bytes chunks incrementally.
+
+    zlib writes a gzip header without timestamp or file name, so the same
+    input always compresses to the same bytes and change detection still works.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class OutputWriter:
+    """Writes generated artifacts only when their content changed.
+
+    Each artifact is serialized by the caller, in memory or as a stream of
+    chunks, and compared with the SHA-256 of the file already on disk. The manifest remembers the hash
+    together with the file's size and mtime, so unchanged files are not even
+    re-read on the next run. Changed files are written with write_atomic(),
+    so readers never see a half-written artifact.
+    """
+
+    def __init__(self, base_directory, manifest_path=None):
+        self.base_directory = base_directory
+        self.manifest_path = manifest_path
+        self.reset_stats()
+        self.touched = set()  # Relative paths produced during this run
+        self._manifest = {}
+        if manifest_path:
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    self._manifest = json.load(f)
+            except (OSError, ValueError):
+                self._manifest = {}
+
+    def reset_stats(self):
+        self.stats = {"written": 0, "unchanged": 0, "deleted": 0, "bytes_written": 0}
+
+    def path_for(self, filename):
+        return os.path.join(self.base_directory, filename)
+
+    def _current_sha256(self, filename, file_path):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        known = self._manifest.get(filename)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["sha256"]
+        return file_sha256(file_path)
+
+    def write(self, filename, content):
+        """Write `content` (str or bytes) to `filename` unless it is already there.
+
+        Returns True when the file was (re)written.
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        file_path = self.path_for(filename)
+        self.touched.add(os.path.normpath(filename))
+        sha256 = hashlib.sha256(content).hexdigest()
+
+        if self._current_sha256(filename, file_path) == sha256:
+            self.stats["unchanged"] += 1
+            return False
+
+        write_atomic(file_path, lambda f: f.write(content), mode=0o644)
+
+        stat = os.stat(file_path)
+        self._manifest[filename] = {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        self.stats["written"] += 1
+        self.stats["bytes_written"] += len(content)
+        return True
+
+    def write_stream(self, filename, chunks):
+        """Like write(), but for content produced as a stream of str/bytes chunks.
+
+        The chunks go straight to a temporary file while being hashed, so
+        memory use does not depend on the size of the artifact. The file only
+        replaces the existing one when the hash differs.
+        """
+        file_path = self.path_for(filename)
+        self.touched.add(os.path.normpath(filename))
+        digest = hashlib.sha256()
+        size = 0
+
+        def write(f):
+            nonlocal size
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+            return self._current_sha256(filename, file_path) != digest.hexdigest()
+
+        if not write_atomic(file_path, write, mode=0o644):
+            self.stats["unchanged"] += 1
+            return False
+        sha256 = digest.hexdigest()
+
+        stat = os.stat(file_path)
+        self._manifest[filename] = {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        self.stats["written"] += 1
+        self.stats["bytes_written"] += size
+        return True
+
+    def forget(self, directories):
+        """Start over tracking what is written under `directories`, ahead of regenerating them."""
+        prefixes = tuple(os.path.normpath(directory) + os.sep for directory in directories)
+        self.touched = {filename for filename in self.touched if not filename.startswith(prefixes)}
+
+    def remove_stale(self, directories):
+        """Delete files under `directories` that were not written during this run."""
+        removed = []
+        for directory in directories:
+            root_path = self.path_for(directory)
+            for dirpath, dirnames, filenames in os.walk(root_path, topdown=False):
+                for name in filenames:
+                    file_path = os.path.join(dirpath, name)
+                    filename = os.path.relpath(file_path, self.base_directory)
+                    if os.path.normpath(filename) in self.touched:
+                        continue
+                    os.unlink(file_path)
+                    self._manifest.pop(filename, None)
+                    removed.append(filename)
+                if dirpath != root_path and not os.listdir(dirpath):
+                    os.rmdir(dirpath)  # e.g. master/<tvg_id>/ of a channel that is gone
+        self.stats["deleted"] += len(removed)
+        return removed
+
+    def save_manifest(self):
+        if not self.manifest_path:
+            return
+        write_atomic(self.manifest_path, lambda f: json.dump(self._manifest, f), text=True)
+
+    def report(self):
+        return (f"Output: {self.stats['written']} written, {self.stats['unchanged']} unchanged, "
+                f"{self.stats['deleted']} stale deleted, {self.stats['bytes_written'] / 1024:.1f} KiB written")
@@ -0,0 +1,111 @@
+import time
+
+import requests
+
+from hls import MasterPlaylist, summarize_media_playlist
+from http_client import fetch_concurrently
+
+
+PROBE_TIMEOUT = 5  # Seconds allowed for each media playlist or segment request
+SLOW_TTFB = 2.0  # Seconds to first byte above which a channel counts as slow
+SEGMENT_PROBE_BYTES = 1024  # Bytes requested from the newest segment
+
+STATUS_OK = "ok"
+STATUS_SLOW = "slow"
+STATUS_DEAD = "dead"
+
+
+# methods
+def probe_media_playlist(session, url, check_segment=True, timeout=PROBE_TIMEOUT):
+    """Fetch one variant's media playlist and report how reachable it is."""
+    result = {"url": url, "reachable": False, "ttfb_ms": None, "target_duration": None,
+              "segments": 0, "segment_ok": None, "error": None}
+    started = time.perf_counter()
+    try:
+        with session.get(url, stream=True, timeout=timeout) as response:
+            result["ttfb_ms"] = round((time.perf_counter() - started) * 1000, 1)  # Headers received
+            response.raise_for_status()
+            content = response.content.decode('utf-8', errors='replace')
+        target_duration, segment_count, last_segment_url = summarize_media_playlist(content, url)
+        result.update(target_duration=target_duration, segments=segment_count)
+
+        if check_segment and last_segment_url:
+            headers = {"Range": f"bytes=0-{SEGMENT_PROBE_BYTES - 1}"}
+            with session.get(last_segment_url, headers=headers, stream=True, timeout=timeout) as segment_response:
+                result["segment_ok"] = segment_response.status_code in (200, 206)
+                # Read the (ranged) body to its end so the connection goes back to the pool;
+                # a server that ignored the Range is cut off instead of downloaded in full
+                received = 0
+                for chunk in segment_response.iter_content(chunk_size=SEGMENT_PROBE_BYTES):
+                    received += len(chunk)
+                    if received > SEGMENT_PROBE_BYTES:
+                        break
+        result["reachable"] = segment_count > 0 and result["segment_ok"] is not False
+    except requests.exceptions.RequestException as e:
+        result["error"] = str(e)
+    return result
+
+
+def summarize_health(variant_results, slow_ttfb=SLOW_TTFB):
+    reachable = [result for result in variant_results if result["reachable"]]
+    if not reachable:
+        status = STATUS_DEAD
+        best_ttfb_ms = None
+    else:
+        best_ttfb_ms = min(result["ttfb_ms"] for result in reachable)
+        status = STATUS_SLOW if best_ttfb_ms > slow_ttfb * 1000 else STATUS_OK
+    return {
+        "status": status,
+        "best_ttfb_ms": best_ttfb_ms,
+        "reachable_variants": len(reachable),
+        "variants": variant_results,
+        "probed_at": int(time.time()),
+    }
+
+
+def stable_health(health):
+    """The part of a health dict that only changes when a stream breaks or recovers.
+
+    TTFB and probe times differ on every run; they belong in the health
+    report, not in files that are diffed and committed.
+    """
+    return {"status": health["status"], "reachable_variants": health["reachable_variants"]}
+
+
+def probe_masters(masters, session, check_segment=True, slow_ttfb=SLOW_TTFB):
+    """Probe every variant of every master concurrently.
+
+    Returns one health dict per master, in the same order as `masters`.
+    """
+    jobs = [(index, variant.uri) for index, master in enumerate(masters) for variant in master.variants]
+    results = fetch_concurrently([url for _, url in jobs],
+                                 lambda url: probe_media_playlist(session, url, check_segment))
+
+    variant_results = [[] for _ in masters]
+    for (index, _), result in zip(jobs, results):
+        variant_results[index].append(result)
+    return [summarize_health(channel_results, slow_ttfb) for channel_results in variant_results]
+
+
+def order_variants_by_health(master, health):
+    """Return a copy of `master` with unreachable variants last, the others in upstream order.
+
+    Response times are left out of the ordering: they jitter from run to run
+    and would reorder the published masters (and the rendition players start
+    on) every time.
+    """
+    reachable = {result["url"] for result in health["variants"] if result["reachable"]}
+    variants = sorted(master.variants, key=lambda variant: variant.uri not in reachable)  # Stable
+    return MasterPlaylist(master.tags, master.renditions, variants, master.iframe_variants)
+
+
+def rank_channels_by_health(channels_data):
+    """Playlist order: healthy (or unprobed) channels, then slow ones; dead ones are dropped."""
+    healthy = []
+    slow = []
+    for channel_info in channels_data:
+        status = channel_info.get('health', {}).get('status', STATUS_OK)
+        if status == STATUS_DEAD:
+            continue
+        (slow if status == STATUS_SLOW else healthy).append(channel_info)
+    return healthy + slow
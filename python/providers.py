@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+from epg import ChannelSchedule, as_schedule
+from m3u import NO_URL, strip_session_parameters
+
+
+DEFAULT_SOURCES = [{
+    "name": "rakuten-helmerluzo",
+    "w3u": "https://github.com/HelmerLuzo/RakutenTV_HL/raw/refs/heads/main/tv/w3u/RakutenTV_tv.w3u",
+    "epg": "https://helmerluzo.github.io/RakutenTV_HL/epg/RakutenTV.xml.gz",
+}]
+
+logger = logging.getLogger(__name__)
+
+
+class Source:
+    """One provider/market: a W3U channel list and, optionally, an XMLTV guide.
+
+    URLs may also be local paths or file:// URLs (fixtures). Sources are
+    listed in priority order: on duplicates the earlier source wins.
+    """
+    __slots__ = ("name", "w3u_url", "epg_url")
+
+    def __init__(self, name, w3u_url, epg_url=None):
+        self.name = name
+        self.w3u_url = w3u_url
+        self.epg_url = epg_url
+
+    @classmethod
+    def from_dict(cls, data, base_directory=None):
+        """Build a source from {"name", "w3u", "epg"}; relative local paths are resolved against `base_directory`."""
+        if not data.get("w3u"):
+            raise ValueError(f"Source without a w3u URL: {data!r}")
+
+        def resolve(url):
+            if url and base_directory and "://" not in url and not os.path.isabs(url):
+                return os.path.join(base_directory, url)
+            return url
+        return cls(data.get("name") or data["w3u"], resolve(data["w3u"]), resolve(data.get("epg")))
+
+    def to_dict(self):
+        return {"name": self.name, "w3u": self.w3u_url, "epg": self.epg_url}
+
+    def __repr__(self):
+        return f"Source({self.name!r})"
+
+
+# methods
+def read_config_sources(config_path):
+    """The "sources" list of rakuten_config.json, or None."""
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("sources") or None
+    except (OSError, ValueError, AttributeError) as e:
+        logger.debug("No sources read from %s: %s", config_path, e)
+        return None
+
+
+def load_sources(config_sources=None, environ=os.environ):
+    """Return the configured sources, in priority order.
+
+    $RAKUTEN_SOURCES wins: a JSON list of {"name", "w3u", "epg"} objects, or
+    the path of a file holding one. Otherwise `config_sources` (the
+    "sources" list of rakuten_config.json) is used, and without either the
+    single default HelmerLuzo source.
+    """
+    raw = environ.get("RAKUTEN_SOURCES", "").strip()
+    base_directory = None
+    if raw:
+        if not raw.startswith("["):
+            base_directory = os.path.dirname(os.path.abspath(raw))  # Fixture sets refer to their files relatively
+            with open(raw, 'r', encoding='utf-8') as f:
+                raw = f.read()
+        entries = json.loads(raw)
+    else:
+        entries = config_sources or DEFAULT_SOURCES
+    return [Source.from_dict(entry, base_directory) for entry in entries]
+
+
+def normalize_tvg_id(tvg_id):
+    return tvg_id.replace(" ", "-").lower()  # Same rule parse_w3u_playlist applies to epgId
+
+
+def stream_identity(stream_url):
+    """The stream URL without its per-session parameters: the same stream fetched in another session.
+
+    Only the session parameters go: on stitched endpoints many channels share
+    host and path and are told apart by their ads.* query parameters.
+    """
+    if not stream_url or stream_url == NO_URL:
+        return None
+    return strip_session_parameters(stream_url)
+
+
+def merge_channels(channel_lists, sources):
+    """Concatenate per-source channel lists, dropping channels an earlier source already has.
+
+    A channel is a duplicate when its normalized tvg_id or its stream (see
+    stream_identity) was seen in an earlier source. A source's own list is
+    kept whole, as it was before sources were merged. With several sources
+    each channel records where it came from.
+    """
+    merged = []
+    seen_ids = set()
+    seen_streams = set()
+    for source, channels_data in zip(sources, channel_lists):
+        duplicates = 0
+        source_ids = set()
+        source_streams = set()
+        for channel_info in channels_data or []:
+            tvg_id = normalize_tvg_id(channel_info['tvg_id'])
+            stream = stream_identity(channel_info['stream_url'])
+            if tvg_id in seen_ids or (stream is not None and stream in seen_streams):
+                duplicates += 1
+                continue
+            source_ids.add(tvg_id)
+            source_streams.add(stream)
+            channel_info['tvg_id'] = tvg_id
+            if len(sources) > 1:
+                channel_info['source'] = source.name
+            merged.append(channel_info)
+        seen_ids |= source_ids
+        seen_streams |= source_streams - {None}
+        if duplicates:
+            logger.info("%s: %d duplicate channels dropped", source.name, duplicates)
+    return merged
+
+
+def _overlaps(kept, start, stop):
+    # kept.starts is sorted and kept programmes never overlap each other, so
+    # only the neighbours of the insertion point can collide
+    index = kept.first_live_index(start)
+    return index < len(kept.starts) and kept.starts[index] < stop
+
+
+def merge_epg_maps(epg_maps):
+    """Merge per-source programme maps (priority order) into one.
+
+    For every channel the first source that has programmes for it is kept
+    as is. Later sources only fill the gaps: a programme is added when it
+    does not overlap anything already kept. Programmes come out sorted by
+    start time.
+    """
+    merged = {}
+    for epg_data_map in epg_maps:
+        for tvg_id, programs in epg_data_map.items():
+            tvg_id = normalize_tvg_id(tvg_id)
+            if not programs:
+                merged.setdefault(tvg_id, ChannelSchedule())
+                continue
+            schedule = as_schedule(programs)
+            kept = merged.get(tvg_id)
+            if not kept:
+                merged[tvg_id] = schedule
+                continue
+            additions = [item for item in schedule.timed() if not _overlaps(kept, item[0], item[1])]
+            if additions:
+                merged[tvg_id] = kept.with_programs(additions)
+    return merged
@@ -0,0 +1,74 @@
+import logging
+import signal
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+# methods
+def install_stop_handlers(stop_event, signals=(signal.SIGINT, signal.SIGTERM)):
+    """Make SIGINT/SIGTERM set `stop_event` instead of killing the process mid-write."""
+    def handle(signum, frame):
+        logger.info("Received %s, stopping after the current job", signal.Signals(signum).name)
+        stop_event.set()
+    for signum in signals:
+        signal.signal(signum, handle)
+
+
+class Job:
+    __slots__ = ("name", "interval", "function", "next_run")
+
+    def __init__(self, name, interval, function, next_run):
+        self.name = name
+        self.interval = interval
+        self.function = function
+        self.next_run = next_run
+
+
+class Scheduler:
+    """Runs named jobs, each on its own fixed interval, on the calling thread.
+
+    Jobs never overlap: when one runs long, the others simply start late,
+    and a late job runs once rather than catching up on every missed slot.
+    An exception in a job is reported and the job is retried on its next
+    slot, so one bad refresh never stops the loop.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.jobs = {}
+
+    def add(self, name, interval, function, delay=0):
+        self.jobs[name] = Job(name, interval, function, self.clock() + delay)
+
+    def defer(self, name):
+        """Push a job a full interval away, e.g. because another job just did its work."""
+        job = self.jobs[name]
+        job.next_run = self.clock() + job.interval
+
+    def run_pending(self):
+        """Run every job that is due, earliest first. Returns the names of the jobs that ran."""
+        ran = []
+        for job in sorted(self.jobs.values(), key=lambda job: job.next_run):
+            now = self.clock()
+            if job.next_run > now:
+                break
+            try:
+                job.function()
+            except Exception as e:
+                logger.exception("Job %s failed: %r", job.name, e)
+            ran.append(job.name)
+            job.next_run = max(job.next_run + job.interval, self.clock())  # No burst of catch-up runs
+        return ran
+
+    def run(self, stop_event=None):
+        """Run jobs until `stop_event` is set."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.run_pending()
+            if not self.jobs:
+                return
+            wait = min(job.next_run for job in self.jobs.values()) - self.clock()
+            stop_event.wait(max(wait, 0))
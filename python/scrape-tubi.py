@@ -1,272 +1,221 @@
+import argparse
+import asyncio
 import os
 import json
 import re
 import xml.etree.ElementTree as ET
 from urllib.parse import unquote
-from urllib.parse import urlparse, urlunparse, urljoin
+from urllib.parse import urlunparse
 from datetime import datetime, timedelta, timezone
 import unicodedata
 from typing import List
-import gzip
-import io
+import hashlib
+import logging
+import threading
+import time
+import zlib
 
 import requests
 from dotenv import load_dotenv
 from collections import namedtuple
 
+from epg import (build_epg_shards, epg_map_from_dict, epg_map_to_dict, index_epg_elements, iter_epg_json, iter_epg_xml,
+                 iter_gunzip, iter_xmltv_elements, prune_past_programmes)
+from http_cache import HTTPCache, decode_chunks, fetch_cached, write_json_atomic
+from hls import MasterPlaylist, parse_master_playlist, serialize_master_playlist
+from http_client import create_session, fetch_concurrently
+from m3u import M3UPlaylist, parse_playlist_specs
+from metrics import Metrics, configure_logging, metrics
+from output import OutputWriter, iter_gzip
+from probe import order_variants_by_health, probe_masters, stable_health
+from providers import load_sources, merge_channels, merge_epg_maps, read_config_sources
+from scheduler import Scheduler, install_stop_handlers
+from server import PlaylistServer, Resource, content_type_for
+from snapshot import build_snapshot
+
 # Load configuration
 load_dotenv()
 
+logger = logging.getLogger("scrape")
+
+REPO_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_ROOT = os.environ.get("RAKUTEN_CACHE_DIR", os.path.join(REPO_DIRECTORY, ".cache"))
+CACHE_DIRECTORY = os.path.join(CACHE_ROOT, "http")
+METRICS_DIRECTORY = os.environ.get("RAKUTEN_METRICS_DIR", CACHE_ROOT)  # run-report.json, metrics.prom, run-history.jsonl
+PROBE_STREAMS = os.environ.get("RAKUTEN_PROBE_STREAMS", "0") == "1"  # Opt-in stream health stage
+EPG_GZIP = os.environ.get("RAKUTEN_EPG_GZIP", "0") == "1"  # Also write rakuten_epg.xml.gz / rakuten_epg.json.gz
+EPG_COMPACT = os.environ.get("RAKUTEN_EPG_COMPACT", "0") == "1"  # No indentation in rakuten_epg.json
+# Opt-in binary snapshot of channels + EPG (rakuten_snapshot.bin). Off by default: a binary that changes
+# every hour would add a full copy to the repository history on each automated commit
+SNAPSHOT = os.environ.get("RAKUTEN_SNAPSHOT", "0") == "1"
+# Tailored playlists next to rakuten_playlist.m3u, e.g.
+# RAKUTEN_PLAYLISTS="rakuten_playlist_noads.m3u:strip_ads;rakuten_playlist_es_720p.m3u:language=spa,max_height=720"
+EXTRA_PLAYLISTS = parse_playlist_specs(os.environ.get("RAKUTEN_PLAYLISTS", ""))
+PER_CHANNEL_DIRECTORIES = ["json", "epg_json", "epg_shards", "master"]  # Regenerated in full on every run
+MASTER_CACHE_FORMAT = "quoted-1"  # Parse cache key of master playlists; change it when MasterPlaylist.to_dict() changes
+EPG_INDEX_FORMAT = "schedules-1"  # Part of the EPG parse cache key; change it when the cached index layout changes
+
+# Only artifacts whose content changed are rewritten (atomically)
+output_writer = OutputWriter(REPO_DIRECTORY, manifest_path=os.path.join(CACHE_ROOT, "output-manifest.json"))
+# Counters of the local server's on-demand work: live traffic stays out of the refresh reports
+serve_metrics = Metrics()
+
 
 # methods
-def fetch_w3u_playlist(url):
+def parse_w3u_playlist(w3u_content):
+    # W3U is like JSON inside a text file, need to parse it as JSON
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        w3u_content = response.text
-
-        # W3U is like JSON inside a text file, need to parse it as JSON
-        try:
-            # Find the JSON part within the W3U file (assuming it starts with '{' and ends with '}')
-            start_index = w3u_content.find('{')
-            end_index = w3u_content.rfind('}') + 1  # Include the closing '}'
-            if start_index != -1 and end_index > start_index:
-                json_string = w3u_content[start_index:end_index]
-                playlist_data = json.loads(json_string)
-            else:
-                print("Error: Could not find valid JSON content in W3U file.")
-                return None
-
-            channels_data = []
-            groups = playlist_data.get("groups", [])
-            for group in groups:
-                group_name = group.get("name", "No Group")
-                stations = group.get("stations", [])
-                for station in stations:
-                    channel_info = {
-                        "name": station.get("name", "No Name"),
-                        "tvg_id": station.get("epgId", station.get("name", "no_epg_id")).replace(" ", "-").lower(),  # Fallback and normalize
-                        "logo_url": station.get("image", ""),
-                        "group_title": group_name,
-                        "stream_url": station.get("url", ""),
-                        "qualities": []  # Initialize qualities list
-                    }
-                    channels_data.append(channel_info)
-            return channels_data
-
-        except json.JSONDecodeError as e:
-            print(f"JSONDecodeError parsing W3U content: {e}")
-            print("Problematic content:", w3u_content)  # Print content for debugging
+        # Find the JSON part within the W3U file (assuming it starts with '{' and ends with '}')
+        start_index = w3u_content.find('{')
+        end_index = w3u_content.rfind('}') + 1  # Include the closing '}'
+        if start_index != -1 and end_index > start_index:
+            json_string = w3u_content[start_index:end_index]
+            playlist_data = json.loads(json_string)
+        else:
+            logger.error("Could not find valid JSON content in W3U file.")
             return None
 
+        channels_data = []
+        groups = playlist_data.get("groups", [])
+        for group in groups:
+            group_name = group.get("name", "No Group")
+            stations = group.get("stations", [])
+            for station in stations:
+                channel_info = {
+                    "name": station.get("name", "No Name"),
+                    "tvg_id": station.get("epgId", station.get("name", "no_epg_id")).replace(" ", "-").lower(),  # Fallback and normalize
+                    "logo_url": station.get("image", ""),
+                    "group_title": group_name,
+                    "stream_url": station.get("url", ""),
+                    "qualities": []  # Initialize qualities list
+                }
+                channels_data.append(channel_info)
+        return channels_data
+
+    except json.JSONDecodeError as e:
+        logger.error("JSONDecodeError parsing W3U content: %s", e)
+        logger.debug("Problematic content: %s", w3u_content)  # Content for debugging
+        return None
+
+def fetch_w3u_playlist(url, session=None, cache=None):
+    http = session or requests
+    try:
+        return fetch_cached(cache, http, url, lambda chunks: parse_w3u_playlist(decode_chunks(chunks)))
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching W3U playlist from {url}: {e}")
+        logger.error("Error fetching W3U playlist from %s: %s", url, e)
+        metrics.incr("errors_w3u")
         return None
 
-def fetch_m3u8_qualities(master_url):
-    qualities = []
-    seen_urls = set()  # To track unique URLs
+def fetch_master_playlist(master_url, session=None, cache=None, run_metrics=metrics):
+    http = session or requests
     try:
-        response = requests.get(master_url, timeout=10)
-        response.raise_for_status()
-        m3u8_content = response.text
-        base_url = urlparse(master_url).geturl()  # Get base URL for resolving relative URLs
-
-        lines = m3u8_content.splitlines()
-        i = 0
-        while i < len(lines):
-            line = lines[i]
-            if line.startswith('#EXT-X-STREAM-INF'):
-                attributes_str = line[len('#EXT-X-STREAM-INF:'):]
-                attributes = {}
-                for attribute in attributes_str.split(','):
-                    if '=' in attribute:
-                        key, value = attribute.split('=', 1)
-                        attributes[key] = value.strip('"')
-                i += 1
-                if i < len(lines):
-                    url_line = lines[i]
-                    if url_line and not url_line.startswith('#'):
-                        absolute_url = urljoin(base_url, url_line)  # Resolve relative URLs
-                        if absolute_url not in seen_urls:  # Check if URL is already seen
-                            quality_info = {
-                                "url": absolute_url,
-                                "attributes": attributes
-                            }
-                            qualities.append(quality_info)
-                            seen_urls.add(absolute_url)  # Add URL to seen URLs set
-                    i += 1
+        master = fetch_cached(cache, http, master_url,
+                              lambda chunks: parse_master_playlist(decode_chunks(chunks), master_url).to_dict(),
+                              parse_key=MASTER_CACHE_FORMAT)
+        return MasterPlaylist.from_dict(master)
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching M3U8 playlist from {master_url}: {e}")
-    return qualities
+        logger.warning("Error fetching M3U8 playlist from %s: %s", master_url, e)
+        run_metrics.incr("errors_masters")
+        return MasterPlaylist()
+
+def fetch_m3u8_qualities(master_url, session=None, cache=None):
+    return fetch_master_playlist(master_url, session, cache).qualities()
 
 
-def fetch_epg_xml_data(url, channels_data): # Modified: Accept channels_data
-    epg_data_map = {}
+def fetch_all_master_playlists(master_urls, session=None, cache=None):
+    """Fetch every master playlist concurrently, keeping the input order."""
+    if session is None:
+        session = create_session()
+    return fetch_concurrently(master_urls, lambda master_url: fetch_master_playlist(master_url, session, cache))
+
+
+def index_epg_chunks(chunks, wanted_ids, now):
+    """index_epg_stream(), with the read, decompress, parse and index stages timed separately."""
+    started = time.perf_counter()
+    read = metrics.timed("epg.read", chunks)
+    decompressed = metrics.timed("epg.decompress", iter_gunzip(read), inner=read)
+    parsed = metrics.timed("epg.parse", iter_xmltv_elements(decompressed), inner=decompressed)
+    epg_data_map = index_epg_elements(parsed, wanted_ids, now=now)
+    metrics.add_time("epg.index", time.perf_counter() - started - parsed.elapsed)
+    return epg_data_map
+
+
+def fetch_epg_xml_data(url, channels_data, session=None, cache=None, now=None): # Modified: Accept channels_data
+    http = session or requests
+    if now is None:
+        now = datetime.now(timezone.utc)
     try:
-        response = requests.get(url, stream=True, timeout=10)  # stream=True for large gzip files
-        response.raise_for_status()
-
-        with gzip.GzipFile(fileobj=io.BytesIO(response.content)) as f:
-            xml_content = f.read()
-
-        root = ET.fromstring(xml_content)
-
-        for channel_info in channels_data: # Loop through channels_data
-            channel_epg_id_search = channel_info['tvg_id'].strip() # Normalize whitespace - strip()
-            epg_data_map[channel_epg_id_search] = [] # Initialize EPG data for each channel
-
-            channel_element_found = False
-            for channel_element in root.findall('channel'):
-                xml_channel_id = channel_element.get('id').strip() # Normalize whitespace - strip()
-                print(f"**DEBUG EPG - Comparing channel tvg_id: {channel_epg_id_search} with XML ID: {xml_channel_id}**") # DEBUG PRINT: Compare IDs
-                if xml_channel_id == channel_epg_id_search: # Check if XML channel ID matches current channel's tvg_id
-                    channel_element_found = True
-                    print(f"**DEBUG EPG - Channel Match Found in XML: {channel_epg_id_search} (XML ID: {xml_channel_id})**")
-                    for program_element in root.findall('programme'):
-                        if program_element.get('channel') == xml_channel_id: # Programs for the matched channel
-                            start_time_str = program_element.get('start')
-                            stop_time_str = program_element.get('stop')
-                            title_element = program_element.find('title')
-                            title_text = title_element.text if title_element is not None else "No Title"
-
-                            desc_element = program_element.find('desc') # Define desc_element here
-                            desc_text = desc_element.text if desc_element is not None else "No Description" # Define and initialize desc_text
-
-                            icon_element = program_element.find('icon') # Define icon_element here
-                            icon_src = icon_element.get('src') if icon_element is not None else None # Define and initialize icon_src
-
-
-                            try:
-                                # Parse time strings to datetime objects, assuming they include timezone info
-                                start_time = datetime.strptime(start_time_str, "%Y%m%d%H%M%S %z")
-                                stop_time = datetime.strptime(stop_time_str, "%Y%m%d%H%M%S %z")
-
-                                if stop_time > datetime.now(timezone.utc):  # Filter out past programs
-                                    epg_data_map[channel_epg_id_search].append({
-                                        "start_time": start_time_str,
-                                        "stop_time": stop_time_str,
-                                        "title": title_text,
-                                        "description": desc_text,
-                                        "icon": icon_src
-                                    })
-                                    print(f"  **DEBUG EPG - Program Added: {title_text}, Channel: {channel_epg_id_search}**") # Debug program addition
-                            except ValueError as e:
-                                print(f"  **DEBUG EPG - Error parsing time for program '{title_text}', Channel: {channel_epg_id_search}: {e}. Skipping program.**") # More specific error logging
-
-            if not channel_element_found:
-                print(f"**DEBUG EPG - No Channel Found in XML for tvg_id: {channel_epg_id_search}**") # Debug no channel found
-
-
-        return epg_data_map
+        # Single pass over the streamed guide, keeping only the channels we publish
+        wanted_ids = [channel_info['tvg_id'] for channel_info in channels_data]
+        wanted_key = hashlib.sha256("\n".join([EPG_INDEX_FORMAT] + wanted_ids).encode('utf-8')).hexdigest()
+        with metrics.span("epg.fetch"):
+            # Cached with the parsed start/stop epochs, so a reused index is never re-parsed
+            epg_data_map = epg_map_from_dict(fetch_cached(cache, http, url, lambda chunks: epg_map_to_dict(index_epg_chunks(chunks, wanted_ids, now)),
+                                                          parse_key=wanted_key))
+
+        # A cached index may have been built on an earlier run
+        with metrics.span("epg.prune"):
+            return prune_past_programmes(epg_data_map, now)
 
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching EPG XML from {url}: {e}")
+        logger.error("Error fetching EPG XML from %s: %s", url, e)
+        metrics.incr("errors_epg")
         return {}  # Return empty dict in case of error
     except ET.ParseError as e:
-        print(f"Error parsing EPG XML content: {e}")
+        logger.error("Error parsing EPG XML content: %s", e)
+        metrics.incr("errors_epg")
         return {}
-    except gzip.BadGzipFile as e:
-        print(f"Error decompressing gzip EPG file: {e}")
+    except zlib.error as e:
+        logger.error("Error decompressing gzip EPG file: %s", e)
+        metrics.incr("errors_epg")
         return {}
 
 
-def create_m3u_playlist(channels_data):
-    epg_url_m3u_header = "https://github.com/joaquinito2070/rakuten-m3u/raw/refs/heads/main/rakuten_epg.xml" # URL XML EPG M3U header - will be ignored as we are generating JSON EPG now
-    playlist = f"#EXTM3U url-tvg=\"{epg_url_m3u_header}\"\n" # Still include URL for potential compatibility, but JSON EPG will be used.
-    seen_urls = set()
-
-    for channel_info in channels_data:
-        channel_name = channel_info['name']
-        stream_url = channel_info['stream_url']
-        backup_master_url = channel_info['backup_master_url']
-        tvg_id = channel_info['tvg_id']
-        logo_url = channel_info['logo_url']
-        group_title = channel_info['group_title']
-
-        if stream_url and stream_url not in seen_urls and stream_url != "# no_url":
-            playlist += f'#EXTINF:-1 tvg-id="{tvg_id}" tvg-logo="{logo_url}" group-title="{group_title}",{channel_name} (Original)\n{stream_url}\n'
-            seen_urls.add(stream_url)
-        if backup_master_url and backup_master_url not in seen_urls and backup_master_url != "# no_url":
-            playlist += f'#EXTINF:-1 tvg-id="{tvg_id}" tvg-logo="{logo_url}" group-title="{group_title}",{channel_name} (Backup)\n{backup_master_url}\n'
-            seen_urls.add(backup_master_url)
-    return playlist
+EPG_URL_M3U_HEADER = "https://github.com/joaquinito2070/rakuten-m3u/raw/refs/heads/main/rakuten_epg.xml" # URL XML EPG M3U header - will be ignored as we are generating JSON EPG now
 
 def convert_to_xmltv_format(xmltv_time):
     return xmltv_time  # Already in XMLTV format from fetched EPG
 
-def create_epg_xml(channels_data, epg_data_map):
-    root = ET.Element("tv")
-
-    for channel_info in channels_data:
-        station = channel_info
-        channel = ET.SubElement(root, "channel", id=str(station.get("tvg_id")))
-        display_name = ET.SubElement(channel, "display-name")
-        display_name.text = station.get("name", "Unknown Title")
-
-        icon = ET.SubElement(channel, "icon", src=station.get("logo_url"))
-
-        channel_epg_id = station.get("tvg_id")
-        if channel_epg_id in epg_data_map:
-            for program in epg_data_map[channel_epg_id]:
-                programme = ET.SubElement(root, "programme", channel=str(station.get("tvg_id")))
-
-                start_time = program.get("start_time", "")
-                stop_time = program.get("stop_time", "")
-
-                programme.set("start", start_time)
-                programme.set("stop", stop_time)
-
-                title = ET.SubElement(programme, "title")
-                title.text = program.get("title", "")
-
-                if program.get("description"):
-                    desc = ET.SubElement(programme, "desc")
-                    desc.text = program.get("description", "")
-
-                program_icon_src = program.get("icon")  # Get program icon src from epg_data_map
-                if program_icon_src:  # Add icon only if src exists
-                    icon_element = ET.SubElement(programme, "icon", src=program_icon_src)
-
-
-    tree = ET.ElementTree(root)
-    return tree
-
 def save_file(content, filename):
-    script_directory = os.path.dirname(os.path.abspath(__file__))
-    parent_directory = os.path.dirname(script_directory)
-    file_path = os.path.join(parent_directory, filename)
-    os.makedirs(os.path.dirname(file_path), exist_ok=True) # Ensure directory exists
+    if output_writer.write(filename, content):
+        logger.debug("File saved: %s", output_writer.path_for(filename))
+
+@metrics.span("write.playlists")
+def save_m3u_playlists(channels_data, filename):
+    playlist = M3UPlaylist(channels_data, EPG_URL_M3U_HEADER)  # Prepared once, rendered for every variant
+    for playlist_filename, options in [(filename, {})] + EXTRA_PLAYLISTS:
+        if output_writer.write_stream(playlist_filename, playlist.iter_chunks(**options)):
+            logger.debug("M3U playlist saved: %s", output_writer.path_for(playlist_filename))
+
+@metrics.span("write.epg_xml")
+def save_epg_xml_stream(channels_data, epg_data_map, filename):
+    if output_writer.write_stream(filename, iter_epg_xml(channels_data, epg_data_map)):
+        logger.debug("EPG XML file saved: %s", output_writer.path_for(filename))
+    if EPG_GZIP:
+        if output_writer.write_stream(f"{filename}.gz", iter_gzip(iter_epg_xml(channels_data, epg_data_map))):
+            logger.debug("EPG XML file saved: %s.gz", output_writer.path_for(filename))
+
+@metrics.span("write.epg_json")
+def save_epg_json_stream(channels_data, epg_data_map, filename):
+    if output_writer.write_stream(filename, iter_epg_json(channels_data, epg_data_map, compact=EPG_COMPACT)):
+        logger.debug("EPG JSON file saved: %s", output_writer.path_for(filename))
+    if EPG_GZIP:
+        if output_writer.write_stream(f"{filename}.gz", iter_gzip(iter_epg_json(channels_data, epg_data_map, compact=True))):
+            logger.debug("EPG JSON file saved: %s.gz", output_writer.path_for(filename))
 
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(content)
-    print(f"File saved: {file_path}")
-
-def save_epg_to_file(tree, filename):
-    script_directory = os.path.dirname(os.path.abspath(__file__))
-    parent_directory = os.path.dirname(script_directory)
-    file_path = os.path.join(parent_directory, filename)
-    os.makedirs(os.path.dirname(file_path), exist_ok=True) # Ensure directory exists
+def save_json_output(data, filename):
+    if output_writer.write(filename, json.dumps(data, indent=4, ensure_ascii=False)):
+        logger.debug("JSON file saved: %s", output_writer.path_for(filename))
 
-    tree.write(file_path, encoding='utf-8', xml_declaration=True)
-    print(f"EPG XML file saved: {file_path}")
+@metrics.span("write.snapshot")
+def save_snapshot(channels_data, epg_data_map, filename):
+    if not SNAPSHOT:
+        return
+    if output_writer.write(filename, build_snapshot(channels_data, epg_data_map)):
+        logger.debug("Snapshot saved: %s", output_writer.path_for(filename))
 
-def save_json_output(data, filename):
-    script_directory = os.path.dirname(os.path.abspath(__file__))
-    parent_directory = os.path.dirname(script_directory)
-    file_path = os.path.join(parent_directory, filename)
-    os.makedirs(os.path.dirname(file_path), exist_ok=True) # Ensure directory exists
-
-    with open(file_path, 'w', encoding='utf-8') as file:
-        json.dump(data, file, indent=4, ensure_ascii=False)
-    print(f"JSON file saved: {file_path}")
-
-def create_channel_master_m3u8(qualities):
-    playlist_content = "#EXTM3U\n"
-    for quality in qualities:
-        attributes_str = ','.join([f'{k}="{v}"' for k, v in quality['attributes'].items()])
-        playlist_content += f'#EXT-X-STREAM-INF:{attributes_str}\n{quality["url"]}\n'
-    return playlist_content
+def create_channel_master_m3u8(master):
+    return serialize_master_playlist(master)
 
 def create_channel_json_data(channel_info, backup_master_url, json_url, epg_url): # Añadido epg_url
     channel_json = {
@@ -280,164 +229,443 @@ def create_channel_json_data(channel_info, backup_master_url, json_url, epg_url)
         "json_url": json_url, # Added json_url here
         "epg_url": epg_url # Usar directamente epg_url (URL del EPG JSON global) - **MODIFICADO AQUÍ**
     }
+    if 'health' in channel_info:
+        channel_json["health"] = channel_info['health']  # Only present when the probe stage ran; status fields only
     return channel_json
 
-def create_channel_epg_json_data(channel_info):
+def create_channel_epg_json_data(channel_info, epg=None, shards=None):
     channel_epg_json = {
         "name": channel_info['name'],
         "tvg_id": channel_info['tvg_id'],
-        "epg": channel_info.get('epg', []) # EPG data for the channel
+        "epg": channel_info.get('epg', []) if epg is None else epg # EPG data for the channel
     }
+    if shards is not None:
+        channel_epg_json["shards"] = shards  # URLs of the time-window shards
     return channel_epg_json
 
-# Nueva función para crear datos EPG en formato JSON
-def create_epg_json_data(channels_data, epg_data_map):
-    epg_json = {"channels": []}  # Estructura JSON principal
-
-    for channel_info in channels_data:
-        channel_epg_data = {
-            "tvg_id": channel_info.get("tvg_id"),
-            "name": channel_info.get("name"),
-            "logo_url": channel_info.get("logo_url"),
-            "programs": []
-        }
-
-        channel_epg_id = channel_info.get("tvg_id")
-        if channel_epg_id in epg_data_map:
-            for program in epg_data_map[channel_epg_id]:
-                program_data = {
-                    "start_time": program.get("start_time"),
-                    "stop_time": program.get("stop_time"),
-                    "title": program.get("title"),
-                    "description": program.get("description"),
-                    "icon": program.get("icon")
-                }
-                channel_epg_data["programs"].append(program_data)
-        epg_json["channels"].append(channel_epg_data)
-
-    return epg_json
+def create_channel_epg_shard_data(channel_info, shard_name, programs):
+    # No timestamp in here: a shard is only rewritten when its programmes change
+    return {
+        "name": channel_info['name'],
+        "tvg_id": channel_info['tvg_id'],
+        "shard": shard_name,
+        "programs": programs
+    }
 
+def save_epg_shards(channel_info, programs, now, github_base_url):
+    """Write the channel's time-window shards and return {shard name: URL}."""
+    shard_urls = {}
+    for shard_name, shard_programs in build_epg_shards(programs, now).items():
+        shard_filename = f"epg_shards/{channel_info['tvg_id']}/{shard_name}.json"
+        shard_data = create_channel_epg_shard_data(channel_info, shard_name, shard_programs)
+        # Compact: these are meant for clients that only want a few KB
+        if output_writer.write(shard_filename, json.dumps(shard_data, ensure_ascii=False, separators=(",", ":"))):
+            logger.debug("EPG shard saved: %s", output_writer.path_for(shard_filename))
+        shard_urls[shard_name] = f"{github_base_url}{shard_filename}"
+    return shard_urls
+
+
+OUTPUT_FILENAME_M3U = "rakuten_playlist.m3u"
+OUTPUT_FILENAME_EPG = "rakuten_epg.xml" # Archivo XML EPG (opcional, se puede comentar/eliminar si solo se necesita JSON EPG)
+OUTPUT_FILENAME_JSON = "rakuten_channels.json"
+OUTPUT_FILENAME_EPG_JSON = "rakuten_epg.json" # Nuevo archivo JSON EPG
+OUTPUT_FILENAME_RAKUTEN_JSON = "rakuten_json.json" # Archivo JSON con URLs de canales JSON
+OUTPUT_FILENAME_RAKUTEN_EPG_JSON_LIST = "rakuten_epg_json.json" # NUEVO archivo JSON con URLs de EPG JSON de canales
+OUTPUT_FILENAME_RAKUTEN_CONFIG_JSON = "rakuten_config.json" # NUEVO archivo JSON config con URLs de JSONs principales
+OUTPUT_FILENAME_HEALTH_REPORT = "stream-health.json" # Resultados completos de RAKUTEN_PROBE_STREAMS, en METRICS_DIRECTORY
+OUTPUT_FILENAME_SNAPSHOT = "rakuten_snapshot.bin" # Canales + EPG en un solo archivo binario (ver snapshot.py)
+GITHUB_BASE_URL = "https://raw.githubusercontent.com/joaquinito2070/rakuten-m3u/refs/heads/main/"
+EPG_JSON_URL = f"{GITHUB_BASE_URL}{OUTPUT_FILENAME_EPG_JSON}"  # URL para el archivo EPG JSON
+
+# Channel lists and guides to aggregate: $RAKUTEN_SOURCES, else "sources" in rakuten_config.json, else HelmerLuzo
+CONFIG_SOURCES = read_config_sources(os.path.join(REPO_DIRECTORY, OUTPUT_FILENAME_RAKUTEN_CONFIG_JSON))
+SOURCES = load_sources(CONFIG_SOURCES)
+
+# Daemon mode: how often each source is refreshed (seconds)
+W3U_INTERVAL = int(os.environ.get("RAKUTEN_W3U_INTERVAL", 3600))
+MASTER_INTERVAL = int(os.environ.get("RAKUTEN_MASTER_INTERVAL", 300))
+EPG_INTERVAL = int(os.environ.get("RAKUTEN_EPG_INTERVAL", 600))  # Conditional request: a 304 costs next to nothing
+SERVE_MASTER_TTL = int(os.environ.get("RAKUTEN_SERVE_MASTER_TTL", 10))  # --serve: seconds an on-demand master is reused
+
+
+def channel_filenames(channel_info):
+    """Return (channel JSON filename, channel EPG JSON filename) for a channel."""
+    channel_name_sanitized = "".join(c for c in channel_info['name'] if c.isalnum() or c == '_' or c == '-').lower()
+    channel_json_filename = f"json/{channel_name_sanitized}-{channel_info['tvg_id']}.json"  # Unique filename
+    channel_epg_json_filename = f"epg_json/{channel_name_sanitized}-{channel_info['tvg_id']}-epg.json"  # Unique filename for EPG JSON
+    return channel_json_filename, channel_epg_json_filename
+
+
+def has_stream(channel_info):
+    return bool(channel_info['stream_url']) and channel_info['stream_url'] != "# no_url"
+
+
+class ScrapeState:
+    """Everything one run builds, kept between refreshes in daemon mode."""
+
+    def __init__(self, session, cache):
+        self.session = session  # One pooled, keep-alive client for the whole run
+        self.cache = cache  # Conditional requests; reuses last run's results when unchanged
+        self.channels_data = []
+        self.masters_by_tvg_id = {}  # Parsed masters stay out of channels_data, which is dumped as JSON
+        self.stream_health = {}  # tvg_id -> full probe result (TTFB per variant), see save_health_report()
+        self.epg_data_map = {}
+        self.shard_time = None
+        self.channel_epg_shard_urls = {}
+        self.failed_sources = []  # Names of the sources whose W3U could not be fetched in the last load
+
+
+def load_channels(state):
+    """Fetch every source's W3U playlist in parallel and merge them. Returns True when the channel list changed."""
+    for source in SOURCES:
+        logger.info("Fetching W3U playlist from: %s", source.w3u_url)
+    with metrics.span("w3u.fetch"):
+        channel_lists = fetch_concurrently([source.w3u_url for source in SOURCES],
+                                           lambda url: fetch_w3u_playlist(url, state.session, state.cache))
+    failed = [source.name for source, channels_data in zip(SOURCES, channel_lists) if not channels_data]
+    if failed and (state.channels_data or len(failed) == len(SOURCES)):
+        # Better the previous list than dropping every channel of a source that is briefly down
+        logger.error("Failed to fetch W3U playlist: %s.", ", ".join(failed))
+        return False
+    if failed:
+        logger.error("Failed to fetch W3U playlist: %s. Continuing with the other sources.", ", ".join(failed))
+    state.failed_sources = failed
+    channels_data = merge_channels(channel_lists, SOURCES)
+    logger.info("Found %d channels in W3U playlist.", len(channels_data))
+    if [channel_info['stream_url'] for channel_info in channels_data] == [channel_info['stream_url'] for channel_info in state.channels_data] \
+            and all(new['name'] == old['name'] and new['tvg_id'] == old['tvg_id'] and new['logo_url'] == old['logo_url'] and new['group_title'] == old['group_title']
+                    for new, old in zip(channels_data, state.channels_data)):
+        return False
+    state.channels_data = channels_data
+    return True
+
+
+def load_masters(state):
+    """Fetch (and optionally probe) every master playlist, updating qualities and health."""
+    # Probe every master playlist up front, concurrently; results keep channels_data order
+    probed_channels = [channel_info for channel_info in state.channels_data if has_stream(channel_info)]
+    logger.info("Fetching qualities for %d channels", len(probed_channels))
+    with metrics.span("masters.fetch"):
+        probed_masters = fetch_all_master_playlists([channel_info['stream_url'] for channel_info in probed_channels], state.session, state.cache)
+    if PROBE_STREAMS:
+        # Optional health stage: one media playlist per variant, all channels concurrently
+        logger.info("Probing stream health for %d channels", len(probed_channels))
+        with metrics.span("masters.probe"):
+            probed_health = probe_masters(probed_masters, create_session(retries=0))  # Retries would skew TTFB
+        stream_health = {}
+        for channel_info, health in zip(probed_channels, probed_health):
+            channel_info['health'] = stable_health(health)
+            stream_health[channel_info['tvg_id']] = health
+        state.stream_health = stream_health  # Swapped in whole: the local server reads it from other threads
+        save_health_report(state)
+        probed_masters = [order_variants_by_health(master, health) for master, health in zip(probed_masters, probed_health)]
+    masters_by_tvg_id = {}
+    for channel_info, master in zip(probed_channels, probed_masters):
+        channel_info['qualities'] = master.qualities()
+        masters_by_tvg_id[channel_info['tvg_id']] = master
+        # Corrected line to use channel_info['tvg_id']
+        channel_info['backup_master_url'] = f"{GITHUB_BASE_URL}master/{channel_info['tvg_id']}/master.m3u8"
+    state.masters_by_tvg_id = masters_by_tvg_id  # Same: never seen half-filled
+
+
+def save_health_report(state):
+    """Write the full probe results next to the run report, out of the published (and committed) outputs."""
+    os.makedirs(METRICS_DIRECTORY, exist_ok=True)
+    write_json_atomic({"probed_at": int(time.time()), "channels": state.stream_health},
+                      os.path.join(METRICS_DIRECTORY, OUTPUT_FILENAME_HEALTH_REPORT))
+
+
+def load_epg(state, now):
+    """Fetch every source's EPG in parallel, merge and prune it to `now`. Returns True when the programme index changed."""
+    epg_urls = [source.epg_url for source in SOURCES if source.epg_url]
+    for epg_url in epg_urls:
+        logger.info("Fetching EPG data from: %s", epg_url)  # Usar epg_url_value
+    epg_maps = fetch_concurrently(epg_urls, lambda url: fetch_epg_xml_data(url, state.channels_data, state.session, state.cache, now=now)) # Modified: Pass channels_data to fetch_epg_xml_data
+    epg_data_map = epg_maps[0] if len(epg_maps) == 1 else merge_epg_maps(epg_maps)  # Overlaps resolved by source priority
+    if not epg_data_map and state.epg_data_map:
+        # Daemon mode: keep the guide we have, minus what has finished since
+        logger.warning("Failed to fetch or parse EPG data. Keeping the previous guide.")
+        epg_data_map = prune_past_programmes(state.epg_data_map, now)
+    elif not epg_data_map:
+        logger.warning("Failed to fetch or parse EPG data. Continuing without EPG.")
+        epg_data_map = {}  # Proceed without EPG if fetch fails
+    # Shard windows move by whole hours, so reruns within the hour produce identical files
+    shard_time = now.replace(minute=0, second=0, microsecond=0)
+    if epg_data_map == state.epg_data_map and shard_time == state.shard_time:
+        return False
+    state.epg_data_map = epg_data_map
+    state.shard_time = shard_time
+    metrics.incr("epg_programmes", sum(len(programs) for programs in epg_data_map.values()))
+    return True
+
+
+@metrics.span("write.masters")
+def save_master_outputs(state):
+    for channel_info in state.channels_data:
+        if has_stream(channel_info):
+            # Generate master.m3u8 for each channel
+            channel_master_m3u8_content = create_channel_master_m3u8(state.masters_by_tvg_id[channel_info['tvg_id']])
+            save_file(channel_master_m3u8_content, f"master/{channel_info['tvg_id']}/master.m3u8")
 
-def main():
-    w3u_url = "https://github.com/HelmerLuzo/RakutenTV_HL/raw/refs/heads/main/tv/w3u/RakutenTV_tv.w3u"
-    epg_url_value = "https://helmerluzo.github.io/RakutenTV_HL/epg/RakutenTV.xml.gz" # URL XML EPG original
-    output_filename_m3u = "rakuten_playlist.m3u"
-    output_filename_epg = "rakuten_epg.xml" # Archivo XML EPG (opcional, se puede comentar/eliminar si solo se necesita JSON EPG)
-    output_filename_json = "rakuten_channels.json"
-    output_filename_epg_json = "rakuten_epg.json" # Nuevo archivo JSON EPG
-    output_filename_rakuten_json = "rakuten_json.json" # Archivo JSON con URLs de canales JSON
-    output_filename_rakuten_epg_json_list = "rakuten_epg_json.json" # NUEVO archivo JSON con URLs de EPG JSON de canales
-    output_filename_rakuten_config_json = "rakuten_config.json" # NUEVO archivo JSON config con URLs de JSONs principales
-    github_base_url = "https://raw.githubusercontent.com/joaquinito2070/rakuten-m3u/refs/heads/main/"
 
+@metrics.span("write.channels")
+def save_channel_outputs(state):
+    """Per-channel JSON files, the playlists and the channel indexes (everything masters feed)."""
     channel_json_urls = []  # Inicializar la lista para guardar las URLs de los JSON de canal
-    channel_epg_json_urls = []  # Inicializar la lista para guardar las URLs de los JSON de EPG de canal
-
-    print(f"Fetching W3U playlist from: {w3u_url}")
-    channels_data = fetch_w3u_playlist(w3u_url)
-    if not channels_data:
-        print("Failed to fetch W3U playlist. Exiting.")
-        return
-
-    print(f"Found {len(channels_data)} channels in W3U playlist.")
-
-    for channel_info in channels_data:
-        master_url = channel_info['stream_url']
-        tvg_id = channel_info['tvg_id']
-
-        # Generate channel JSON filename and URL - se genera AQUI para tener la URL JSON siempre disponible
-        channel_name_sanitized = "".join(c for c in channel_info['name'] if c.isalnum() or c == '_' or c == '-').lower()
-        channel_json_filename = f"json/{channel_name_sanitized}-{channel_info['tvg_id']}.json"  # Unique filename
-        channel_json_url = f"{github_base_url}{channel_json_filename}"  # Construct JSON URL
-        channel_json_urls.append(channel_json_url)  # Añadir la URL del JSON del canal a la lista # SE AÑADE AQUI PARA TENERLO SIEMPRE
-
-        # Generate channel EPG JSON filename and URL
-        channel_epg_json_filename = f"epg_json/{channel_name_sanitized}-{channel_info['tvg_id']}-epg.json"  # Unique filename for EPG JSON
-        channel_epg_json_url = f"{github_base_url}{channel_epg_json_filename}"  # URL para el archivo EPG JSON de canal
-        channel_epg_json_urls.append(channel_epg_json_url)  # Añadir la URL del JSON de EPG del canal a la lista
-
-        if master_url and master_url != "# no_url":
-            print(f"**DEBUG - Channel Name: {channel_info['name']}, tvg_id: {channel_info['tvg_id']}**") # DEBUG PRINT using channel_info['tvg_id']
-            print(f"Fetching qualities for channel: {channel_info['name']} from {master_url}")
-            channel_info['qualities'] = fetch_m3u8_qualities(master_url)
+    for channel_info in state.channels_data:
+        channel_json_filename, _ = channel_filenames(channel_info)
+        channel_json_url = f"{GITHUB_BASE_URL}{channel_json_filename}"  # Construct JSON URL
+        channel_json_urls.append(channel_json_url)  # Añadir la URL del JSON del canal a la lista
+        backup_master_url = f"{GITHUB_BASE_URL}master/{channel_info['tvg_id']}/master.m3u8" # Using channel_info['tvg_id'] here as well to be extra sure
+        channel_json_data = create_channel_json_data(channel_info, backup_master_url, channel_json_url, EPG_JSON_URL) # MODIFICADO: Usar epg_json_url (URL del EPG JSON global)
+        save_json_output(channel_json_data, channel_json_filename)
 
-            # Generate master.m3u8 for each channel
-            channel_master_m3u8_content = create_channel_master_m3u8(channel_info['qualities'])
-            master_m3u8_filename = f"master/{tvg_id}/master.m3u8"
-            save_file(channel_master_m3u8_content, master_m3u8_filename)
+    # Crear el archivo rakuten_json.json con la lista de URLs de los JSON de canal
+    rakuten_json_content = {"channel_json_urls": channel_json_urls}  # Crear el contenido JSON con la lista de URLs de canal
+    save_json_output(rakuten_json_content, OUTPUT_FILENAME_RAKUTEN_JSON)  # Guardar rakuten_json.json
 
-            # Corrected line to use channel_info['tvg_id']
-            backup_master_url = f"{github_base_url}master/{channel_info['tvg_id']}/master.m3u8"
-            channel_info['backup_master_url'] = backup_master_url
+    # Crear el archivo rakuten_config.json con las URLs de rakuten_json.json y rakuten_epg_json.json
+    rakuten_config_data = {
+        "rakuten_json_url": f"{GITHUB_BASE_URL}{OUTPUT_FILENAME_RAKUTEN_JSON}",
+        "rakuten_epg_json_url": f"{GITHUB_BASE_URL}{OUTPUT_FILENAME_RAKUTEN_EPG_JSON_LIST}"
+    }
+    if SNAPSHOT:
+        rakuten_config_data["rakuten_snapshot_url"] = f"{GITHUB_BASE_URL}{OUTPUT_FILENAME_SNAPSHOT}"
+    if CONFIG_SOURCES:
+        rakuten_config_data["sources"] = CONFIG_SOURCES  # Hand-edited input: keep it
+    save_json_output(rakuten_config_data, OUTPUT_FILENAME_RAKUTEN_CONFIG_JSON) # Guardar rakuten_config.json
 
+    save_m3u_playlists(state.channels_data, OUTPUT_FILENAME_M3U)
+    save_json_output({"channels": state.channels_data, "epg_url": EPG_JSON_URL}, OUTPUT_FILENAME_JSON) # JSON principal con URL al archivo JSON EPG
 
-    print(f"Fetching EPG data from: {epg_url_value}")  # Usar epg_url_value
-    epg_data_map = fetch_epg_xml_data(epg_url_value, channels_data) # Modified: Pass channels_data to fetch_epg_xml_data
-    if not epg_data_map:
-        print("Failed to fetch or parse EPG data. Continuing without EPG.")
-        epg_data_map = {}  # Proceed without EPG if fetch fails
 
+@metrics.span("write.epg")
+def save_epg_outputs(state):
+    """The global EPG files, the per-channel EPG JSON files and their shards."""
     # Generar EPG en formato JSON y guardarlo
-    epg_json_data = create_epg_json_data(channels_data, epg_data_map)  # Crear datos EPG JSON
-    save_json_output(epg_json_data, output_filename_epg_json)  # Guardar archivo JSON EPG
-    epg_json_url = f"{github_base_url}{output_filename_epg_json}"  # URL para el archivo EPG JSON
-
-    # Integrate EPG data into channels_data for JSON output and use JSON EPG URL
-    current_time_utc_main = datetime.now(timezone.utc)  # Get current time in UTC for main function
-
-    for channel_info in channels_data:
-        # Estas líneas se eliminan para eliminar "epg" de rakuten_channels.json
-        # channel_epg_id = channel_info['tvg_id']
-        # channel_epg = epg_data_map.get(channel_epg_id, [])
-        # channel_info['epg'] = channel_epg # POPULATE channel_info['epg'] HERE!
+    save_epg_json_stream(state.channels_data, state.epg_data_map, OUTPUT_FILENAME_EPG_JSON)  # Streamed straight from the programme index
 
-        future_epg_programs = []  # List to hold future programs
-
-        # Generate channel JSON with correct epg_url - SE GENERA DE NUEVO AQUI PARA INCLUIR EPG URL INDIVIDUAL CORRECTA
-        backup_master_url = f"{github_base_url}master/{channel_info['tvg_id']}/master.m3u8" # Using channel_info['tvg_id'] here as well to be extra sure
-        channel_name_sanitized = "".join(c for c in channel_info['name'] if c.isalnum() or c == '_' or c == '-').lower()
-        channel_json_filename = f"json/{channel_name_sanitized}-{channel_info['tvg_id']}.json"  # Unique filename
-        channel_json_url = f"{github_base_url}{channel_json_filename}"  # Construct JSON URL
-
-        # Generate channel EPG JSON filename and URL - SE GENERA DE NUEVO AQUI PARA ASEGURAR URL INDIVIDUAL CORRECTA
-        channel_epg_json_filename = f"epg_json/{channel_name_sanitized}-{channel_info['tvg_id']}-epg.json"  # Unique filename for EPG JSON
-        channel_epg_json_url = f"{github_base_url}{channel_epg_json_filename}"  # URL para el archivo EPG JSON de canal - REUTILIZANDO VARIABLE PARA URL #REDUNDANT
-
-
-        channel_json_data = create_channel_json_data(channel_info, backup_master_url, channel_json_url, epg_json_url) # MODIFICADO: Usar epg_json_url (URL del EPG JSON global)
-        save_json_output(channel_json_data, channel_json_filename)
-
-        # Generate channel EPG JSON (individual channel EPG JSON - keep as is) - ESTO YA NO ES NECESARIO, PERO LO DEJAMOS PARA NO ROMPER NADA
-        channel_epg_json_data = create_channel_epg_json_data(channel_info)
-        # channel_epg_json_filename = f"epg_json/{channel_name_sanitized}-{channel_info['tvg_id']}-epg.json"  # Unique filename for EPG JSON #REDUNDANT
-        # channel_epg_json_url = f"{github_base_url}{channel_epg_json_filename}"  # URL para el archivo EPG JSON de canal - REUTILIZANDO VARIABLE PARA URL #REDUNDANT
-        save_json_output(channel_epg_json_data, channel_epg_json_filename) # YA SE GUARDA ANTES - NO VOLVER A GUARDAR
-
-
-    # Crear el archivo rakuten_json.json con la lista de URLs de los JSON de canal
-    rakuten_json_content = {"channel_json_urls": channel_json_urls}  # Crear el contenido JSON con la lista de URLs de canal
-    save_json_output(rakuten_json_content, output_filename_rakuten_json)  # Guardar rakuten_json.json
+    channel_epg_json_urls = []  # Inicializar la lista para guardar las URLs de los JSON de EPG de canal
+    state.channel_epg_shard_urls = {}
+    for channel_info in state.channels_data:
+        _, channel_epg_json_filename = channel_filenames(channel_info)
+        channel_epg_json_urls.append(f"{GITHUB_BASE_URL}{channel_epg_json_filename}")  # URL para el archivo EPG JSON de canal
+        channel_programs = state.epg_data_map.get(channel_info['tvg_id'], [])
+        shard_urls = save_epg_shards(channel_info, channel_programs, state.shard_time, GITHUB_BASE_URL)
+        state.channel_epg_shard_urls[channel_info['tvg_id']] = shard_urls
+        channel_epg_json_data = create_channel_epg_json_data(channel_info, channel_programs, shard_urls)
+        save_json_output(channel_epg_json_data, channel_epg_json_filename)
 
     # Crear el archivo rakuten_epg_json.json con la lista de URLs de los JSON de EPG de canal
-    rakuten_epg_json_list_content = {"channel_epg_json_urls": channel_epg_json_urls}  # Crear el contenido JSON con la lista de URLs de EPG JSON de canal
-    save_json_output(rakuten_epg_json_list_content, output_filename_rakuten_epg_json_list)  # Guardar rakuten_epg_json.json
-
-    # Crear el archivo rakuten_config.json con las URLs de rakuten_json.json y rakuten_epg_json.json
-    rakuten_config_data = {
-        "rakuten_json_url": f"{github_base_url}{output_filename_rakuten_json}",
-        "rakuten_epg_json_url": f"{github_base_url}{output_filename_rakuten_epg_json_list}"
+    rakuten_epg_json_list_content = {
+        "channel_epg_json_urls": channel_epg_json_urls,  # Crear el contenido JSON con la lista de URLs de EPG JSON de canal
+        "channel_epg_shard_urls": state.channel_epg_shard_urls  # tvg_id -> {"now", "next-6h", "YYYY-MM-DD": URL}
     }
-    save_json_output(rakuten_config_data, output_filename_rakuten_config_json) # Guardar rakuten_config.json
+    save_json_output(rakuten_epg_json_list_content, OUTPUT_FILENAME_RAKUTEN_EPG_JSON_LIST)  # Guardar rakuten_epg_json.json
+
+    save_epg_xml_stream(state.channels_data, state.epg_data_map, OUTPUT_FILENAME_EPG) # Archivo XML EPG - opcional, se puede comentar/eliminar
+
+
+def begin_refresh(state):
+    """Start a fresh run report: spans, counters and the writer/cache statistics."""
+    metrics.reset()
+    output_writer.reset_stats()
+    state.cache.reset_stats()
+
+
+def finish_refresh(state, prune_stale=False, stale_directories=PER_CHANNEL_DIRECTORIES):
+    if prune_stale:
+        # Drop per-channel files of channels that are no longer in the playlist (or shards of days that are over)
+        with metrics.span("write.prune"):
+            for filename in output_writer.remove_stale(stale_directories):
+                logger.debug("Stale file removed: %s", filename)
+    output_writer.save_manifest()
+    logger.info(output_writer.report())
+    state.cache.save()
+    logger.info(state.cache.report())
+
+    metrics.incr("channels", len(state.channels_data))
+    metrics.update(output_writer.stats, prefix="output_")
+    metrics.update(state.cache.stats, prefix="http_cache_")
+    report = metrics.write_report(METRICS_DIRECTORY)
+    slowest = sorted(report["stages"].items(), key=lambda item: item[1], reverse=True)[:3]
+    logger.info("Run took %.2fs; slowest stages: %s", report["duration_seconds"],
+                ", ".join(f"{name} {seconds:.2f}s" for name, seconds in slowest))
+
+
+def rebuild_all(state, now):
+    """Full generation: every source and every output, then stale files are pruned (unless a source was down)."""
+    output_writer.touched.clear()  # remove_stale keeps exactly what this generation writes
+    load_masters(state)
+    save_master_outputs(state)
+    load_epg(state, now)
+    save_epg_outputs(state)
+    save_channel_outputs(state)
+    save_snapshot(state.channels_data, state.epg_data_map, OUTPUT_FILENAME_SNAPSHOT)
+    if state.failed_sources:
+        # A source that is down for an hour must not have its per-channel files deleted (and the deletion committed)
+        logger.warning("Not pruning stale per-channel files: %s unavailable.", ", ".join(state.failed_sources))
+    finish_refresh(state, prune_stale=not state.failed_sources)
+
+
+def refresh_epg_outputs(state, now):
+    """Daemon EPG refresh: reload the guide and, when it changed, rewrite its outputs. Returns True when it did.
+
+    The guide is pruned to `now` even when upstream answered 304 (or not at
+    all), so every new hour rewrites the shards and the shards of days that
+    are over get removed.
+    """
+    if not load_epg(state, now):
+        return False
+    output_writer.forget(["epg_shards"])
+    save_epg_outputs(state)
+    save_snapshot(state.channels_data, state.epg_data_map, OUTPUT_FILENAME_SNAPSHOT)
+    finish_refresh(state, prune_stale=True, stale_directories=["epg_shards"])
+    return True
 
 
-    # Create M3U playlist and EPG files (original playlist files - XML and now also JSON EPG)
-    m3u_playlist = create_m3u_playlist(channels_data)
-    epg_tree = create_epg_xml(channels_data, epg_data_map)  # Archivo XML EPG - opcional, se puede comentar/eliminar
-    # Save files (original playlist files)
-    save_file(m3u_playlist, output_filename_m3u)
-    save_epg_to_file(epg_tree, output_filename_epg) # Archivo XML EPG - opcional, se puede comentar/eliminar
-    save_json_output({"channels": channels_data, "epg_url": epg_json_url }, output_filename_json) # JSON principal con URL al archivo JSON EPG
+def main():
+    run_now = datetime.now(timezone.utc)  # One "now" for the whole run: EPG pruning and shard windows agree
+    configure_logging()
+    state = ScrapeState(create_session(), HTTPCache(CACHE_DIRECTORY))
+    if not load_channels(state):
+        logger.error("Exiting.")
+        state.cache.save()
+        metrics.write_report(METRICS_DIRECTORY)  # A failed run is worth alerting on too
+        return
+    rebuild_all(state, run_now)
+
+
+def publish_outputs(server, state, public_url, epg=True):
+    """Hand the in-memory model to the local server as pre-encoded resources."""
+    # Backup entries point at this server, which rebuilds masters from a fresh upstream fetch
+    local_channels = [dict(channel_info, backup_master_url=f"{public_url}master/{channel_info['tvg_id']}/master.m3u8")
+                      if 'backup_master_url' in channel_info else channel_info
+                      for channel_info in state.channels_data]
+    playlist = M3UPlaylist(local_channels, f"{public_url}{OUTPUT_FILENAME_EPG}")
+    resources = {}
+    for playlist_filename, options in [(OUTPUT_FILENAME_M3U, {})] + EXTRA_PLAYLISTS:
+        resources[f"/{playlist_filename}"] = Resource(playlist.render(**options), content_type_for(playlist_filename))
+    if epg:
+        resources[f"/{OUTPUT_FILENAME_EPG}"] = Resource("".join(iter_epg_xml(state.channels_data, state.epg_data_map)),
+                                                        content_type_for(OUTPUT_FILENAME_EPG))
+        resources[f"/{OUTPUT_FILENAME_EPG_JSON}"] = Resource("".join(iter_epg_json(state.channels_data, state.epg_data_map, compact=EPG_COMPACT)),
+                                                             content_type_for(OUTPUT_FILENAME_EPG_JSON))
+    server.publish(resources)
+
+
+def load_fresh_master(state, tvg_id):
+    """Master playlist text for the local server, fetched from upstream right now."""
+    channel_info = next((channel_info for channel_info in state.channels_data if channel_info['tvg_id'] == tvg_id), None)
+    if channel_info is None or not has_stream(channel_info):
+        return None
+    master = fetch_master_playlist(channel_info['stream_url'], state.session, run_metrics=serve_metrics)  # Bypasses the disk cache on purpose
+    if not master.variants:
+        master = state.masters_by_tvg_id.get(tvg_id)  # Upstream failed: last known master beats a 404
+        if master is None:
+            return None
+    if tvg_id in state.stream_health:
+        master = order_variants_by_health(master, state.stream_health[tvg_id])
+    return create_channel_master_m3u8(master)
+
+
+async def serve_until_stopped(server, host, port, stop_event):
+    bound_host, bound_port = await server.start(host, port)
+    logger.info("Serving playlists, masters and EPG on http://%s:%s/", bound_host, bound_port)
+    await asyncio.get_running_loop().run_in_executor(None, stop_event.wait)
+    await server.close()
+
+
+WILDCARD_HOSTS = ("", "0.0.0.0", "::", "[::]")  # Bind addresses no player can connect to
+
+
+def serve_public_url(serve_address, public_url=None):
+    """Base URL written into the served playlists; a wildcard bind address needs an explicit one."""
+    host, _, port = serve_address.rpartition(":")
+    if public_url:
+        return public_url if public_url.endswith("/") else f"{public_url}/"
+    if host in WILDCARD_HOSTS:
+        raise ValueError(f"--serve {serve_address} listens on every interface; "
+                         f"pass --public-url with the address players use to reach it (e.g. http://192.168.1.10:{port}/)")
+    return f"http://{host}:{port}/"
+
+
+def run_daemon(serve_address=None, public_url=None):
+    """Keep channels, EPG index and connections in memory and refresh each source on its own schedule.
+
+    With `serve_address` ("host:port") the outputs are also served over HTTP
+    from memory, with the backup masters rebuilt on demand.
+    """
+    configure_logging()
+    state = ScrapeState(create_session(), HTTPCache(CACHE_DIRECTORY))
+    scheduler = Scheduler()
+    server = None
+    if serve_address is not None:
+        host, _, port = serve_address.rpartition(":")
+        public_url = serve_public_url(serve_address, public_url)
+        server = PlaylistServer(lambda tvg_id: load_fresh_master(state, tvg_id), master_ttl=SERVE_MASTER_TTL)
+
+    def refresh_channels():
+        begin_refresh(state)
+        if load_channels(state):
+            rebuild_all(state, datetime.now(timezone.utc))
+            scheduler.defer("masters")  # Just refreshed as part of the rebuild
+            scheduler.defer("epg")
+            if server is not None:
+                publish_outputs(server, state, public_url)
+
+    def refresh_masters():
+        if not state.channels_data:
+            return
+        begin_refresh(state)
+        load_masters(state)  # Fresh ad-session variant URLs for the backup masters
+        save_master_outputs(state)
+        save_channel_outputs(state)
+        save_snapshot(state.channels_data, state.epg_data_map, OUTPUT_FILENAME_SNAPSHOT)
+        finish_refresh(state)
+        if server is not None:
+            publish_outputs(server, state, public_url, epg=False)
+
+    def refresh_epg():
+        begin_refresh(state)
+        if state.channels_data and refresh_epg_outputs(state, datetime.now(timezone.utc)):
+            if server is not None:
+                publish_outputs(server, state, public_url)
+
+    scheduler.add("channels", W3U_INTERVAL, refresh_channels)
+    scheduler.add("masters", MASTER_INTERVAL, refresh_masters, delay=MASTER_INTERVAL)
+    scheduler.add("epg", EPG_INTERVAL, refresh_epg, delay=EPG_INTERVAL)
+
+    stop_event = threading.Event()
+    install_stop_handlers(stop_event)
+    logger.info("Daemon started: W3U every %ss, masters every %ss, EPG checked every %ss", W3U_INTERVAL, MASTER_INTERVAL, EPG_INTERVAL)
+    if server is None:
+        scheduler.run(stop_event)
+    else:
+        refresher = threading.Thread(target=scheduler.run, args=(stop_event,), name="refresher", daemon=True)
+        refresher.start()
+        asyncio.run(serve_until_stopped(server, host, int(port), stop_event))
+        refresher.join()
+    state.cache.save()
+    output_writer.save_manifest()
+    if server is not None:
+        logger.info("Served %d requests, %d upstream master fetches (%d failed).", server.stats["requests"],
+                    server.stats["master_fetches"], serve_metrics.counters.get("errors_masters", 0))
+    logger.info("Daemon stopped.")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate the Rakuten TV playlists, channel files and EPG.")
+    parser.add_argument("--daemon", action="store_true", help="keep running and refresh each source on its own schedule")
+    parser.add_argument("--serve", metavar="HOST:PORT", help="daemon mode, also serving the outputs over HTTP (e.g. 0.0.0.0:8080)")
+    parser.add_argument("--public-url", help="base URL players use to reach --serve (default: http://HOST:PORT/; required when HOST is 0.0.0.0 or ::)")
+    args = parser.parse_args()
+    if args.serve:
+        try:
+            serve_public_url(args.serve, args.public_url)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.daemon or args.serve:
+        run_daemon(args.serve, args.public_url)
+    else:
+        main()
@@ -0,0 +1,224 @@
+import asyncio
+import gzip
+import hashlib
+import logging
+import time
+
+
+MASTER_TTL = 10  # Seconds an on-demand master playlist is served before it is fetched again
+MAX_HEADER_BYTES = 64 * 1024
+IDLE_TIMEOUT = 60  # Seconds a keep-alive connection may wait for its next request
+GZIP_MIN_BYTES = 512  # Smaller bodies are not worth compressing
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 502: "Bad Gateway"}
+
+CONTENT_TYPES = {
+    ".m3u": "audio/x-mpegurl; charset=utf-8",
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".xml": "application/xml; charset=utf-8",
+    ".json": "application/json; charset=utf-8",
+}
+
+
+logger = logging.getLogger(__name__)
+
+
+# methods
+def content_type_for(path):
+    for extension, content_type in CONTENT_TYPES.items():
+        if path.endswith(extension):
+            return content_type
+    return "application/octet-stream"
+
+
+def accepts_gzip(accept_encoding):
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
+
+
+def _head(status, headers):
+    lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+    lines.extend(f"{name}: {value}" for name, value in headers)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+class Resource:
+    """A response body encoded once, with its gzip twin and ready-made header blocks.
+
+    Serving a request is then a dict lookup and a socket write: no
+    serialization, no compression and no hashing per request.
+    """
+    __slots__ = ("etag", "body", "gzip_body", "gzip_etag", "_heads")
+
+    def __init__(self, content, content_type, cache_control="no-cache"):
+        body = content.encode("utf-8") if isinstance(content, str) else content
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.gzip_body = None
+        self.gzip_etag = None
+        if len(body) >= GZIP_MIN_BYTES:
+            self.gzip_body = gzip.compress(body, compresslevel=6, mtime=0)
+            self.gzip_etag = self.etag[:-1] + '-gz"'  # A strong ETag names one representation
+        self._heads = {}
+        for gzipped in (False, True) if self.gzip_body is not None else (False,):
+            etag = self.gzip_etag if gzipped else self.etag
+            body_length = len(self.gzip_body if gzipped else body)
+            common = [("ETag", etag), ("Cache-Control", cache_control)]
+            if self.gzip_body is not None:
+                common.append(("Vary", "Accept-Encoding"))
+            for keep_alive in (True, False):
+                connection = ("Connection", "keep-alive" if keep_alive else "close")
+                ok = [("Content-Type", content_type), ("Content-Length", body_length)] + common
+                if gzipped:
+                    ok.append(("Content-Encoding", "gzip"))
+                self._heads[(200, gzipped, keep_alive)] = _head(200, ok + [connection])
+                self._heads[(304, gzipped, keep_alive)] = _head(304, common + [connection])
+
+    def response(self, if_none_match, gzip_ok, keep_alive, head_only=False):
+        gzipped = gzip_ok and self.gzip_body is not None
+        etag = self.gzip_etag if gzipped else self.etag
+        if if_none_match and etag_matches(if_none_match, etag):
+            return self._heads[(304, gzipped, keep_alive)]
+        head = self._heads[(200, gzipped, keep_alive)]
+        if head_only:
+            return head
+        return head + (self.gzip_body if gzipped else self.body)
+
+
+def error_response(status, keep_alive, message=None):
+    body = (message or REASONS[status]).encode("utf-8") + b"\n"
+    headers = [("Content-Type", "text/plain; charset=utf-8"), ("Content-Length", len(body)),
+               ("Connection", "keep-alive" if keep_alive else "close")]
+    if status == 405:
+        headers.append(("Allow", "GET, HEAD"))
+    return _head(status, headers) + body
+
+
+class PlaylistServer:
+    """Minimal asyncio HTTP/1.1 server for the generated playlists, masters and EPG.
+
+    Static artifacts are published as pre-encoded Resources (from any thread,
+    see publish()). Paths under /master/ are built on demand by
+    `master_loader(tvg_id)`, a blocking function that returns the playlist
+    text or None; its results are kept for `master_ttl` seconds and concurrent
+    requests for the same channel share one upstream fetch.
+    """
+
+    def __init__(self, master_loader=None, master_ttl=MASTER_TTL, clock=time.monotonic):
+        self.master_loader = master_loader
+        self.master_ttl = master_ttl
+        self.clock = clock
+        self.stats = {"requests": 0, "not_modified": 0, "master_fetches": 0}
+        self._resources = {}
+        self._masters = {}  # tvg_id -> (expires_at, Resource or None)
+        self._pending_masters = {}  # tvg_id -> Future of an upstream fetch in progress
+        self._loop = None
+        self._server = None
+        self._connections = {}  # Open connection writer -> its handler task; close() ends them all
+
+    def publish(self, resources):
+        """Replace the static resources with {path: Resource}; callable from any thread."""
+        if self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._resources.update, resources)
+        else:
+            self._resources.update(resources)
+
+    async def start(self, host, port):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            handlers = list(self._connections.values())
+            for writer in list(self._connections):
+                writer.close()  # Idle keep-alive clients would otherwise hold the server open
+            await asyncio.gather(*handlers, return_exceptions=True)  # wait_closed() only waits for them since 3.12
+            await self._server.wait_closed()
+
+    async def _master_resource(self, tvg_id):
+        cached = self._masters.get(tvg_id)
+        if cached is not None and cached[0] > self.clock():
+            return cached[1]
+        pending = self._pending_masters.get(tvg_id)
+        if pending is None:
+            pending = self._loop.run_in_executor(None, self.master_loader, tvg_id)
+            self._pending_masters[tvg_id] = pending
+            self.stats["master_fetches"] += 1
+        try:
+            content = await asyncio.shield(pending)
+        finally:
+            self._pending_masters.pop(tvg_id, None)
+        resource = None
+        if content is not None:
+            resource = Resource(content, content_type_for(".m3u8"), cache_control=f"max-age={self.master_ttl}")
+        self._masters[tvg_id] = (self.clock() + self.master_ttl, resource)
+        return resource
+
+    async def _respond(self, method, path, headers, keep_alive):
+        if method not in ("GET", "HEAD"):
+            return error_response(405, keep_alive)
+        path = path.split("?", 1)[0]
+        resource = self._resources.get(path)
+        if resource is None and self.master_loader is not None and path.startswith("/master/") and path.endswith("/master.m3u8"):
+            tvg_id = path[len("/master/"):-len("/master.m3u8")]
+            if tvg_id and "/" not in tvg_id:
+                try:
+                    resource = await self._master_resource(tvg_id)
+                except Exception as e:
+                    logger.warning("Error building master for %s: %r", tvg_id, e)
+                    return error_response(502, keep_alive)
+        if resource is None:
+            return error_response(404, keep_alive)
+        response = resource.response(headers.get("if-none-match"), accepts_gzip(headers.get("accept-encoding", "")),
+                                     keep_alive, head_only=method == "HEAD")
+        if response.startswith(b"HTTP/1.1 304"):
+            self.stats["not_modified"] += 1
+        return response
+
+    async def _handle_connection(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    raw_head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    return
+                lines = raw_head.decode("latin-1").split("\r\n")
+                request_line = lines[0].split(" ")
+                if len(request_line) != 3:
+                    writer.write(error_response(400, False))
+                    await writer.drain()
+                    return
+                method, path, version = request_line
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                content_length = int(headers.get("content-length", 0) or 0)
+                if content_length:
+                    await reader.readexactly(content_length)  # Bodies are ignored, but must be consumed
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+                self.stats["requests"] += 1
+                writer.write(await self._respond(method, path, headers, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            return  # Truncated body, reset or malformed Content-Length: drop the connection
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
@@ -0,0 +1,409 @@
+import json
+import mmap
+import struct
+from array import array
+from bisect import bisect_right
+
+from epg import ChannelSchedule, as_schedule
+from hls import QuotedString
+from xmltv_time import epoch_to_xmltv, parse_utc_offset, to_epoch
+
+
+MAGIC = b"RKSN"
+VERSION = 1
+NONE = 0xFFFFFFFF  # String/URL index of a missing value
+ALIGNMENT = 8
+
+# File layout (little-endian):
+#   header   magic, version, flags, section count, channel count, programme count
+#   index    one (name, offset, length) entry per section
+#   sections 8-byte aligned, see SECTIONS
+# Every string (names, groups, hosts, paths, query keys and values, titles...)
+# is stored once in the string table and referred to by index. URLs are split
+# into scheme+host, path and query parameters so the ~60 ad parameters shared
+# by every stream URL cost a few bytes per channel. Programmes are columns,
+# grouped by channel and sorted by start time, so "programme at T" is a
+# binary search over one slice of the start column.
+HEADER = struct.Struct("<4sHHIII")
+SECTION = struct.Struct("<4sQQ")
+# Record widths, in 32-bit words
+CHANNEL_WORDS = 11  # tvg_id, name, logo, group, stream, backup, extra, qualities (first, count), programmes (first, count)
+URL_WORDS = 4  # prefix, path, first parameter, parameter count (NONE: no "?")
+QUALITY_WORDS = 3  # url, first attribute, attribute count
+ATTRIBUTE_WORDS = 3  # name, value, kind
+
+SECTIONS = (
+    (b"STRO", "I"),  # string offsets into STRB (count + 1)
+    (b"STRB", "B"),  # UTF-8 string data
+    (b"CHAN", "I"),  # CHANNEL records, in playlist order
+    (b"CIDX", "I"),  # channel numbers sorted by UTF-8 tvg_id
+    (b"URLS", "I"),  # URL records
+    (b"QPRM", "I"),  # query parameters: (key, value) string pairs, value NONE for a bare key
+    (b"QUAL", "I"),  # QUALITY records
+    (b"ATTR", "I"),  # ATTRIBUTE records
+    (b"PSTA", "q"),  # programme start, epoch seconds
+    (b"PSTO", "q"),  # programme stop, epoch seconds
+    (b"PSTZ", "h"),  # UTC offset of the start time as published, in minutes
+    (b"PETZ", "h"),  # UTC offset of the stop time as published, in minutes
+    (b"PTIT", "I"),  # title
+    (b"PDES", "I"),  # description
+    (b"PICO", "I"),  # icon
+)
+
+KIND_STRING, KIND_QUOTED, KIND_INT, KIND_FLOAT, KIND_JSON = range(5)
+CHANNEL_FIELDS = ("name", "tvg_id", "logo_url", "group_title", "stream_url", "qualities", "backup_master_url")
+
+
+# methods
+def split_url(url):
+    """Split a URL into (scheme://host, path, query pairs or None), losslessly."""
+    base, has_query, query = url.partition("?")
+    scheme_end = base.find("://")
+    path_start = base.find("/", scheme_end + 3) if scheme_end != -1 else -1
+    prefix, path = (base, "") if path_start == -1 else (base[:path_start], base[path_start:])
+    if not has_query:
+        return prefix, path, None
+    pairs = []
+    for pair in query.split("&"):
+        key, has_value, value = pair.partition("=")
+        pairs.append((key, value if has_value else None))
+    return prefix, path, pairs
+
+
+def join_url(prefix, path, pairs):
+    if pairs is None:
+        return prefix + path
+    return prefix + path + "?" + "&".join(key if value is None else f"{key}={value}" for key, value in pairs)
+
+
+def _attribute_kind(value):
+    if isinstance(value, bool) or value is None:
+        return KIND_JSON, json.dumps(value)
+    if isinstance(value, int):
+        return KIND_INT, str(value)
+    if isinstance(value, float):
+        return KIND_FLOAT, repr(value)
+    if isinstance(value, QuotedString):
+        return KIND_QUOTED, value
+    if isinstance(value, str):
+        return KIND_STRING, value
+    return KIND_JSON, json.dumps(value, ensure_ascii=False)
+
+
+def _attribute_value(kind, text):
+    if kind == KIND_INT:
+        return int(text)
+    if kind == KIND_FLOAT:
+        return float(text)
+    if kind == KIND_QUOTED:
+        return QuotedString(text)
+    if kind == KIND_JSON:
+        return json.loads(text)
+    return text
+
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.blob = bytearray()
+        self.offsets = array("I", [0])
+
+    def add(self, value):
+        if value is None:
+            return NONE
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.ids)
+            self.blob += value.encode("utf-8")
+            self.offsets.append(len(self.blob))
+        return string_id
+
+
+class _SnapshotBuilder:
+    def __init__(self):
+        self.strings = _StringTable()
+        self.url_ids = {}
+        self.offset_minutes = {}  # " +0100" -> 60; a guide uses one or two offsets
+        self.columns = {name: array(typecode) for name, typecode in SECTIONS if name not in (b"STRO", b"STRB")}
+
+    def add_url(self, url):
+        if url is None:
+            return NONE
+        url_id = self.url_ids.get(url)
+        if url_id is None:
+            url_id = self.url_ids[url] = len(self.url_ids)
+            prefix, path, pairs = split_url(url)
+            parameters = self.columns[b"QPRM"]
+            first = len(parameters) // 2
+            for key, value in pairs or ():
+                parameters.append(self.strings.add(key))
+                parameters.append(self.strings.add(value))
+            self.columns[b"URLS"].extend((self.strings.add(prefix), self.strings.add(path), first,
+                                          NONE if pairs is None else len(pairs)))
+        return url_id
+
+    def offset_column(self, value):
+        # Keep the offset the guide was published with, so times read back as they were written
+        suffix = value[14:]
+        minutes = self.offset_minutes.get(suffix)
+        if minutes is None:
+            minutes = self.offset_minutes[suffix] = parse_utc_offset(suffix) // 60
+        return minutes
+
+    def add_channel(self, channel_info, programs):
+        strings = self.strings
+        qualities = self.columns[b"QUAL"]
+        attributes = self.columns[b"ATTR"]
+        first_quality = len(qualities) // QUALITY_WORDS
+        for quality in channel_info.get("qualities") or []:
+            first_attribute = len(attributes) // ATTRIBUTE_WORDS
+            for name, value in quality.get("attributes", {}).items():
+                kind, text = _attribute_kind(value)
+                attributes.extend((strings.add(name), strings.add(text), kind))
+            qualities.extend((self.add_url(quality.get("url")), first_attribute, len(attributes) // ATTRIBUTE_WORDS - first_attribute))
+
+        schedule = as_schedule(programs)  # Sorted by start, which programme_at() bisects
+        first_programme = len(self.columns[b"PSTA"])
+        self.columns[b"PSTA"].extend(schedule.starts)
+        self.columns[b"PSTO"].extend(schedule.stops)
+        for program in schedule:
+            self.columns[b"PSTZ"].append(self.offset_column(program["start_time"]))
+            self.columns[b"PETZ"].append(self.offset_column(program["stop_time"]))
+            self.columns[b"PTIT"].append(strings.add(program.get("title")))
+            self.columns[b"PDES"].append(strings.add(program.get("description")))
+            self.columns[b"PICO"].append(strings.add(program.get("icon")))
+
+        extra = {key: value for key, value in channel_info.items() if key not in CHANNEL_FIELDS}
+        self.columns[b"CHAN"].extend((
+            strings.add(channel_info["tvg_id"]), strings.add(channel_info["name"]),
+            self.add_url(channel_info.get("logo_url")), strings.add(channel_info.get("group_title")),
+            self.add_url(channel_info.get("stream_url")), self.add_url(channel_info.get("backup_master_url")),
+            strings.add(json.dumps(extra, ensure_ascii=False, separators=(",", ":")) if extra else None),
+            first_quality, len(qualities) // QUALITY_WORDS - first_quality,
+            first_programme, len(self.columns[b"PSTA"]) - first_programme,
+        ))
+
+    def to_bytes(self):
+        channels = self.columns[b"CHAN"]
+        channel_count = len(channels) // CHANNEL_WORDS
+        tvg_ids = [self.string_bytes(channels[number * CHANNEL_WORDS]) for number in range(channel_count)]
+        self.columns[b"CIDX"] = array("I", sorted(range(channel_count), key=tvg_ids.__getitem__))
+
+        payloads = {b"STRO": self.strings.offsets.tobytes(), b"STRB": bytes(self.strings.blob)}
+        payloads.update((name, column.tobytes()) for name, column in self.columns.items())
+        offset = _aligned(HEADER.size + SECTION.size * len(SECTIONS))
+        index = []
+        for name, _ in SECTIONS:
+            index.append(SECTION.pack(name, offset, len(payloads[name])))
+            offset = _aligned(offset + len(payloads[name]))
+
+        out = bytearray(HEADER.pack(MAGIC, VERSION, 0, len(SECTIONS), channel_count, len(self.columns[b"PSTA"])))
+        out += b"".join(index)
+        for name, _ in SECTIONS:
+            out += bytes(_aligned(len(out)) - len(out))
+            out += payloads[name]
+        return bytes(out)
+
+    def string_bytes(self, string_id):
+        offsets = self.strings.offsets
+        return bytes(self.strings.blob[offsets[string_id]:offsets[string_id + 1]])
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def build_snapshot(channels_data, epg_data_map):
+    """Serialize the channel list and its programmes into snapshot bytes.
+
+    Programmes are taken for the channels in `channels_data` only, in the
+    order the EPG writers use; the output is deterministic, so unchanged
+    models produce identical files.
+    """
+    builder = _SnapshotBuilder()
+    for channel_info in channels_data:
+        builder.add_channel(channel_info, epg_data_map.get(channel_info["tvg_id"], []))
+    return builder.to_bytes()
+
+
+class Snapshot:
+    """Read-only view of a snapshot file, memory-mapped.
+
+    Opening only reads the header and section index; the string table and
+    columns are sliced straight out of the mapping, so looking up a channel
+    or the programme on air at some time touches a few pages of the file
+    instead of decoding all of it. Use as a context manager, or call close().
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._views = []
+            self._open()
+        except BaseException:
+            self.close()
+            raise
+
+    def _open(self):
+        if len(self._mmap) < HEADER.size:
+            raise ValueError("Not a channel snapshot: file too short")
+        magic, self.version, _, section_count, self.channel_count, self.programme_count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"Not a channel snapshot: bad magic {magic!r}")
+        if self.version != VERSION:
+            raise ValueError(f"Unsupported snapshot version {self.version} (expected {VERSION})")
+        typecodes = dict(SECTIONS)
+        buffer = memoryview(self._mmap)
+        self._views.append(buffer)
+        sections = {}
+        for number in range(section_count):
+            name, offset, length = SECTION.unpack_from(self._mmap, HEADER.size + number * SECTION.size)
+            if name in typecodes:  # Unknown sections are for newer readers
+                view = buffer[offset:offset + length].cast(typecodes[name])
+                self._views.append(view)
+                sections[name] = view
+        missing = [name.decode() for name, _ in SECTIONS if name not in sections]
+        if missing:
+            raise ValueError(f"Snapshot is missing sections: {', '.join(missing)}")
+        self._sections = sections
+        self._string_offsets = sections[b"STRO"]
+        self._string_data = sections[b"STRB"]
+
+    def close(self):
+        for view in reversed(getattr(self, "_views", [])):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.channel_count
+
+    def _string_bytes(self, string_id):
+        return self._string_data[self._string_offsets[string_id]:self._string_offsets[string_id + 1]]
+
+    def string(self, string_id):
+        if string_id == NONE:
+            return None
+        return str(self._string_bytes(string_id), "utf-8")
+
+    def url(self, url_id):
+        if url_id == NONE:
+            return None
+        prefix, path, first, count = self._sections[b"URLS"][url_id * URL_WORDS:(url_id + 1) * URL_WORDS]
+        pairs = None
+        if count != NONE:
+            parameters = self._sections[b"QPRM"][first * 2:(first + count) * 2].tolist()
+            pairs = [(self.string(key), self.string(value)) for key, value in zip(parameters[::2], parameters[1::2])]
+        return join_url(self.string(prefix), self.string(path), pairs)
+
+    def _record(self, number):
+        return self._sections[b"CHAN"][number * CHANNEL_WORDS:(number + 1) * CHANNEL_WORDS]
+
+    def find(self, tvg_id):
+        """Channel number of `tvg_id` (binary search over the sorted index), or None."""
+        wanted = tvg_id.encode("utf-8")
+        channel_index = self._sections[b"CIDX"]
+        low, high = 0, len(channel_index)
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(self._string_bytes(self._record(channel_index[middle])[0])) < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(channel_index):
+            number = channel_index[low]
+            if bytes(self._string_bytes(self._record(number)[0])) == wanted:
+                return number
+        return None
+
+    def tvg_ids(self):
+        """All tvg_ids, in playlist order."""
+        return [self.string(self._record(number)[0]) for number in range(self.channel_count)]
+
+    def channel_at(self, number):
+        """Channel number `number` as the dict the scraper works with."""
+        tvg_id, name, logo, group, stream, backup, extra, first_quality, quality_count, _, _ = self._record(number)
+        qualities = []
+        quality_records = self._sections[b"QUAL"]
+        attribute_records = self._sections[b"ATTR"]
+        for quality in range(first_quality, first_quality + quality_count):
+            url, first_attribute, attribute_count = quality_records[quality * QUALITY_WORDS:(quality + 1) * QUALITY_WORDS]
+            attributes = {}
+            for attribute in range(first_attribute, first_attribute + attribute_count):
+                attribute_name, value, kind = attribute_records[attribute * ATTRIBUTE_WORDS:(attribute + 1) * ATTRIBUTE_WORDS]
+                attributes[self.string(attribute_name)] = _attribute_value(kind, self.string(value))
+            qualities.append({"url": self.url(url), "attributes": attributes})
+        channel_info = {
+            "name": self.string(name),
+            "tvg_id": self.string(tvg_id),
+            "logo_url": self.url(logo),
+            "group_title": self.string(group),
+            "stream_url": self.url(stream),
+            "qualities": qualities,
+        }
+        if backup != NONE:
+            channel_info["backup_master_url"] = self.url(backup)
+        if extra != NONE:
+            channel_info.update(json.loads(self.string(extra)))
+        return channel_info
+
+    def channel(self, tvg_id):
+        number = self.find(tvg_id)
+        return None if number is None else self.channel_at(number)
+
+    def channels(self):
+        for number in range(self.channel_count):
+            yield self.channel_at(number)
+
+    def _programme(self, index):
+        columns = self._sections
+        start, stop = columns[b"PSTA"][index], columns[b"PSTO"][index]
+        return {
+            "start_time": epoch_to_xmltv(start, columns[b"PSTZ"][index] * 60),
+            "stop_time": epoch_to_xmltv(stop, columns[b"PETZ"][index] * 60),
+            "title": self.string(columns[b"PTIT"][index]),
+            "description": self.string(columns[b"PDES"][index]),
+            "icon": self.string(columns[b"PICO"][index]),
+        }
+
+    def _programme_range(self, tvg_id):
+        number = self.find(tvg_id)
+        if number is None:
+            return 0, 0
+        record = self._record(number)
+        return record[9], record[9] + record[10]
+
+    def programmes(self, tvg_id, start=None, stop=None):
+        """Programmes of a channel, optionally only those overlapping [start, stop)."""
+        first, end = self._programme_range(tvg_id)
+        starts, stops = self._sections[b"PSTA"], self._sections[b"PSTO"]
+        if stop is not None:
+            end = bisect_right(starts, to_epoch(stop) - 1, first, end)
+        start = None if start is None else to_epoch(start)
+        return [self._programme(index) for index in range(first, end) if start is None or stops[index] > start]
+
+    def programme_at(self, tvg_id, moment):
+        """The programme on air at `moment` (datetime or epoch seconds), or None."""
+        first, end = self._programme_range(tvg_id)
+        moment = to_epoch(moment)
+        index = bisect_right(self._sections[b"PSTA"], moment, first, end) - 1
+        if index >= first and self._sections[b"PSTO"][index] > moment:
+            return self._programme(index)
+        return None
+
+    def epg_data_map(self):
+        """{tvg_id: ChannelSchedule} for every channel, like the EPG stage builds."""
+        starts, stops = self._sections[b"PSTA"], self._sections[b"PSTO"]
+        epg_data_map = {}
+        for tvg_id in self.tvg_ids():
+            first, end = self._programme_range(tvg_id)
+            epg_data_map[tvg_id] = ChannelSchedule.from_timed([(starts[index], stops[index], self._programme(index))
+                                                               for index in range(first, end)])
+        return epg_data_map
@@ -0,0 +1,64 @@
+import calendar
+from datetime import datetime, timezone
+
+
+# "YYYYmmddHH +HHMM" -> epoch seconds at the start of that hour. A guide only
+# spans a few days and offsets, so after the first programmes of each hour a
+# timestamp costs one dict lookup and two small int() calls.
+_HOUR_CACHE = {}
+
+
+# methods
+def parse_utc_offset(offset):
+    """Return the seconds east of UTC for an XMLTV offset such as "+0200" ("" means UTC)."""
+    offset = offset.strip()
+    if not offset:
+        return 0
+    sign = -1 if offset[0] == '-' else 1
+    digits = offset[1:] if offset[0] in '+-' else offset
+    if len(digits) != 4 or not digits.isdigit():
+        raise ValueError(f"Invalid XMLTV UTC offset: {offset!r}")
+    return sign * (int(digits[:2]) * 3600 + int(digits[2:]) * 60)
+
+
+def _hour_epoch(value, key):
+    moment = datetime(int(value[:4]), int(value[4:6]), int(value[6:8]), int(value[8:10]))  # Rejects impossible dates
+    hour_epoch = calendar.timegm(moment.timetuple()) - parse_utc_offset(value[14:])
+    if len(_HOUR_CACHE) > 100_000:
+        _HOUR_CACHE.clear()  # Only reachable with garbage input; keep memory bounded
+    _HOUR_CACHE[key] = hour_epoch
+    return hour_epoch
+
+
+def xmltv_to_epoch(value):
+    """Convert an XMLTV timestamp ("20250101203000 +0100") to integer epoch seconds.
+
+    Raises ValueError (or TypeError for non-strings) like datetime.strptime.
+    """
+    if len(value) < 14 or not value[:14].isdigit():
+        raise ValueError(f"Invalid XMLTV time: {value!r}")  # Before the cache: a short value can share a valid one's key
+    key = value[:10] + value[14:]
+    hour_epoch = _HOUR_CACHE.get(key)
+    if hour_epoch is None:
+        hour_epoch = _hour_epoch(value, key)
+    minutes, seconds = divmod(int(value[10:14]), 100)
+    if minutes > 59 or seconds > 59:
+        raise ValueError(f"Invalid XMLTV time: {value!r}")
+    return hour_epoch + minutes * 60 + seconds
+
+
+def epoch_to_xmltv(epoch, utc_offset=0):
+    """Format epoch seconds as an XMLTV timestamp, in UTC or at `utc_offset` seconds east of it."""
+    if not utc_offset:
+        return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y%m%d%H%M%S +0000")
+    sign = '-' if utc_offset < 0 else '+'
+    hours, minutes = divmod(abs(utc_offset) // 60, 60)
+    local = datetime.fromtimestamp(epoch + utc_offset, timezone.utc)
+    return f"{local:%Y%m%d%H%M%S} {sign}{hours:02d}{minutes:02d}"
+
+
+def to_epoch(moment):
+    """Accept a datetime or epoch seconds and return integer epoch seconds."""
+    if isinstance(moment, datetime):
+        return int(moment.timestamp())
+    return int(moment)